@@ -4,10 +4,23 @@ from langchain_core.messages import HumanMessage, AIMessage
 from config import AppConfig
 from logger import setup_logger
 from utils import initialize_session_state, process_appointments, add_manual_appointment, cancel_appointment
+from utils import get_last_booked_appointment, clear_all_appointments
+from appointment_store import get_appointment_store
+from schedule_model import get_doctor_schedules
+from tools import validate_appointment_time, book_series, skip_series_occurrence, end_series, clear_doctor_days
+from bulk_io import import_appointments, export_appointments
+from waitlist import get_waitlist
+from recurrence import build_rule, get_series_book
 from voice_agent import VoiceAgent
 from audio_interface import audio_recorder, audio_player
-from email_service import email_service
+from email_outbox import get_email_outbox
+from llm_cache import get_llm_cache
+from llm_singleflight import get_llm_singleflight
+from conversation_context import create_conversation_context
+from notification_coalescer import BOOKING, notify
 import datetime
+import io
+import itertools
 import json
 import re
 
@@ -23,6 +36,8 @@ def main():
   
     if 'multi_agent_conversation' not in st.session_state:
         st.session_state.multi_agent_conversation = []
+    if 'conversation_context' not in st.session_state:
+        st.session_state.conversation_context = create_conversation_context()
 
     st.set_page_config(
         page_title="Smart Medical Appointment System", 
@@ -100,12 +115,13 @@ def main():
                 email_pattern = r"^[\w\.-]+@[\w\.-]+\.\w+$"
                 if re.match(email_pattern, user_input.strip()):
                     
-                    if st.session_state.appointments:
-                        st.session_state.appointments[-1]['email'] = user_input.strip()
+                    last_appointment = get_last_booked_appointment()
+                    if last_appointment:
+                        last_appointment = get_appointment_store().update(last_appointment['id'], email=user_input.strip())
                        
-                        email_service.send_booking_confirmation(st.session_state.appointments[-1])
+                        notify(BOOKING, last_appointment)
                         st.session_state.awaiting_email_for_appointment = False
-                        st.success("Confirmation email sent!")
+                        st.success("Confirmation email queued!")
                         st.rerun()
                     else:
                         st.session_state.awaiting_email_for_appointment = False
@@ -115,10 +131,11 @@ def main():
             else:
                 process_user_input(user_input)
                 
+                last_appointment = get_last_booked_appointment()
                 if (
-                    st.session_state.appointments
-                    and not st.session_state.appointments[-1].get('email')
-                    and st.session_state.appointments[-1].get('status', '').lower() == 'confirmed'
+                    last_appointment
+                    and not last_appointment.get('email')
+                    and last_appointment.get('status', '').lower() == 'confirmed'
                     and not st.session_state.get('awaiting_email_for_appointment', False)
                 ):
                     st.session_state.awaiting_email_for_appointment = True
@@ -126,10 +143,11 @@ def main():
                 st.rerun()
         
        
+        last_appointment = get_last_booked_appointment()
         if (
-            st.session_state.appointments
-            and not st.session_state.appointments[-1].get('email')
-            and st.session_state.appointments[-1].get('status', '').lower() == 'confirmed'
+            last_appointment
+            and not last_appointment.get('email')
+            and last_appointment.get('status', '').lower() == 'confirmed'
             and not st.session_state.get('email_sent_for_last_appointment', False)
         ):
             st.markdown('---')
@@ -139,10 +157,10 @@ def main():
                 import re
                 email_pattern = r"^[\w\.-]+@[\w\.-]+\.\w+$"
                 if re.match(email_pattern, email_input.strip()):
-                    st.session_state.appointments[-1]['email'] = email_input.strip()
-                    email_service.send_booking_confirmation(st.session_state.appointments[-1])
+                    last_appointment = get_appointment_store().update(last_appointment['id'], email=email_input.strip())
+                    notify(BOOKING, last_appointment)
                     st.session_state.email_sent_for_last_appointment = True
-                    st.success('Confirmation email sent!')
+                    st.success('Confirmation email queued!')
                     st.rerun()
                 else:
                     st.warning('Please enter a valid email address.')
@@ -175,32 +193,50 @@ def main():
     with col2:
         st.subheader("📋 Current Appointments")
         
-        if st.session_state.appointments:
+        appointments = get_appointment_store().list_active()
+        if appointments:
             
-            sorted_appointments = sorted(st.session_state.appointments, key=lambda x: x["time"])
-            
-            for i, appointment in enumerate(sorted_appointments):
+            for appointment in appointments:
                 with st.expander(f"📅 {appointment['name']} - {appointment['time'].strftime('%m/%d %I:%M %p')}"):
                     st.write(f"**Patient:** {appointment['name']}")
                     st.write(f"**Doctor:** {appointment.get('doctor_name', 'Not assigned')}")
-                    st.write(f"**Specialty:** {appointment.get('doctor_specialty', 'General')}")
+                    st.write(f"**Specialty:** {appointment.get('doctor_specialty') or 'General'}")
                     st.write(f"**Date & Time:** {appointment['time'].strftime('%A, %B %d, %Y at %I:%M %p')}")
                     st.write(f"**Type:** {appointment['type']}")
-                    st.write(f"**Location:** {appointment.get('location', 'Main Office')}")
+                    st.write(f"**Location:** {appointment.get('location') or 'Main Office'}")
                     st.write(f"**Status:** {appointment.get('status', 'Confirmed').title()}")
                     
                     if appointment.get('email'):
                         st.write(f"**Email:** {appointment['email']}")
                     
                     
-                    if st.button(f"Cancel This Appointment", key=f"cancel_{i}"):
-                        if cancel_appointment(i):
+                    if st.button(f"Cancel This Appointment", key=f"cancel_{appointment['id']}"):
+                        if cancel_appointment(appointment['id']):
                             st.success("Appointment cancelled!")
                             st.rerun()
         else:
             st.info("No appointments scheduled yet.")
             st.markdown("Use the chat to book your first appointment! 😊")
 
+        series_list = get_series_book().list()
+        if series_list:
+            st.markdown("**🔁 Recurring Series:**")
+            doctor_schedules = get_doctor_schedules()
+            for series in series_list:
+                schedule = doctor_schedules.get(series.doctor_name)
+                now = schedule.now() if schedule else datetime.datetime.now()
+                upcoming = list(itertools.islice(series.occurrences(now, now + datetime.timedelta(days=366)), 3))
+                with st.expander(f"🔁 {series.name} with {series.doctor_name}"):
+                    st.write(f"**Rule:** {series.rule}")
+                    for occurrence in upcoming:
+                        st.write(f"📅 {occurrence.strftime('%A, %B %d, %Y at %I:%M %p')}")
+                    if upcoming and st.button("Skip Next Occurrence", key=f"skip_series_{series.id}"):
+                        skip_series_occurrence(series.id, series.original(upcoming[0]))
+                        st.rerun()
+                    if st.button("End Series", key=f"end_series_{series.id}"):
+                        end_series(series.id)
+                        st.rerun()
+
     with col3:
         st.subheader("⚙️ System Controls")
         st.markdown("**🤖 Agent Status:**")
@@ -214,59 +250,149 @@ def main():
         with st.form("quick_appointment_form"):
             name = st.text_input("Name*", placeholder="Patient Name")
             email = st.text_input("Email*", placeholder="patient@email.com")
-            doctor = st.selectbox("Doctor", ["Dr. Smith", "Dr. Johnson", "Dr. Williams", "Dr. Brown"])
+            doctor_schedules = get_doctor_schedules()
+            doctor = st.selectbox("Doctor", list(doctor_schedules))
             apt_type = st.selectbox("Type", ["Consultation", "Follow-up", "Check-up", "Emergency"])
             date = st.date_input("Date", min_value=datetime.date.today())
             time = st.time_input("Time", value=datetime.time(9, 0))
             
             
-            doctor_schedules = {
-                "Dr. Smith": {"location": "Main Building, Room 101"},
-                "Dr. Johnson": {"location": "Cardiac Wing, Room 205"},
-                "Dr. Williams": {"location": "Dermatology Center, Room 301"},
-                "Dr. Brown": {"location": "Sports Medicine Wing, Room 150"}
-            }
-            
             if st.form_submit_button("📅 Book Appointment", type="primary"):
                 if name and email:
-                    doctor_info = doctor_schedules.get(doctor, {})
-                    add_manual_appointment(
+                    doctor_info = doctor_schedules[doctor]
+                    validation_error = validate_appointment_time(datetime.datetime.combine(date, time), doctor_info)
+                    if validation_error:
+                        st.error(validation_error)
+                        st.stop()
+                    booked = add_manual_appointment(
                         person_name=name,
                         appointment_type=apt_type,
                         appointment_date=date,
                         appointment_time=time,
                         email=email,
                         doctor_name=doctor,
-                        location=doctor_info.get('location', 'Main Office')
+                        location=doctor_info.location
                     )
-                   
-                    appointment_data = {
-                        "name": name,
-                        "email": email,
-                        "doctor_name": doctor,
-                        "type": apt_type,
-                        "time": datetime.datetime.combine(date, time),
-                        "location": doctor_info.get('location', 'Main Office')
-                    }
-                    if email_service.send_appointment_confirmation(appointment_data):
-                        st.success(f"✅ Appointment booked for {name}! Confirmation email sent.")
-                    else:
-                        st.warning(f"✅ Appointment booked for {name}, but email confirmation failed.")
+                    if not booked:
+                        st.error(f"{doctor} is already booked at that time. Please choose another slot.")
+                        st.stop()
+                    st.success(f"✅ Appointment booked for {name}! Confirmation email queued.")
                     st.rerun()
                 else:
                     st.error("Patient name and email are required!")
         
+        with st.expander("🔁 Recurring Appointment"):
+            with st.form("series_form"):
+                series_name = st.text_input("Name*", placeholder="Patient Name", key="series_name")
+                series_email = st.text_input("Email", placeholder="patient@email.com", key="series_email")
+                doctor_schedules = get_doctor_schedules()
+                series_doctor = st.selectbox("Doctor", list(doctor_schedules), key="series_doctor")
+                series_type = st.selectbox("Type", ["Follow-up", "Physiotherapy", "Check-up", "Consultation"])
+                series_date = st.date_input("First Date", min_value=datetime.date.today(), key="series_date")
+                series_time = st.time_input("Time", value=datetime.time(9, 0), key="series_time")
+                frequency = st.selectbox("Repeats", ["weekly", "biweekly"])
+                count = st.number_input("Occurrences (0 = until ended)", min_value=0, max_value=104, value=6)
+                if st.form_submit_button("Book Series"):
+                    if series_name:
+                        try:
+                            book_series(
+                                series_name,
+                                series_email or None,
+                                series_doctor,
+                                datetime.datetime.combine(series_date, series_time),
+                                build_rule(frequency, count=int(count) or None),
+                                series_type
+                            )
+                            st.success(f"✅ Recurring {frequency} appointments booked for {series_name}!")
+                        except ValueError as e:
+                            st.error(str(e))
+                    else:
+                        st.error("Patient name is required!")
+
+        with st.expander("⏳ Join Waitlist"):
+            with st.form("waitlist_form"):
+                waitlist_name = st.text_input("Name*", placeholder="Patient Name", key="waitlist_name")
+                waitlist_email = st.text_input("Email*", placeholder="patient@email.com", key="waitlist_email")
+                doctor_schedules = get_doctor_schedules()
+                specialties = sorted({schedule.specialty for schedule in doctor_schedules.values()})
+                choice = st.selectbox("Doctor or Specialty", ["Any doctor"] + list(doctor_schedules) + [f"Any {specialty}" for specialty in specialties])
+                window = st.date_input("Dates", value=(datetime.date.today(), datetime.date.today() + datetime.timedelta(days=7)), min_value=datetime.date.today())
+                urgency = st.selectbox("Urgency", ["standard", "urgent", "emergency", "routine", "flexible"])
+                if st.form_submit_button("Join Waitlist"):
+                    if waitlist_name and waitlist_email and len(window) == 2:
+                        get_waitlist().add(
+                            waitlist_name,
+                            waitlist_email,
+                            datetime.datetime.combine(window[0], datetime.time()),
+                            datetime.datetime.combine(window[1] + datetime.timedelta(days=1), datetime.time()),
+                            doctor_name=choice if choice in doctor_schedules else None,
+                            specialty=choice[4:] if choice.startswith("Any ") and choice != "Any doctor" else None,
+                            priority=multi_agent_orchestrator.priority_levels[urgency]
+                        )
+                        st.success(f"{waitlist_name} will be emailed as soon as a matching slot opens up.")
+                    else:
+                        st.error("Name, email and a date range are required!")
+
+        with st.expander("🩺 Doctor Unavailable"):
+            with st.form("doctor_out_form"):
+                doctor_schedules = get_doctor_schedules()
+                out_doctor = st.selectbox("Doctor", list(doctor_schedules), key="out_doctor")
+                out_days = st.date_input("Dates", value=(datetime.date.today(), datetime.date.today()), min_value=datetime.date.today(), key="out_days")
+                auto_reschedule = st.checkbox("Move patients to the doctor's next free slots instead of cancelling")
+                if st.form_submit_button("Clear Appointments"):
+                    if len(out_days) == 2:
+                        try:
+                            result = clear_doctor_days(out_doctor, out_days[0], out_days[1], reschedule=auto_reschedule)
+                            st.success(f"{len(result['cancelled'])} cancelled, {len(result['moved'])} rescheduled. Patients are being emailed.")
+                        except Exception as e:
+                            logger.error(f"Clearing {out_doctor}'s appointments failed: {str(e)}")
+                            st.error(f"Could not clear appointments: {e}")
+                    else:
+                        st.error("Please choose a start and end date!")
+
+        with st.expander("📥 Bulk Import / Export"):
+            upload = st.file_uploader("Appointments file", type=["csv", "jsonl", "parquet"])
+            send_emails = st.checkbox("Send confirmation emails")
+            allow_past = st.checkbox("Accept past appointments")
+            if upload is not None and st.button("Import Appointments"):
+                try:
+                    report = import_appointments(upload, send_emails=send_emails, allow_past=allow_past)
+                    st.success(report.summary())
+                    if report.errors:
+                        st.dataframe([{"line": error.line, "error": error.message} for error in report.errors])
+                except Exception as e:
+                    logger.error(f"Bulk import failed: {str(e)}")
+                    st.error(f"Import failed: {e}")
+
+            if st.button("Prepare CSV Export"):
+                export_buffer = io.StringIO()
+                count = export_appointments(export_buffer, fmt="csv")
+                st.download_button(f"Download {count} Appointments", export_buffer.getvalue(), file_name="appointments.csv", mime="text/csv")
     
         with st.expander("🔧 Debug Information"):
             st.write("**Session State:**")
             st.json({
-                "appointments_count": len(st.session_state.appointments),
+                "appointments_count": len(appointments),
                 "conversation_length": len(st.session_state.multi_agent_conversation),
+                "conversation_context": st.session_state.conversation_context.stats(),
                 "current_time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             })
-            
-            if st.button("🗑️ Clear All Data"):
-                st.session_state.appointments = []
+            outbox = get_email_outbox()
+            st.write("**Email Outbox:**")
+            st.json(outbox.stats())
+            dead_letters = outbox.dead_letters()
+            if dead_letters and st.button(f"📨 Retry {len(dead_letters)} Failed Emails"):
+                outbox.retry_dead_letters()
+                st.rerun()
+            st.write("**LLM Response Cache:**")
+            st.json(get_llm_cache().stats())
+            st.write("**Shared LLM Calls:**")
+            st.json(get_llm_singleflight().stats())
+
+            # Wipes the shared store for every session and replica, so it is a development tool only
+            if config.debug and st.button("🗑️ Clear All Data"):
+                clear_all_appointments()
+                st.session_state.pop('last_appointment_id', None)
                 st.session_state.multi_agent_conversation = []
                 st.success("All data cleared!")
                 st.rerun()
@@ -278,10 +404,14 @@ def process_user_input(user_input: str):
         
     
     st.session_state.multi_agent_conversation.append(HumanMessage(content=user_input))
+    st.chat_message("user").write(user_input)
+    context = st.session_state.conversation_context
+    context.sync(st.session_state.multi_agent_conversation)
     
-    
-    response = multi_agent_orchestrator.process_user_message(user_input)
-    
+    # Show the answer as it is generated; the rerun that follows redraws it from the history
+    response = st.chat_message("assistant").write_stream(multi_agent_orchestrator.process_user_message_stream(user_input, context))
+    if not isinstance(response, str):
+        response = "".join(map(str, response))
     
     st.session_state.multi_agent_conversation.append(AIMessage(content=response))
 
@@ -0,0 +1,487 @@
+import datetime
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from logger import setup_logger
+from config import AppConfig
+
+logger = setup_logger(__name__)
+
+APPOINTMENT_FIELDS = ["name", "type", "time", "email", "doctor_name", "doctor_specialty", "location", "status", "reminder_sent"]
+CANCELLED = "cancelled"
+
+# Asked inside a write transaction whether something kept outside the appointments table,
+# such as a recurring series, holds a (doctor_name, time) slot
+SlotHold = Callable[[str, datetime.datetime], bool]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    type TEXT,
+    time TEXT NOT NULL,
+    email TEXT,
+    doctor_name TEXT,
+    doctor_specialty TEXT,
+    location TEXT,
+    status TEXT NOT NULL DEFAULT 'Confirmed',
+    reminder_sent INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_appointments_doctor_time ON appointments(doctor_name, time);
+CREATE INDEX IF NOT EXISTS idx_appointments_email ON appointments(email);
+CREATE INDEX IF NOT EXISTS idx_appointments_status ON appointments(status);
+CREATE TABLE IF NOT EXISTS appointments_meta (version INTEGER NOT NULL);
+INSERT INTO appointments_meta (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM appointments_meta);
+"""
+
+
+class AppointmentRepository:
+    """Storage interface shared by every appointment backend.
+
+    Appointments are plain dicts with the keys in ``APPOINTMENT_FIELDS`` plus an
+    ``id`` assigned by the backend. Cancelled appointments are kept with
+    ``status = "cancelled"`` and excluded from the ``active`` queries.
+    """
+
+    def add(self, appointment: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def add_many(self, appointments: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insert a batch of appointments in a single transaction"""
+        return [self.add(appointment) for appointment in appointments]
+
+    def add_if_free(self, appointments: Iterable[Dict[str, Any]], slot_minutes: int,
+                    held: Optional[SlotHold] = None) -> List[Optional[Dict[str, Any]]]:
+        """Insert each appointment whose doctor has no active booking in the same slot.
+
+        Checks and inserts share one write transaction, so two writers, even in
+        different processes, can never both claim a slot. A slot for which
+        ``held`` returns True counts as taken too, and is asked inside the same
+        transaction. Returns the stored appointment, or None for a conflict,
+        per input.
+        """
+        raise NotImplementedError
+
+    def move_if_free(self, appointment_id: int, new_time: datetime.datetime, slot_minutes: int,
+                     held: Optional[SlotHold] = None) -> Optional[Dict[str, Any]]:
+        """Move an appointment unless its doctor has another active booking in the new slot, or ``held`` holds it"""
+        raise NotImplementedError
+
+    def cancel_and_move(self, cancel_ids: Iterable[int], moves: Iterable[Tuple[int, datetime.datetime]],
+                        slot_minutes: int, held: Optional[SlotHold] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Cancel some appointments and move others in one write transaction.
+
+        A move whose new slot is taken by then is cancelled instead. Returns
+        the (cancelled, moved) appointments; ones already cancelled are skipped.
+        """
+        raise NotImplementedError
+
+    def get(self, appointment_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(self, appointment_id: int, **fields) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def cancel(self, appointment_id: int) -> Optional[Dict[str, Any]]:
+        return self.update(appointment_id, status=CANCELLED)
+
+    def find_by_time(self, time: datetime.datetime, patient_name: str = "") -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def find_by_slot(self, doctor_name: str, time: datetime.datetime) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def find_by_email(self, email: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def list_active(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def list_for_doctor(self, doctor_name: str, start: datetime.datetime, end: datetime.datetime) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def iter_appointments(self, include_cancelled: bool = False, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Yield appointments in time order without loading the whole table"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def data_version(self) -> int:
+        """Counter advanced by exactly one by every committed write, from any connection or process"""
+        return 0
+
+
+class InMemoryAppointmentRepository(AppointmentRepository):
+    """Process-local backend, useful for development and demos"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._appointments: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+        self._version = 0
+
+    def add(self, appointment: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._version += 1
+            return self._add(appointment)
+
+    def add_many(self, appointments: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._version += 1
+            return [self._add(appointment) for appointment in appointments]
+
+    def _add(self, appointment: Dict[str, Any]) -> Dict[str, Any]:
+        stored = _normalize(appointment)
+        stored["id"] = self._next_id
+        self._next_id += 1
+        self._appointments[stored["id"]] = stored
+        return dict(stored)
+
+    def _slot_taken(self, doctor_name: str, time: datetime.datetime, slot_minutes: int, exclude_id: Optional[int] = None,
+                    held: Optional[SlotHold] = None) -> bool:
+        start, end = slot_bounds(time, slot_minutes)
+        return any(
+            a["doctor_name"] == doctor_name and start <= a["time"] < end
+            and a["status"] != CANCELLED and a["id"] != exclude_id
+            for a in self._appointments.values()
+        ) or (held is not None and held(doctor_name, time))
+
+    def add_if_free(self, appointments: Iterable[Dict[str, Any]], slot_minutes: int,
+                    held: Optional[SlotHold] = None) -> List[Optional[Dict[str, Any]]]:
+        with self._lock:
+            self._version += 1
+            return [
+                None if self._slot_taken(a.get("doctor_name"), a["time"], slot_minutes, held=held) else self._add(a)
+                for a in appointments
+            ]
+
+    def move_if_free(self, appointment_id: int, new_time: datetime.datetime, slot_minutes: int,
+                     held: Optional[SlotHold] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._version += 1
+            stored = self._appointments.get(appointment_id)
+            if stored is None or self._slot_taken(stored["doctor_name"], new_time, slot_minutes, appointment_id, held):
+                return None
+            return self._update(stored, time=new_time, status="rescheduled")
+
+    def cancel_and_move(self, cancel_ids: Iterable[int], moves: Iterable[Tuple[int, datetime.datetime]],
+                        slot_minutes: int, held: Optional[SlotHold] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        with self._lock:
+            self._version += 1
+            cancelled, moved = [], []
+            for appointment_id, new_time in [(i, None) for i in cancel_ids] + list(moves):
+                stored = self._appointments.get(appointment_id)
+                if stored is None or stored["status"] == CANCELLED:
+                    continue
+                if new_time is not None and not self._slot_taken(stored["doctor_name"], new_time, slot_minutes, appointment_id, held):
+                    moved.append(self._update(stored, time=new_time, status="rescheduled"))
+                else:
+                    cancelled.append(self._update(stored, status=CANCELLED))
+            return cancelled, moved
+
+    def get(self, appointment_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stored = self._appointments.get(appointment_id)
+            return dict(stored) if stored else None
+
+    def update(self, appointment_id: int, **fields) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stored = self._appointments.get(appointment_id)
+            if stored is None:
+                return None
+            self._version += 1
+            return self._update(stored, **fields)
+
+    def _update(self, stored: Dict[str, Any], **fields) -> Dict[str, Any]:
+        stored.update({key: value for key, value in fields.items() if key in APPOINTMENT_FIELDS})
+        return dict(stored)
+
+    def find_by_time(self, time: datetime.datetime, patient_name: str = "") -> Optional[Dict[str, Any]]:
+        for appointment in self.list_active():
+            if appointment["time"] == time and (not patient_name or appointment["name"].lower() == patient_name.lower()):
+                return appointment
+        return None
+
+    def find_by_slot(self, doctor_name: str, time: datetime.datetime) -> Optional[Dict[str, Any]]:
+        for appointment in self.list_active():
+            if appointment["time"] == time and appointment["doctor_name"] == doctor_name:
+                return appointment
+        return None
+
+    def find_by_email(self, email: str) -> List[Dict[str, Any]]:
+        return [appointment for appointment in self.list_active() if appointment.get("email") == email]
+
+    def list_active(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            active = [dict(a) for a in self._appointments.values() if a["status"] != CANCELLED]
+        return sorted(active, key=lambda a: a["time"])
+
+    def list_for_doctor(self, doctor_name: str, start: datetime.datetime, end: datetime.datetime) -> List[Dict[str, Any]]:
+        return [a for a in self.list_active() if a["doctor_name"] == doctor_name and start <= a["time"] < end]
+
+    def iter_appointments(self, include_cancelled: bool = False, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            appointments = [dict(a) for a in self._appointments.values() if include_cancelled or a["status"] != CANCELLED]
+        yield from sorted(appointments, key=lambda a: a["time"])
+
+    def clear(self):
+        with self._lock:
+            self._appointments.clear()
+            self._version += 1
+
+    def data_version(self) -> int:
+        return self._version
+
+
+class SQLiteAppointmentRepository(AppointmentRepository):
+    """Embedded SQLite backend in WAL mode.
+
+    Each thread gets its own connection so Streamlit script threads never share
+    a cursor; WAL lets readers proceed while another session is writing, and the
+    same file can be shared by several app processes on one host. Every write
+    transaction bumps ``appointments_meta.version`` once, which is what
+    ``data_version`` reports, so a writer can tell its own commit from others.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+        self._version_conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._version_lock = threading.Lock()
+        logger.info(f"Appointment store ready at {self.path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _row_to_appointment(self, row: sqlite3.Row) -> Dict[str, Any]:
+        appointment = dict(row)
+        appointment["time"] = datetime.datetime.fromisoformat(appointment["time"])
+        appointment["reminder_sent"] = bool(appointment["reminder_sent"])
+        appointment.pop("created_at", None)
+        return appointment
+
+    def _query(self, sql: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        rows = self._connection().execute(sql, params).fetchall()
+        return [self._row_to_appointment(row) for row in rows]
+
+    def _insert(self, conn: sqlite3.Connection, appointment: Dict[str, Any], created_at: str) -> Dict[str, Any]:
+        stored = _normalize(appointment)
+        values = [_to_column(field, stored[field]) for field in APPOINTMENT_FIELDS]
+        cursor = conn.execute(
+            f"INSERT INTO appointments ({', '.join(APPOINTMENT_FIELDS)}, created_at) "
+            f"VALUES ({', '.join('?' for _ in APPOINTMENT_FIELDS)}, ?)",
+            (*values, created_at)
+        )
+        stored["id"] = cursor.lastrowid
+        return stored
+
+    @staticmethod
+    def _bump(conn: sqlite3.Connection):
+        conn.execute("UPDATE appointments_meta SET version = version + 1")
+
+    def add(self, appointment: Dict[str, Any]) -> Dict[str, Any]:
+        with self._connection() as conn:
+            self._bump(conn)
+            return self._insert(conn, appointment, datetime.datetime.now().isoformat(timespec="seconds"))
+
+    def add_many(self, appointments: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        created_at = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._connection() as conn:
+            self._bump(conn)
+            return [self._insert(conn, appointment, created_at) for appointment in appointments]
+
+    def _slot_taken(self, conn: sqlite3.Connection, doctor_name: str, time: datetime.datetime, slot_minutes: int,
+                    exclude_id: Optional[int] = None, held: Optional[SlotHold] = None) -> bool:
+        start, end = slot_bounds(time, slot_minutes)
+        row = conn.execute(
+            "SELECT 1 FROM appointments WHERE doctor_name = ? AND time >= ? AND time < ? AND status != ? AND id IS NOT ? LIMIT 1",
+            (doctor_name, _to_column("time", start), _to_column("time", end), CANCELLED, exclude_id)
+        ).fetchone()
+        return row is not None or (held is not None and held(doctor_name, time))
+
+    @contextmanager
+    def _write_transaction(self):
+        """BEGIN IMMEDIATE takes the database write lock up front, so a check and the write that follows it are atomic"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._bump(conn)
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def add_if_free(self, appointments: Iterable[Dict[str, Any]], slot_minutes: int,
+                    held: Optional[SlotHold] = None) -> List[Optional[Dict[str, Any]]]:
+        created_at = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._write_transaction() as conn:
+            return [
+                None if self._slot_taken(conn, a.get("doctor_name"), a["time"], slot_minutes, held=held)
+                else self._insert(conn, a, created_at)
+                for a in appointments
+            ]
+
+    def move_if_free(self, appointment_id: int, new_time: datetime.datetime, slot_minutes: int,
+                     held: Optional[SlotHold] = None) -> Optional[Dict[str, Any]]:
+        with self._write_transaction() as conn:
+            row = conn.execute("SELECT doctor_name FROM appointments WHERE id = ?", (appointment_id,)).fetchone()
+            if row is None or self._slot_taken(conn, row["doctor_name"], new_time, slot_minutes, appointment_id, held):
+                return None
+            conn.execute(
+                "UPDATE appointments SET time = ?, status = ? WHERE id = ?",
+                (_to_column("time", new_time), "rescheduled", appointment_id)
+            )
+        return self.get(appointment_id)
+
+    def cancel_and_move(self, cancel_ids: Iterable[int], moves: Iterable[Tuple[int, datetime.datetime]],
+                        slot_minutes: int, held: Optional[SlotHold] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        cancelled_ids, moved_ids = [], []
+        with self._write_transaction() as conn:
+            for appointment_id, new_time in [(i, None) for i in cancel_ids] + list(moves):
+                row = conn.execute("SELECT doctor_name, status FROM appointments WHERE id = ?", (appointment_id,)).fetchone()
+                if row is None or row["status"] == CANCELLED:
+                    continue
+                if new_time is not None and not self._slot_taken(conn, row["doctor_name"], new_time, slot_minutes, appointment_id, held):
+                    conn.execute(
+                        "UPDATE appointments SET time = ?, status = ? WHERE id = ?",
+                        (_to_column("time", new_time), "rescheduled", appointment_id)
+                    )
+                    moved_ids.append(appointment_id)
+                else:
+                    conn.execute("UPDATE appointments SET status = ? WHERE id = ?", (CANCELLED, appointment_id))
+                    cancelled_ids.append(appointment_id)
+        return [self.get(i) for i in cancelled_ids], [self.get(i) for i in moved_ids]
+
+    def get(self, appointment_id: int) -> Optional[Dict[str, Any]]:
+        rows = self._query("SELECT * FROM appointments WHERE id = ?", (appointment_id,))
+        return rows[0] if rows else None
+
+    def update(self, appointment_id: int, **fields) -> Optional[Dict[str, Any]]:
+        fields = {key: value for key, value in fields.items() if key in APPOINTMENT_FIELDS}
+        if fields:
+            assignments = ", ".join(f"{key} = ?" for key in fields)
+            with self._connection() as conn:
+                self._bump(conn)
+                conn.execute(
+                    f"UPDATE appointments SET {assignments} WHERE id = ?",
+                    (*(_to_column(key, value) for key, value in fields.items()), appointment_id)
+                )
+        return self.get(appointment_id)
+
+    def find_by_time(self, time: datetime.datetime, patient_name: str = "") -> Optional[Dict[str, Any]]:
+        sql = "SELECT * FROM appointments WHERE time = ? AND status != ?"
+        params = (_to_column("time", time), CANCELLED)
+        if patient_name:
+            sql += " AND lower(name) = ?"
+            params += (patient_name.lower(),)
+        rows = self._query(sql + " LIMIT 1", params)
+        return rows[0] if rows else None
+
+    def find_by_slot(self, doctor_name: str, time: datetime.datetime) -> Optional[Dict[str, Any]]:
+        rows = self._query(
+            "SELECT * FROM appointments WHERE doctor_name = ? AND time = ? AND status != ? LIMIT 1",
+            (doctor_name, _to_column("time", time), CANCELLED)
+        )
+        return rows[0] if rows else None
+
+    def find_by_email(self, email: str) -> List[Dict[str, Any]]:
+        return self._query(
+            "SELECT * FROM appointments WHERE email = ? AND status != ? ORDER BY time",
+            (email, CANCELLED)
+        )
+
+    def list_active(self) -> List[Dict[str, Any]]:
+        return self._query("SELECT * FROM appointments WHERE status != ? ORDER BY time", (CANCELLED,))
+
+    def list_for_doctor(self, doctor_name: str, start: datetime.datetime, end: datetime.datetime) -> List[Dict[str, Any]]:
+        return self._query(
+            "SELECT * FROM appointments WHERE doctor_name = ? AND time >= ? AND time < ? AND status != ? ORDER BY time",
+            (doctor_name, _to_column("time", start), _to_column("time", end), CANCELLED)
+        )
+
+    def iter_appointments(self, include_cancelled: bool = False, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        sql = "SELECT * FROM appointments"
+        params: tuple = ()
+        if not include_cancelled:
+            sql += " WHERE status != ?"
+            params = (CANCELLED,)
+        cursor = self._connection().execute(sql + " ORDER BY time", params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield self._row_to_appointment(row)
+
+    def clear(self):
+        with self._connection() as conn:
+            self._bump(conn)
+            conn.execute("DELETE FROM appointments")
+
+    def data_version(self) -> int:
+        with self._version_lock:
+            return self._version_conn.execute("SELECT version FROM appointments_meta").fetchone()[0]
+
+
+def slot_bounds(time: datetime.datetime, slot_minutes: int):
+    """Return the start and end of the ``slot_minutes`` slot containing ``time``"""
+    minute = time.hour * 60 + time.minute
+    start = datetime.datetime.combine(time.date(), datetime.time()) + datetime.timedelta(minutes=minute - minute % slot_minutes)
+    return start, start + datetime.timedelta(minutes=slot_minutes)
+
+
+def _normalize(appointment: Dict[str, Any]) -> Dict[str, Any]:
+    stored = {field: appointment.get(field) for field in APPOINTMENT_FIELDS}
+    stored["status"] = stored["status"] or "Confirmed"
+    stored["reminder_sent"] = bool(stored["reminder_sent"])
+    return stored
+
+
+def _to_column(field: str, value: Any) -> Any:
+    if field == "time" and isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if field == "reminder_sent":
+        return int(bool(value))
+    return value
+
+
+BACKENDS = {
+    "sqlite": lambda settings: SQLiteAppointmentRepository(os.getenv("APPOINTMENTS_DB", settings.get("path", "appointments.db"))),
+    "memory": lambda settings: InMemoryAppointmentRepository(),
+}
+
+_store: Optional[AppointmentRepository] = None
+_store_lock = threading.Lock()
+
+
+def create_appointment_store(settings: Dict[str, Any]) -> AppointmentRepository:
+    backend = os.getenv("APPOINTMENTS_BACKEND", settings.get("backend", "sqlite"))
+    if backend not in BACKENDS:
+        raise RuntimeError(f"Unknown appointment storage backend: {backend}")
+    return BACKENDS[backend](settings)
+
+
+def get_appointment_store() -> AppointmentRepository:
+    """Return the process-wide appointment repository configured in settings.yaml"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_appointment_store(AppConfig().storage_settings)
+    return _store
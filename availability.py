@@ -0,0 +1,175 @@
+import datetime
+import threading
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+from logger import setup_logger
+from slot_engine import Exclude, SlotGrid
+
+logger = setup_logger(__name__)
+
+SLOT_MINUTES = 30
+HORIZON_WEEKS = 52
+STANDARD_PRIORITY = 3
+LATER_SLOT_PENALTY = 0.25
+
+
+def _utc_now() -> datetime.datetime:
+    """An aware "now", which the slot grid moves onto each doctor's own clock"""
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class AvailabilityIndex:
+    """Booked-slot bitmaps keyed by (doctor, day).
+
+    Bit ``i`` of a day's bitmap covers the slot starting ``i * slot_minutes``
+    after midnight. Each doctor also gets one working-hours mask per weekday,
+    so a conflict check is a dict lookup plus a bit test. Free-slot queries are
+    answered by a ``SlotGrid`` over ``horizon_weeks`` that is built on first use
+    and kept in step with every add and remove. Mutations take a short internal
+    lock; callers serialize check-then-book sequences themselves.
+    """
+
+    def __init__(self, schedules: Mapping[str, Any], slot_minutes: int = SLOT_MINUTES,
+                 horizon_weeks: int = HORIZON_WEEKS, exclude: Exclude = None):
+        self.schedules = schedules
+        self.slot_minutes = slot_minutes
+        self.horizon_weeks = horizon_weeks
+        self.exclude = exclude
+        self._lock = threading.RLock()
+        self._grid: Optional[SlotGrid] = None
+        self._working = {name: self._working_masks(info) for name, info in schedules.items()}
+        self._booked: Dict[Tuple[str, datetime.date], int] = {}
+        self._slot_counts: Dict[Tuple[str, datetime.date, int], int] = {}
+        self._by_time: Dict[datetime.datetime, List[Dict[str, Any]]] = {}
+
+    @classmethod
+    def from_appointments(cls, schedules: Mapping[str, Any], appointments: Iterable[Dict[str, Any]],
+                          **kwargs) -> "AvailabilityIndex":
+        index = cls(schedules, **kwargs)
+        for appointment in appointments:
+            index.add(appointment)
+        return index
+
+    def _working_masks(self, schedule) -> List[int]:
+        first = -(-schedule.start_minute // self.slot_minutes)
+        last = schedule.end_minute // self.slot_minutes
+        day_mask = ((1 << last) - 1) & ~((1 << first) - 1)
+        return [day_mask if schedule.works_on(weekday) else 0 for weekday in range(7)]
+
+    def _slot(self, time: datetime.datetime) -> Tuple[datetime.date, int]:
+        return time.date(), (time.hour * 60 + time.minute) // self.slot_minutes
+
+    def slot_start(self, day: datetime.date, slot: int) -> datetime.datetime:
+        return datetime.datetime.combine(day, datetime.time()) + datetime.timedelta(minutes=slot * self.slot_minutes)
+
+    def is_working(self, doctor_name: str, time: datetime.datetime) -> bool:
+        masks = self._working.get(doctor_name)
+        if masks is None:
+            return False
+        day, slot = self._slot(time)
+        return bool(masks[day.weekday()] >> slot & 1)
+
+    def is_booked(self, doctor_name: str, time: datetime.datetime) -> bool:
+        day, slot = self._slot(time)
+        return bool(self._booked.get((doctor_name, day), 0) >> slot & 1)
+
+    def is_free(self, doctor_name: str, time: datetime.datetime) -> bool:
+        return self.is_working(doctor_name, time) and not self.is_booked(doctor_name, time)
+
+    def add(self, appointment: Dict[str, Any]):
+        """Mark the appointment's slot as booked"""
+        doctor_name = appointment.get("doctor_name")
+        time = appointment.get("time")
+        if not doctor_name or not isinstance(time, datetime.datetime):
+            return
+        day, slot = self._slot(time)
+        with self._lock:
+            self._booked[(doctor_name, day)] = self._booked.get((doctor_name, day), 0) | (1 << slot)
+            self._slot_counts[(doctor_name, day, slot)] = self._slot_counts.get((doctor_name, day, slot), 0) + 1
+            self._by_time.setdefault(time, []).append(appointment)
+            if self._grid is not None:
+                self._grid.set_booked(doctor_name, time)
+
+    def remove(self, appointment: Dict[str, Any]):
+        """Release the appointment's slot once no other booking holds it"""
+        doctor_name = appointment.get("doctor_name")
+        time = appointment.get("time")
+        if not doctor_name or not isinstance(time, datetime.datetime):
+            return
+        with self._lock:
+            at_time = self._by_time.get(time, [])
+            for i, candidate in enumerate(at_time):
+                if candidate is appointment or (appointment.get("id") is not None and candidate.get("id") == appointment.get("id")):
+                    at_time.pop(i)
+                    break
+            else:
+                logger.warning(f"Appointment not found in availability index: {appointment}")
+                return
+            if not at_time:
+                del self._by_time[time]
+
+            day, slot = self._slot(time)
+            remaining = self._slot_counts.get((doctor_name, day, slot), 1) - 1
+            if remaining > 0:
+                self._slot_counts[(doctor_name, day, slot)] = remaining
+                return
+            self._slot_counts.pop((doctor_name, day, slot), None)
+            booked = self._booked.get((doctor_name, day), 0) & ~(1 << slot)
+            if booked:
+                self._booked[(doctor_name, day)] = booked
+            else:
+                self._booked.pop((doctor_name, day), None)
+            if self._grid is not None:
+                self._grid.set_booked(doctor_name, time, False)
+
+    def move(self, appointment: Dict[str, Any], new_time: datetime.datetime):
+        self.remove(appointment)
+        appointment["time"] = new_time
+        self.add(appointment)
+
+    def clear(self):
+        with self._lock:
+            self._booked.clear()
+            self._slot_counts.clear()
+            self._by_time.clear()
+            self._grid = None
+
+    def find(self, time: datetime.datetime, patient_name: str = "") -> Optional[Dict[str, Any]]:
+        """Look up a booked appointment by its exact time and optional patient name"""
+        for appointment in list(self._by_time.get(time, [])):
+            if not patient_name or appointment["name"].lower() == patient_name.lower():
+                return appointment
+        return None
+
+    def _slot_grid(self) -> SlotGrid:
+        # The earliest date any doctor's clock shows, so nobody's today falls before the grid
+        today = min((schedule.now().date() for schedule in self.schedules.values()), default=datetime.date.today())
+        with self._lock:
+            if self._grid is None or self._grid.start != today:
+                grid = SlotGrid(self.schedules, today, self.horizon_weeks, self.slot_minutes)
+                grid.mark_booked(
+                    (doctor_name, self.slot_start(day, slot)) for doctor_name, day, slot in self._slot_counts
+                )
+                self._grid = grid
+            return self._grid
+
+    def free_slots(self, doctor_names: Optional[Iterable[str]] = None, start: Optional[datetime.datetime] = None,
+                   limit: int = 5, days: Optional[int] = 14) -> List[Tuple[str, datetime.datetime]]:
+        """Return up to ``limit`` (doctor, time) pairs that are free, earliest first"""
+        doctors = list(doctor_names) if doctor_names is not None else list(self.schedules)
+        start = start or _utc_now()
+        end = start + datetime.timedelta(days=days) if days else None
+        return self._slot_grid().next_free(doctors, start, limit=limit, before=end, exclude=self.exclude)
+
+    def nearest_free_slots(self, doctor_names: Iterable[str], target: datetime.datetime, limit: int = 3,
+                           priority: Optional[int] = None, time_budget: Optional[float] = None) -> List[Tuple[str, datetime.datetime]]:
+        """Return the ``limit`` free slots closest to ``target``, never in the past.
+
+        Above standard priority, slots after the requested time are penalized by
+        ``LATER_SLOT_PENALTY`` per level so urgent patients are steered earlier.
+        """
+        later_weight = 1.0 + LATER_SLOT_PENALTY * max((priority or STANDARD_PRIORITY) - STANDARD_PRIORITY, 0)
+        return self._slot_grid().nearest_free(
+            doctor_names, target, limit=limit, not_before=_utc_now(),
+            later_weight=later_weight, time_budget=time_budget, exclude=self.exclude
+        )
+
@@ -0,0 +1,105 @@
+"""Booking throughput as concurrent bookers scale up.
+
+Each run books the same set of requests from 1..N threads against a scratch
+SQLite store and reports bookings per second, latency percentiles and the
+number of double-booked slots (which must always be zero).
+
+    python benchmarks/booking_contention.py --threads 1,2,4,8,16 --requests 800
+    python benchmarks/booking_contention.py --mode hot      # everyone wants the same few slots
+    python benchmarks/booking_contention.py --global-lock   # serialize bookings on one lock for comparison
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def build_requests(tools, mode, count, hot_slots):
+    index = tools.get_availability_index()
+    slots = index.free_slots(limit=count if mode == "spread" else hot_slots, days=None)
+    requests = []
+    for i in range(count):
+        doctor_name, slot_time = slots[i % len(slots)]
+        info = tools.DOCTOR_SCHEDULES[doctor_name]
+        requests.append({
+            "name": f"Patient {i}",
+            "type": "Consultation",
+            "time": slot_time,
+            "email": f"patient{i}@example.com",
+            "doctor_name": doctor_name,
+            "doctor_specialty": info.specialty,
+            "location": info.location,
+        })
+    return requests
+
+
+def run(tools, store, slot_bounds, requests, threads, global_lock):
+    tools.clear_appointments()
+    lock = threading.Lock()
+    latencies = []
+
+    def book(appointment):
+        started = time.perf_counter()
+        if global_lock:
+            with lock:
+                stored = tools.reserve_appointment(appointment)
+        else:
+            stored = tools.reserve_appointment(appointment)
+        latencies.append(time.perf_counter() - started)
+        return stored is not None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        booked = sum(pool.map(book, requests))
+    elapsed = time.perf_counter() - started
+
+    slot_minutes = tools.get_availability_index().slot_minutes
+    slots = Counter((a["doctor_name"], slot_bounds(a["time"], slot_minutes)[0]) for a in store.list_active())
+    double_booked = sum(1 for count in slots.values() if count > 1)
+    latencies.sort()
+    return {
+        "threads": threads,
+        "throughput": len(requests) / elapsed,
+        "booked": booked,
+        "rejected": len(requests) - booked,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+        "double_booked": double_booked,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", default="1,2,4,8,16")
+    parser.add_argument("--requests", type=int, default=800)
+    parser.add_argument("--mode", choices=["spread", "hot"], default="spread")
+    parser.add_argument("--hot-slots", type=int, default=8)
+    parser.add_argument("--global-lock", action="store_true")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="booking-bench-")
+    os.environ["APPOINTMENTS_BACKEND"] = "sqlite"
+    os.environ["APPOINTMENTS_DB"] = os.path.join(workdir, "appointments.db")
+
+    import tools
+    from appointment_store import get_appointment_store, slot_bounds
+
+    store = get_appointment_store()
+    requests = build_requests(tools, args.mode, args.requests, args.hot_slots)
+    label = "global lock" if args.global_lock else "striped locks"
+    print(f"{args.requests} {args.mode} booking requests, {label}, store at {workdir}")
+    print(f"{'threads':>7} {'bookings/s':>11} {'booked':>7} {'rejected':>9} {'p50 ms':>8} {'p99 ms':>8} {'double':>7}")
+    for threads in (int(value) for value in args.threads.split(",")):
+        result = run(tools, store, slot_bounds, requests, threads, args.global_lock)
+        print(f"{result['threads']:>7} {result['throughput']:>11.0f} {result['booked']:>7} {result['rejected']:>9} "
+              f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['double_booked']:>7}")
+
+
+if __name__ == "__main__":
+    main()
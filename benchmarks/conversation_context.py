@@ -0,0 +1,65 @@
+"""Prompt size and build cost over a long chat, full history versus the budgeted context.
+
+Simulates a conversation turn by turn and, at a few checkpoints, reports the
+tokens an agent prompt would carry and how long building it took, both for
+``[SystemMessage] + messages`` (the old prompts) and for ConversationContext.
+
+    python benchmarks/conversation_context.py --turns 2000
+    python benchmarks/conversation_context.py --max-tokens 800 --max-turns 4
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from conversation_context import ConversationContext, count_tokens
+
+SYSTEM = "You are the Medical Consultation Agent. Provide general health information and suggest specialties."
+TURNS = [
+    ("Hi, my back has been hurting for a couple of weeks, mostly in the mornings.",
+     "I'm sorry to hear that. Morning back stiffness is common; an orthopedic specialist can assess it properly."),
+    ("Which doctor should I see for that?", "Dr. Brown in Orthopedics is a good fit. He works Wednesday to Friday."),
+    ("Can I book 2025-03-14 09:00 AM with Dr. Brown? My name is Ann Lee.",
+     "Great! I've booked your appointment with Dr. Brown on Friday, March 14 at 09:00 AM."),
+    ("Do I need to bring anything?", "Please bring a photo ID, your insurance card and any recent imaging."),
+]
+
+
+def prompt_tokens(messages):
+    return sum(count_tokens(str(message.content)) for message in messages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--max-tokens", type=int, default=1500)
+    parser.add_argument("--max-turns", type=int, default=6)
+    args = parser.parse_args()
+
+    context = ConversationContext(max_tokens=args.max_tokens, max_turns=args.max_turns)
+    history = []
+    checkpoints = {10, 100, args.turns} | {10 ** power for power in range(1, 7) if 10 ** power < args.turns}
+    print(f"{'turn':>6} {'full tokens':>12} {'full ms':>9} {'context tokens':>15} {'context ms':>11}")
+    for turn in range(1, args.turns + 1):
+        question, answer = TURNS[turn % len(TURNS)]
+        history.append(HumanMessage(content=question))
+        if turn in checkpoints:
+            started = time.perf_counter()
+            full = [SystemMessage(content=SYSTEM)] + history
+            full_tokens = prompt_tokens(full)
+            full_ms = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            context.sync(history)
+            budgeted = context.messages(SYSTEM)
+            context_ms = (time.perf_counter() - started) * 1000
+            print(f"{turn:>6} {full_tokens:>12} {full_ms:>9.2f} {prompt_tokens(budgeted):>15} {context_ms:>11.2f}")
+        else:
+            context.sync(history)
+        history.append(AIMessage(content=answer))
+
+
+if __name__ == "__main__":
+    main()
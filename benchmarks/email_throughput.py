@@ -0,0 +1,142 @@
+"""Throughput and latency of the email paths against a local SMTP stand-in.
+
+Runs each scenario against benchmarks/fake_smtp.py and reports messages per
+second, p50/p99 latency and how many messages actually got through:
+
+* send_email                - raw sends from N threads
+* send_booking_confirmation - template rendering plus send from N threads
+* reminders                 - appointments whose reminders are all due, fired by
+                              the reminder scheduler and delivered by the outbox;
+                              latency is enqueue-to-delivery
+
+    python benchmarks/email_throughput.py --messages 500 --threads 4
+    python benchmarks/email_throughput.py --latency 0.005 --fail-rate 0.05 --drop-rate 0.01
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_smtp import FakeSMTPServer
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else 0.0
+
+
+def appointment(i, start):
+    return {
+        "name": f"Patient {i}",
+        "type": "Consultation",
+        "time": start + datetime.timedelta(minutes=30 * i),
+        "email": f"patient{i}@example.com",
+        "doctor_name": "Dr. Bench",
+        "doctor_specialty": "General",
+        "location": "Room 1",
+        "status": "Scheduled",
+    }
+
+
+def threaded(send, items, threads):
+    latencies = []
+
+    def timed(item):
+        started = time.perf_counter()
+        ok = send(item)
+        latencies.append(time.perf_counter() - started)
+        return ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        sent = sum(bool(ok) for ok in pool.map(timed, items))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return sent, elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+def bench_send_email(service, count, threads):
+    return threaded(
+        lambda i: service.send_email(f"patient{i}@example.com", "Benchmark", "<p>Hello from the benchmark.</p>"),
+        range(count), threads
+    )
+
+
+def bench_booking_confirmation(service, count, threads):
+    start = datetime.datetime.now() + datetime.timedelta(days=2)
+    return threaded(service.send_booking_confirmation, [appointment(i, start) for i in range(count)], threads)
+
+
+def bench_reminders(count, threads):
+    from appointment_store import get_appointment_store
+    from email_outbox import get_email_outbox
+    from notification_coalescer import get_notification_coalescer
+    from reminder_scheduler import ReminderScheduler, _send_reminder
+
+    outbox = get_email_outbox()
+    outbox.workers = threads
+    store = get_appointment_store()
+    store.clear()
+    now = datetime.datetime.now()
+    stored = store.add_many(appointment(i, now + datetime.timedelta(days=2)) for i in range(count))
+    scheduler = ReminderScheduler([24], _send_reminder, store.get)
+    scheduler.schedule_many(stored, now)
+
+    before = outbox.stats()
+    started = time.perf_counter()
+    scheduler.run_due(now + datetime.timedelta(days=30))
+    get_notification_coalescer().flush()
+    outbox.flush()
+    elapsed = time.perf_counter() - started
+    after = outbox.stats()
+    return after["sent"] - before["sent"], elapsed, after["p50_ms"] or 0.0, after["p99_ms"] or 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.001, help="seconds added to every server reply")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of messages answered with 451")
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="fraction of recipients refused with 550")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of commands answered by hanging up")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(latency=args.latency, fail_rate=args.fail_rate, reject_rate=args.reject_rate,
+                            drop_rate=args.drop_rate, seed=args.seed)
+    with server:
+        os.environ.update({
+            "SMTP_SERVER": server.host,
+            "SMTP_PORT": str(server.port),
+            "SMTP_USERNAME": "bench",
+            "SMTP_PASSWORD": "bench",
+            "SENDER_EMAIL": "clinic@example.com",
+            "SMTP_USE_TLS": "false",
+            "APPOINTMENTS_BACKEND": "memory",
+        })
+        from email_outbox import get_email_outbox
+        from email_service import email_service
+
+        get_email_outbox().backoff_base = 0.05
+        scenarios = [
+            ("send_email", lambda: bench_send_email(email_service, args.messages, args.threads)),
+            ("send_booking_confirmation", lambda: bench_booking_confirmation(email_service, args.messages, args.threads)),
+            ("reminders", lambda: bench_reminders(args.messages, args.threads)),
+        ]
+        print(f"{'scenario':<27}{'sent':>7}{'msg/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'conns':>7}")
+        for name, scenario in scenarios:
+            server.reset_counts()
+            sent, elapsed, p50, p99 = scenario()
+            print(f"{name:<27}{sent:>7}{sent / elapsed:>10.0f}{p50:>9.2f}{p99:>9.2f}{server.connections:>7}")
+        get_email_outbox().stop()
+        email_service.pool.close()
+        print(f"pool stats: {email_service.pool.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""A local SMTP stand-in for benchmarks and offline testing.
+
+Speaks just enough ESMTP for smtplib (EHLO, AUTH PLAIN, MAIL, RCPT, DATA,
+NOOP, RSET, QUIT), accepts messages and counts them. ``latency`` adds a
+delay to every reply so connection setup costs something, as it does against
+a real server. Failures can be injected at random:
+
+* ``fail_rate``   - answer DATA with 451 (a transient error worth retrying)
+* ``reject_rate`` - answer RCPT with 550 (a permanent recipient refusal)
+* ``drop_rate``   - hang up instead of answering a command
+
+STARTTLS is not offered, so point clients at it with SMTP_USE_TLS=false.
+
+    with FakeSMTPServer(latency=0.002, fail_rate=0.05) as server:
+        ...  # send to 127.0.0.1:server.port
+
+    python benchmarks/fake_smtp.py --port 1025 --latency 0.01   # run standalone for the app
+"""
+import argparse
+import asyncio
+import random
+import threading
+import time
+
+
+class FakeSMTPServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, fail_rate: float = 0.0,
+                 reject_rate: float = 0.0, drop_rate: float = 0.0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.reject_rate = reject_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.connections = 0
+        self.messages = 0
+        self.failed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def reset_counts(self):
+        self.connections = self.messages = self.failed = self.rejected = self.dropped = 0
+
+    async def _reply(self, writer, line: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(line.encode() + b"\r\n")
+        await writer.drain()
+
+    def _chance(self, rate: float) -> bool:
+        return rate > 0 and self.random.random() < rate
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        await self._reply(writer, "220 localhost fake ESMTP")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                verb = line.decode(errors="replace").strip().split(" ", 1)[0].upper()
+                if verb not in ("QUIT", "EHLO") and self._chance(self.drop_rate):
+                    self.dropped += 1
+                    break
+                if verb == "EHLO":
+                    await self._reply(writer, "250-localhost\r\n250-AUTH PLAIN\r\n250 8BITMIME")
+                elif verb == "AUTH":
+                    await self._reply(writer, "235 2.7.0 Authentication successful")
+                elif verb == "RCPT" and self._chance(self.reject_rate):
+                    self.rejected += 1
+                    await self._reply(writer, "550 5.1.1 Recipient address rejected")
+                elif verb == "DATA":
+                    await self._reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                    while (await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        pass
+                    if self._chance(self.fail_rate):
+                        self.failed += 1
+                        await self._reply(writer, "451 4.3.0 Temporary failure, try again later")
+                    else:
+                        self.messages += 1
+                        await self._reply(writer, "250 2.0.0 Ok: queued")
+                elif verb == "QUIT":
+                    await self._reply(writer, "221 2.0.0 Bye")
+                    break
+                elif verb in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                    await self._reply(writer, "250 2.0.0 Ok")
+                else:
+                    await self._reply(writer, "502 5.5.2 Command not implemented")
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._shutdown())
+        self._loop.close()
+
+    async def _shutdown(self):
+        self._server.close()
+        pending = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def start(self) -> "FakeSMTPServer":
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake SMTP server until interrupted")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--reject-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(args.host, args.port, args.latency, args.fail_rate, args.reject_rate, args.drop_rate)
+    with server:
+        print(f"Fake SMTP server listening on {server.host}:{server.port} (SMTP_USE_TLS=false)")
+        try:
+            while True:
+                time.sleep(5)
+                print(f"connections={server.connections} messages={server.messages} failed={server.failed} "
+                      f"rejected={server.rejected} dropped={server.dropped}")
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
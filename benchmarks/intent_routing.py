@@ -0,0 +1,130 @@
+"""Routing cost of the compiled intent router versus substring checks.
+
+Routes a corpus of chat utterances through:
+
+* legacy  - the ``in`` checks process_user_message used before the router
+* linear  - the same rule table evaluated rule by rule with substring checks
+* router  - intent_router.IntentRouter (one scan, keyword trie, triggered rules)
+
+and then pads the rule table with synthetic rules to show that the router's
+cost stays flat as the table grows while rule-by-rule checking does not.
+
+    python benchmarks/intent_routing.py --repeat 200
+    python benchmarks/intent_routing.py --rules 10,100,1000,10000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import IntentRouter, IntentRule
+from config import AppConfig
+
+UTTERANCES = [
+    "Hi, I would like to book an appointment",
+    "What are the next available appointments?",
+    "Show me available doctors",
+    "I need to cancel an appointment",
+    "2025-03-14 09:00 AM, John Doe, Dr. Smith",
+    "Book 2025-03-14 9:30am for Mary Ann with Doctor Johnson",
+    "my name is Ann Lee, 2025-03-18 10:00 AM with Dr Brown please",
+    "what are your opening hours",
+    "do you take walk-ins on saturday?",
+    "Is Dr. Williams available next Tuesday afternoon",
+    "I've had chest pain since yesterday, who should I see?",
+    "Can I reschedule my appointment to Friday?",
+    "please cancel my booking with dr johnson",
+    "Which doctor treats skin rashes?",
+    "I want the earliest appointment with any cardiologist, it's urgent",
+    "Thanks, that's all",
+    "Do I need to bring my insurance card?",
+    "Where is the Sports Medicine Wing?",
+    "Could you show me the doctors who work on Wednesdays",
+    "My back has been hurting for weeks and I'd like to see someone about it as soon as possible",
+    "2025-04-02 02:30 PM Sarah Connor Dr. Williams",
+    "is there any appointment available this week",
+    "hello",
+    "cancel",
+]
+LEGACY_SLOT = re.compile(r'\d{4}-\d{2}-\d{2}\s+\d{1,2}:\d{2}\s*(?:AM|PM)', re.IGNORECASE)
+DOCTORS = {"Smith": "Dr. Smith", "Johnson": "Dr. Johnson", "Williams": "Dr. Williams", "Brown": "Dr. Brown"}
+
+
+def legacy_route(message):
+    message_lower = message.lower()
+    if "book" in message_lower and "appointment" in message_lower:
+        return "booking_help"
+    elif "available" in message_lower and "appointment" in message_lower:
+        return "schedule_query"
+    elif ("available" in message_lower and "doctor" in message_lower) or ("show" in message_lower and "doctor" in message_lower):
+        return "doctor_query"
+    elif LEGACY_SLOT.search(message):
+        return "book_slot"
+    elif "cancel" in message_lower:
+        return "cancel"
+    return None
+
+
+def answered_by(router, message):
+    """The intent process_user_message answers itself; others, like a bare "booking", go to the LLM as before"""
+    intent = router.route(message).intent
+    return intent if intent in ("booking_help", "schedule_query", "doctor_query", "book_slot", "cancel") else None
+
+
+def linear_route(rules, message):
+    message_lower = message.lower()
+    has_slot = LEGACY_SLOT.search(message) is not None
+    for rule in rules:
+        if (all(word in message_lower for word in rule.all)
+                and (not rule.any or any(word in message_lower for word in rule.any))
+                and (not rule.slots or has_slot)):
+            return rule.intent
+    return None
+
+
+def padded(rules, count):
+    """The real table plus synthetic rules, placed first so every one of them is checked"""
+    synthetic = [
+        IntentRule(f"synthetic_{i}", all=frozenset({f"zq{i}x", f"vk{i}w"}), any=frozenset({f"jj{i}"}))
+        for i in range(max(count - len(rules), 0))
+    ]
+    return synthetic + rules
+
+
+def timed(route, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in UTTERANCES:
+            route(message)
+    return (time.perf_counter() - started) / (repeat * len(UTTERANCES)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--rules", default="10,100,1000,10000")
+    args = parser.parse_args()
+
+    rules = [IntentRule.from_dict(entry) for entry in AppConfig().intent_rules]
+    router = IntentRouter(rules, DOCTORS)
+    disagreements = [message for message in UTTERANCES if legacy_route(message) != answered_by(router, message)]
+    print(f"{len(UTTERANCES)} utterances, {len(rules)} rules; router differs from legacy on {len(disagreements)}:")
+    for message in disagreements:
+        print(f"  {message!r}: legacy={legacy_route(message)} router={router.route(message).intent}")
+
+    print(f"\n{'rules':>6} {'legacy us/msg':>14} {'linear us/msg':>14} {'router us/msg':>14}")
+    print(f"{len(rules):>6} {timed(legacy_route, args.repeat):>14.2f} "
+          f"{timed(lambda m: linear_route(rules, m), args.repeat):>14.2f} {timed(router.route, args.repeat):>14.2f}")
+    for count in (int(value) for value in args.rules.split(",")):
+        table = padded(rules, count)
+        big_router = IntentRouter(table, DOCTORS)
+        repeat = max(args.repeat * 10 // max(count, 10), 1)
+        print(f"{len(table):>6} {'':>14} {timed(lambda m: linear_route(table, m), repeat):>14.2f} "
+              f"{timed(big_router.route, args.repeat):>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Upstream LLM calls during a burst of identical questions, with and without single-flight.
+
+Starts ``--sessions`` threads that send the same chat turn at once through
+the orchestrator's workflow, with the doctor agent talking to a stand-in model
+that takes ``--latency`` seconds, and reports how many calls reached the model,
+wall time and time to first token for the slowest session.
+
+    python benchmarks/llm_singleflight.py --sessions 50
+    python benchmarks/llm_singleflight.py --sessions 200 --distinct 5
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Memory-only response cache, so the benchmark never reads or clears the app's cache file
+os.environ["LLM_CACHE_PATH"] = ""
+
+from llm_cache import get_llm_cache
+from llm_singleflight import get_llm_singleflight
+from multi_agent_system import multi_agent_orchestrator
+
+QUESTIONS = [
+    "What are your opening hours?",
+    "Is there parking at the clinic?",
+    "Do you take walk-ins on saturday?",
+    "Do I need to bring my insurance card?",
+    "Where is the Sports Medicine Wing?",
+]
+
+
+class SlowModel:
+    """Streams a fixed answer over ``latency`` seconds and counts its calls"""
+    model_name = "stand-in"
+    temperature = 0.7
+    max_tokens = 1000
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def stream(self, prompt):
+        with self._lock:
+            self.calls += 1
+        tokens = "Our doctors are available Monday to Friday from nine to five .".split()
+        for token in tokens:
+            time.sleep(self.latency / len(tokens))
+            yield token + " "
+
+
+def burst(sessions, distinct, latency, enabled):
+    model = SlowModel(latency)
+    multi_agent_orchestrator.doctor_bot.llm = model
+    get_llm_singleflight().enabled = enabled
+    get_llm_cache().clear()
+    first_tokens = []
+    start = threading.Barrier(sessions + 1)
+
+    def session(i):
+        start.wait()
+        began = time.perf_counter()
+        for n, _ in enumerate(multi_agent_orchestrator.process_user_message_stream(QUESTIONS[i % distinct])):
+            if n == 0:
+                first_tokens.append(time.perf_counter() - began)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return model.calls, time.perf_counter() - began, max(first_tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--distinct", type=int, default=2, help="how many different questions the burst asks")
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+    distinct = max(1, min(args.distinct, len(QUESTIONS)))
+
+    print(f"{args.sessions} sessions asking {distinct} distinct questions, model latency {args.latency}s")
+    print(f"{'mode':>13} {'upstream calls':>15} {'wall s':>8} {'worst ttft s':>13}")
+    for label, enabled in (("direct", False), ("single-flight", True)):
+        calls, wall, ttft = burst(args.sessions, distinct, args.latency, enabled)
+        print(f"{label:>13} {calls:>15} {wall:>8.2f} {ttft:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Email throughput with pooled SMTP connections versus one connection per message.
+
+Sends the same messages through ``EmailService.send_email`` against a local
+SMTP stand-in, first opening a fresh connection per message (the old
+behaviour) and then through the shared pool, and reports messages per second,
+latency percentiles and how many connections each run opened.
+
+    python benchmarks/smtp_pool_throughput.py --messages 500 --threads 1,4
+    python benchmarks/smtp_pool_throughput.py --latency 0.005   # slower server replies
+"""
+import argparse
+import os
+import smtplib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_smtp import FakeSMTPServer
+
+
+class ConnectPerMessage:
+    """Stands in for the pool the way sends worked before it: connect, log in, send, quit"""
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def send(self, msg):
+        with smtplib.SMTP(self.pool.host, self.pool.port, timeout=self.pool.timeout) as server:
+            server.login(self.pool.username, self.pool.password)
+            server.send_message(msg)
+
+
+def run(service, server, count, threads):
+    opened_before = server.connections
+    latencies = []
+
+    def send(i):
+        started = time.perf_counter()
+        ok = service.send_email(f"patient{i}@example.com", "Appointment reminder", "<p>See you soon.</p>")
+        latencies.append(time.perf_counter() - started)
+        return ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        sent = sum(pool.map(send, range(count)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "sent": sent,
+        "per_sec": sent / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "connections": server.connections - opened_before,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=300)
+    parser.add_argument("--threads", default="1,4")
+    parser.add_argument("--latency", type=float, default=0.001, help="seconds added to every server reply")
+    args = parser.parse_args()
+
+    with FakeSMTPServer(latency=args.latency) as server:
+        os.environ.update({
+            "SMTP_SERVER": server.host,
+            "SMTP_PORT": str(server.port),
+            "SMTP_USERNAME": "bench",
+            "SMTP_PASSWORD": "bench",
+            "SENDER_EMAIL": "clinic@example.com",
+            "SMTP_USE_TLS": "false",
+        })
+        from email_service import EmailService
+
+        service = EmailService()
+        pool = service.pool
+        print(f"{'mode':<12}{'threads':>8}{'sent':>7}{'msg/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'conns':>7}")
+        for threads in (int(n) for n in args.threads.split(",")):
+            for mode in ("per-message", "pooled"):
+                service.pool = ConnectPerMessage(pool) if mode == "per-message" else pool
+                result = run(service, server, args.messages, threads)
+                print(f"{mode:<12}{threads:>8}{result['sent']:>7}{result['per_sec']:>10.0f}"
+                      f"{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}{result['connections']:>7}")
+        pool.close()
+        print(f"pool stats: {pool.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import datetime
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from logger import setup_logger
+from config import AppConfig
+from availability import STANDARD_PRIORITY
+from slot_locks import DEFAULT_STRIPES, StripedLock
+from tools import get_availability_index, reserve_appointment
+
+logger = setup_logger(__name__)
+
+DEFAULT_AGING_SECONDS = 300
+DEFAULT_WINDOW_MS = 25
+FLEXIBLE_CANDIDATES = 20
+
+
+@dataclass(order=True)
+class BookingRequest:
+    key: float
+    sequence: int
+    appointment: Dict[str, Any] = field(compare=False)
+    priority: int = field(compare=False, default=STANDARD_PRIORITY)
+    flexible: bool = field(compare=False, default=False)
+    arrival: float = field(compare=False, default=0.0)
+    result: Optional[Dict[str, Any]] = field(compare=False, default=None)
+    done: threading.Event = field(compare=False, default_factory=threading.Event)
+
+
+Partition = Tuple[str, datetime.date]
+
+
+def partition_of(appointment: Dict[str, Any]) -> Partition:
+    return appointment["doctor_name"], appointment["time"].date()
+
+
+class BookingQueue:
+    """Admission queue that hands out each doctor-day's slots in priority order.
+
+    Requests are keyed by ``arrival - priority * aging_seconds``. An emergency
+    outranks a routine request that arrived up to a few aging periods earlier,
+    but no more, so low priorities age their way to the front instead of
+    starving. Keys are fixed at submission, so each push and pop is one
+    O(log n) heap operation and ties fall back to arrival order.
+
+    Only requests for the same doctor and day compete, so each (doctor, day)
+    has its own heap, drained under its own lock stripe: bookings for
+    different doctors or days never wait on each other. ``window`` is how
+    long a request waits for competitors to arrive before its partition is
+    drained; without it a request is usually alone in its heap and
+    priorities have nothing to reorder.
+    """
+
+    def __init__(self, allocate: Callable[[BookingRequest], Optional[Dict[str, Any]]],
+                 aging_seconds: float = DEFAULT_AGING_SECONDS, window: float = DEFAULT_WINDOW_MS / 1000,
+                 stripes: int = DEFAULT_STRIPES):
+        self.allocate = allocate
+        self.aging_seconds = aging_seconds
+        self.window = window
+        self._heaps: Dict[Partition, List[BookingRequest]] = {}
+        self._lock = threading.Lock()
+        self._drain_locks = StripedLock(stripes)
+        self._sequence = itertools.count()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(heap) for heap in self._heaps.values())
+
+    def submit(self, appointment: Dict[str, Any], priority: int = STANDARD_PRIORITY, flexible: bool = False,
+               arrival: Optional[float] = None) -> BookingRequest:
+        arrival = time.monotonic() if arrival is None else arrival
+        request = BookingRequest(
+            key=arrival - priority * self.aging_seconds,
+            sequence=next(self._sequence),
+            appointment=appointment,
+            priority=priority,
+            flexible=flexible,
+            arrival=arrival,
+        )
+        with self._lock:
+            heapq.heappush(self._heaps.setdefault(partition_of(appointment), []), request)
+        return request
+
+    def pop(self, partition: Partition) -> Optional[BookingRequest]:
+        with self._lock:
+            heap = self._heaps.get(partition)
+            if not heap:
+                return None
+            request = heapq.heappop(heap)
+            if not heap:
+                del self._heaps[partition]
+            return request
+
+    def drain(self, partition: Optional[Partition] = None) -> int:
+        """Allocate slots to a partition's queued requests, highest ranked first, or to every partition's.
+
+        Returns how many requests were processed.
+        """
+        if partition is None:
+            with self._lock:
+                partitions = list(self._heaps)
+            return sum(self.drain(key) for key in partitions)
+        processed = 0
+        with self._drain_locks.hold([partition]):
+            while True:
+                request = self.pop(partition)
+                if request is None:
+                    break
+                try:
+                    request.result = self.allocate(request)
+                except Exception as e:
+                    logger.error(f"Error allocating booking for {request.appointment.get('name')}: {str(e)}")
+                finally:
+                    request.done.set()
+                processed += 1
+        return processed
+
+    def admit(self, appointment: Dict[str, Any], priority: int = STANDARD_PRIORITY, flexible: bool = False,
+              timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Queue one request and wait for its allocation.
+
+        Whichever caller reaches ``drain`` first serves everyone queued behind
+        it for the same doctor and day in priority order, so requests that
+        pile up during a busy spell are not served first-come-first-served.
+        """
+        request = self.submit(appointment, priority, flexible)
+        if self.window:
+            time.sleep(self.window)
+        self.drain(partition_of(appointment))
+        request.done.wait(timeout)
+        return request.result
+
+
+def allocate_slot(request: BookingRequest) -> Optional[Dict[str, Any]]:
+    """Book the requested slot, or for flexible requests the earliest free slot at or after it"""
+    appointment = request.appointment
+    if not request.flexible:
+        return reserve_appointment(appointment)
+    candidates = get_availability_index().free_slots(
+        [appointment["doctor_name"]], start=appointment["time"], limit=FLEXIBLE_CANDIDATES, days=None
+    )
+    for _, slot in candidates:
+        stored = reserve_appointment(dict(appointment, time=slot))
+        if stored:
+            return stored
+    return None
+
+
+_queue: Optional[BookingQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_booking_queue() -> BookingQueue:
+    """Return the process-wide booking admission queue"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                settings = AppConfig().scheduling_settings
+                _queue = BookingQueue(
+                    allocate_slot,
+                    aging_seconds=settings.get('priority_aging_seconds', DEFAULT_AGING_SECONDS),
+                    window=settings.get('admission_window_ms', DEFAULT_WINDOW_MS) / 1000,
+                    stripes=settings.get('lock_stripes', DEFAULT_STRIPES),
+                )
+    return _queue
@@ -0,0 +1,337 @@
+import argparse
+import csv
+import datetime
+import io
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from logger import setup_logger
+from appointment_store import APPOINTMENT_FIELDS, CANCELLED, get_appointment_store
+from schedule_model import get_doctor_schedules
+from email_outbox import get_email_outbox
+from notification_coalescer import BOOKING, notify_many
+from tools import reserve_appointments
+
+logger = setup_logger(__name__)
+
+FORMATS = ("csv", "jsonl", "parquet")
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".parquet": "parquet"}
+EXPORT_FIELDS = ["id"] + APPOINTMENT_FIELDS
+DEFAULT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+DEFAULT_TYPE = "Consultation"
+
+Source = Union[str, io.IOBase]
+
+
+@dataclass
+class RowError:
+    line: int
+    message: str
+
+
+@dataclass
+class ImportReport:
+    """Outcome of a bulk import.
+
+    Only the first ``MAX_REPORTED_ERRORS`` errors are kept so a badly broken
+    file cannot grow the report without bound; ``failed`` still counts them all.
+    """
+    total: int = 0
+    imported: int = 0
+    failed: int = 0
+    emails_queued: int = 0
+    errors: List[RowError] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, message))
+
+    def summary(self) -> str:
+        text = f"Imported {self.imported} of {self.total} rows"
+        if self.failed:
+            text += f", {self.failed} rejected"
+        if self.emails_queued:
+            text += f", {self.emails_queued} confirmation emails queued"
+        return text
+
+
+def detect_format(source: Source, fmt: Optional[str] = None) -> str:
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format: {fmt}. Expected one of {', '.join(FORMATS)}")
+        return fmt
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    detected = EXTENSIONS.get(os.path.splitext(str(name))[1].lower())
+    if detected is None:
+        raise ValueError(f"Cannot tell the format of {name or 'the input'}; pass it explicitly")
+    return detected
+
+
+def _open_text(source: Source, mode: str = "r"):
+    if isinstance(source, str):
+        return open(source, mode, encoding="utf-8", newline="")
+    if isinstance(source, io.TextIOBase):
+        return source
+    return io.TextIOWrapper(source, encoding="utf-8", newline="")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet support requires pyarrow. Install it with: pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+
+def read_rows(source: Source, fmt: Optional[str] = None, batch_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[int, Any]]:
+    """Yield ``(line, raw_row)`` pairs one at a time from a CSV, JSON Lines or Parquet source.
+
+    JSON Lines rows are yielded as unparsed text so a malformed line becomes a
+    row error instead of aborting the import.
+    """
+    fmt = detect_format(source, fmt)
+    if fmt == "csv":
+        stream = _open_text(source)
+        try:
+            reader = csv.DictReader(stream)
+            for row in reader:
+                yield reader.line_num, row
+        finally:
+            if isinstance(source, str):
+                stream.close()
+    elif fmt == "jsonl":
+        stream = _open_text(source)
+        try:
+            for line, text in enumerate(stream, start=1):
+                if text.strip():
+                    yield line, text
+        finally:
+            if isinstance(source, str):
+                stream.close()
+    else:
+        _, parquet = _require_pyarrow()
+        line = 0
+        for batch in parquet.ParquetFile(source).iter_batches(batch_size=batch_size):
+            for row in batch.to_pylist():
+                line += 1
+                yield line, row
+
+
+def _text(value: Any) -> str:
+    """A cell as stripped text; spreadsheets and JSON hand over numbers and nulls as well as strings"""
+    return "" if value is None else str(value).strip()
+
+
+def _parse_time(value: Any, schedule) -> datetime.datetime:
+    """A row's time as a naive wall-clock time on the doctor's clock, whatever the source format.
+
+    Aware values, Parquet timestamps with a timezone or ISO strings with an
+    offset or a trailing ``Z``, are converted to the doctor's timezone; naive
+    ones, as CSV and timezone-less Parquet columns give, already are on it.
+    """
+    if isinstance(value, datetime.datetime):
+        time = value
+    elif _text(value):
+        text = _text(value)
+        if text[-1] in "zZ":
+            text = text[:-1] + "+00:00"
+        time = datetime.datetime.fromisoformat(text)
+    else:
+        raise ValueError("missing appointment time")
+    time = schedule.wall_time(time)
+    # Nanosecond Parquet timestamps arrive as pandas Timestamps; store plain datetimes like every other source
+    return datetime.datetime(time.year, time.month, time.day, time.hour, time.minute, time.second, time.microsecond)
+
+
+def parse_row(raw: Any, schedules, now: Optional[datetime.datetime] = None, allow_past: bool = False) -> Dict[str, Any]:
+    """Turn one raw row into an appointment dict, raising ValueError if it cannot be booked"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON: {e.msg}")
+    if not isinstance(raw, dict):
+        raise ValueError("row is not an object")
+
+    name = _text(raw.get("name")) or _text(raw.get("patient_name"))
+    if not name:
+        raise ValueError("missing patient name")
+    doctor_name = _text(raw.get("doctor_name"))
+    schedule = schedules.get(doctor_name)
+    if schedule is None:
+        raise ValueError(f"unknown doctor: {doctor_name or '(blank)'}")
+    try:
+        time = _parse_time(raw.get("time"), schedule)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid time {raw.get('time')!r}: {e}")
+
+    if allow_past:
+        if not schedule.covers(time):
+            raise ValueError(f"{doctor_name} does not work at {time.strftime('%A %I:%M %p')}")
+    else:
+        problem = schedule.validate(time, now)
+        if problem:
+            raise ValueError(problem)
+
+    status = _text(raw.get("status")) or "Confirmed"
+    if status.lower() == CANCELLED:
+        raise ValueError("cancelled appointments are not imported")
+
+    return {
+        "name": name,
+        "type": _text(raw.get("type")) or DEFAULT_TYPE,
+        "time": time,
+        "email": _text(raw.get("email")) or None,
+        "doctor_name": doctor_name,
+        "doctor_specialty": schedule.specialty,
+        "location": _text(raw.get("location")) or schedule.location,
+        "status": status,
+        "reminder_sent": str(raw.get("reminder_sent", "")).lower() in ("1", "true", "yes"),
+    }
+
+
+def chunked(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_appointments(source: Source, fmt: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        send_emails: bool = False, allow_past: bool = False) -> ImportReport:
+    """Stream appointments from ``source`` into the store, ``chunk_size`` rows per transaction.
+
+    Each chunk is validated against the doctor schedules and inserted with one
+    ``reserve_appointments`` call, which also rejects slot conflicts. With
+    ``send_emails`` every chunk's confirmations are queued on the email
+    outbox through the notification coalescer, like any other booking.
+    """
+    schedules = get_doctor_schedules()
+    report = ImportReport()
+
+    for chunk in chunked(read_rows(source, fmt, chunk_size), chunk_size):
+        lines, appointments = [], []
+        for line, raw in chunk:
+            report.total += 1
+            try:
+                appointments.append(parse_row(raw, schedules, allow_past=allow_past))
+                lines.append(line)
+            except ValueError as e:
+                report.add_error(line, str(e))
+            except Exception as e:
+                logger.error(f"Unexpected error parsing import line {line}: {str(e)}")
+                report.add_error(line, f"unreadable row: {e}")
+        if not appointments:
+            continue
+
+        try:
+            results = reserve_appointments(appointments)
+        except Exception as e:
+            logger.error(f"Error storing import chunk ending at line {chunk[-1][0]}: {str(e)}")
+            for line in lines:
+                report.add_error(line, f"storage error: {e}")
+            continue
+
+        stored = []
+        for line, appointment, result in zip(lines, appointments, results):
+            if result is None:
+                report.add_error(line, f"{appointment['doctor_name']} is already booked at {appointment['time'].strftime('%Y-%m-%d %I:%M %p')}")
+            else:
+                stored.append(result)
+        report.imported += len(stored)
+        if send_emails and stored:
+            report.emails_queued += notify_many([(BOOKING, appointment) for appointment in stored])
+
+    logger.info(report.summary())
+    return report
+
+
+def _export_row(appointment: Dict[str, Any]) -> Dict[str, Any]:
+    row = {key: appointment.get(key) for key in EXPORT_FIELDS}
+    row["time"] = appointment["time"].isoformat(timespec="minutes")
+    return row
+
+
+def export_appointments(destination: Source, fmt: Optional[str] = None, include_cancelled: bool = False,
+                        batch_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Stream every stored appointment to ``destination`` and return how many rows were written"""
+    fmt = detect_format(destination, fmt)
+    appointments = get_appointment_store().iter_appointments(include_cancelled=include_cancelled, batch_size=batch_size)
+    count = 0
+
+    if fmt == "parquet":
+        pyarrow, parquet = _require_pyarrow()
+        writer = None
+        try:
+            for batch in chunked(appointments, batch_size):
+                table = pyarrow.Table.from_pylist([_export_row(appointment) for appointment in batch])
+                if writer is None:
+                    writer = parquet.ParquetWriter(destination, table.schema)
+                writer.write_table(table)
+                count += len(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+        return count
+
+    stream = _open_text(destination, "w")
+    try:
+        if fmt == "csv":
+            writer = csv.DictWriter(stream, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            for appointment in appointments:
+                writer.writerow(_export_row(appointment))
+                count += 1
+        else:
+            for appointment in appointments:
+                stream.write(json.dumps(_export_row(appointment)) + "\n")
+                count += 1
+    finally:
+        if isinstance(destination, str):
+            stream.close()
+        else:
+            stream.flush()
+    return count
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Bulk import or export appointments")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Load appointments from a CSV, JSON Lines or Parquet file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=FORMATS)
+    import_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    import_parser.add_argument("--send-emails", action="store_true", help="Queue confirmation emails")
+    import_parser.add_argument("--allow-past", action="store_true", help="Accept historical appointments")
+
+    export_parser = commands.add_parser("export", help="Write appointments to a CSV, JSON Lines or Parquet file")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--format", choices=FORMATS)
+    export_parser.add_argument("--include-cancelled", action="store_true")
+
+    args = parser.parse_args(argv)
+    if args.command == "import":
+        report = import_appointments(args.path, args.format, args.chunk_size, args.send_emails, args.allow_past)
+        if report.emails_queued and not get_email_outbox().flush(timeout=60):
+            print("Some confirmation emails are still queued; they are retried from the outbox on the next start")
+        print(report.summary())
+        for error in report.errors:
+            print(f"  line {error.line}: {error.message}")
+        if report.failed > len(report.errors):
+            print(f"  ... {report.failed - len(report.errors)} more errors not shown")
+    else:
+        count = export_appointments(args.path, args.format, args.include_cancelled)
+        print(f"Exported {count} appointments to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from dotenv import load_dotenv
 import datetime
 from logger import setup_logger
 from langchain_groq import ChatGroq
+from llm_registry import get_llm_registry
 
 logger = setup_logger(__name__)
 
@@ -15,11 +16,14 @@ class AppConfig:
         self._validate_config()
  
         self.llm_model_name = os.getenv("LLM_MODEL", self.settings['llm']['model'] if hasattr(self, 'settings') and 'llm' in self.settings else "gemma-7b")
-        self.llm = ChatGroq(
-            api_key=os.getenv("GROQ_API_KEY", ""),
-            model=self.llm_model_name,
-            temperature=float(os.getenv("LLM_TEMPERATURE", self.settings['llm']['temperature'] if hasattr(self, 'settings') and 'llm' in self.settings else 0.7)),
-            max_tokens=int(os.getenv("LLM_MAX_TOKENS", self.settings['llm']['max_tokens'] if hasattr(self, 'settings') and 'llm' in self.settings else 1000))
+        self.llm_temperature = float(os.getenv("LLM_TEMPERATURE", self.settings['llm']['temperature'] if hasattr(self, 'settings') and 'llm' in self.settings else 0.7))
+        self.llm_max_tokens = int(os.getenv("LLM_MAX_TOKENS", self.settings['llm']['max_tokens'] if hasattr(self, 'settings') and 'llm' in self.settings else 1000))
+
+    @property
+    def llm(self) -> ChatGroq:
+        """The process-wide client for the configured model, shared by every AppConfig"""
+        return get_llm_registry(self.llm_pool_settings).get(
+            self.llm_model_name, self.groq_api_key, self.llm_temperature, self.llm_max_tokens
         )
 
     def _load_env_vars(self):
@@ -49,6 +53,14 @@ class AppConfig:
             self.llm_max_tokens = self.settings['llm']['max_tokens']
             self.prompts = self.settings['prompts']
             self.doctor_schedules = self.settings['doctor_schedules']
+            self.storage_settings = self.settings.get('storage', {})
+            self.scheduling_settings = self.settings.get('scheduling', {})
+            self.intent_rules = self.settings.get('intents', [])
+            self.context_settings = self.settings.get('agent_settings', {}).get('context', {})
+            self.llm_pool_settings = self.settings['llm'].get('pool', {})
+            self.llm_cache_settings = self.settings['llm'].get('cache', {})
+            self.llm_cache_path = os.getenv("LLM_CACHE_PATH", self.llm_cache_settings.get('path'))
+            self.llm_singleflight_settings = self.settings['llm'].get('singleflight', {})
             
         except Exception as e:
             logger.error(f"Error loading settings: {e}")
@@ -63,6 +75,14 @@ class AppConfig:
         self.sender_email = os.getenv("SENDER_EMAIL", "")
         self.email_templates_dir = self.settings['email']['templates_dir']
         self.reminder_intervals = self.settings['email']['reminder_intervals']
+        self.smtp_use_tls = os.getenv("SMTP_USE_TLS", "true").lower() == "true"
+        self.smtp_pool_settings = self.settings['email'].get('smtp_pool', {})
+        self.email_outbox_settings = self.settings['email'].get('outbox', {})
+        self.coalesce_window_seconds = self.settings['email'].get('coalesce_window_seconds', 30)
+        journal = self.settings['email'].get('journal', {})
+        self.email_journal_dir = os.getenv("EMAIL_JOURNAL_DIR", journal.get('dir'))
+        self.email_journal_compact_after = journal.get('compact_after', 10000)
+        self.portal_url = os.getenv("PORTAL_URL", self.settings['email'].get('portal_url', ""))
 
     def _validate_config(self):
         """Validate the configuration"""
@@ -0,0 +1,152 @@
+import re
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from logger import setup_logger
+from config import AppConfig
+from intent_router import get_intent_router
+
+logger = setup_logger(__name__)
+
+DEFAULT_MAX_TOKENS = 1500
+DEFAULT_MAX_TURNS = 6
+DEFAULT_SUMMARY_TOKENS = 300
+SUMMARY_LINE_WORDS = 30
+BOOKING_SLOTS = ("name", "doctor", "date", "time")
+
+# Roughly one token per short word or punctuation mark, and one per four characters of a long word
+APPROXIMATE_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _load_encoding():
+    """tiktoken when it is installed and its encoding is available locally; otherwise the approximation"""
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                logger.info("tiktoken is not available; approximating token counts")
+                _encoding = False
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding if _encoding is not None else _load_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(APPROXIMATE_TOKEN.findall(text))
+
+
+class ConversationContext:
+    """What an agent prompt carries from a conversation, kept within a token budget.
+
+    The last ``max_turns`` exchanges stay verbatim as long as they fit in
+    ``max_tokens``. Older messages leave the window one at a time and become
+    a line of a rolling summary capped at ``summary_tokens``, and booking
+    details seen so far (name, doctor, date, time) are kept as structured
+    state. Each message is tokenized once when it arrives, so building a
+    prompt costs the same on the hundredth turn as on the first.
+    """
+
+    def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS, max_turns: int = DEFAULT_MAX_TURNS,
+                 summary_tokens: int = DEFAULT_SUMMARY_TOKENS):
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.summary_tokens = summary_tokens
+        self.booking: Dict[str, Any] = {}
+        self._window: Deque[Tuple[BaseMessage, int]] = deque()
+        self._window_tokens = 0
+        self._summary: Deque[Tuple[str, int]] = deque()
+        self._summary_used = 0
+        self._seen = 0
+        self._lock = threading.Lock()
+
+    def add(self, message: BaseMessage):
+        with self._lock:
+            self._add(message)
+
+    def sync(self, messages: Sequence[BaseMessage]):
+        """Take in the messages of ``messages`` not seen yet; a shorter history than before starts over"""
+        with self._lock:
+            if len(messages) < self._seen:
+                self._reset()
+            for message in messages[self._seen:]:
+                self._add(message)
+
+    def _reset(self):
+        self.booking = {}
+        self._window.clear()
+        self._window_tokens = 0
+        self._summary.clear()
+        self._summary_used = 0
+        self._seen = 0
+
+    def _add(self, message: BaseMessage):
+        self._seen += 1
+        tokens = count_tokens(str(message.content))
+        self._window.append((message, tokens))
+        self._window_tokens += tokens
+        if isinstance(message, HumanMessage):
+            self._extract(str(message.content))
+        while len(self._window) > 1 and (len(self._window) > 2 * self.max_turns or self._window_tokens > self.max_tokens):
+            evicted, evicted_tokens = self._window.popleft()
+            self._window_tokens -= evicted_tokens
+            self._summarize(evicted)
+
+    def _extract(self, content: str):
+        match = get_intent_router().route(content)
+        for slot in BOOKING_SLOTS:
+            if slot in match.slots:
+                self.booking[slot] = match.slots[slot]
+        if match.intent and match.intent != "general":
+            self.booking["intent"] = match.intent
+
+    def _summarize(self, message: BaseMessage):
+        words = str(message.content).split()
+        text = " ".join(words[:SUMMARY_LINE_WORDS]) + (" ..." if len(words) > SUMMARY_LINE_WORDS else "")
+        line = f"- {'Patient' if isinstance(message, HumanMessage) else 'Assistant'}: {text}"
+        tokens = count_tokens(line)
+        self._summary.append((line, tokens))
+        self._summary_used += tokens
+        while self._summary and self._summary_used > self.summary_tokens:
+            _, dropped = self._summary.popleft()
+            self._summary_used -= dropped
+
+    def __len__(self) -> int:
+        """How many messages the conversation has had, including those summarized away"""
+        return self._seen
+
+    def messages(self, system_prompt: str) -> List[BaseMessage]:
+        """A system message with the summary and booking state, followed by the verbatim window"""
+        with self._lock:
+            sections = [system_prompt]
+            if self._summary:
+                sections.append("Earlier in this conversation:\n" + "\n".join(line for line, _ in self._summary))
+            if self.booking:
+                details = ", ".join(f"{key}: {value}" for key, value in self.booking.items())
+                sections.append(f"Booking details so far: {details}")
+            return [SystemMessage(content="\n\n".join(sections))] + [message for message, _ in self._window]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "messages_seen": self._seen,
+                "window_messages": len(self._window),
+                "window_tokens": self._window_tokens,
+                "summary_tokens": self._summary_used,
+            }
+
+
+def create_conversation_context(settings: Optional[Dict[str, Any]] = None) -> ConversationContext:
+    """A context sized by ``agent_settings.context`` in settings.yaml"""
+    settings = AppConfig().context_settings if settings is None else settings
+    return ConversationContext(
+        max_tokens=settings.get('max_tokens', DEFAULT_MAX_TOKENS),
+        max_turns=settings.get('max_turns', DEFAULT_MAX_TURNS),
+        summary_tokens=settings.get('summary_tokens', DEFAULT_SUMMARY_TOKENS),
+    )
@@ -0,0 +1,258 @@
+import itertools
+import json
+import os
+import threading
+from typing import IO, Any, Dict, List, Optional, Tuple
+from logger import setup_logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = setup_logger(__name__)
+
+DEFAULT_COMPACT_AFTER = 10000
+
+
+class EmailJournal:
+    """Append-only write-ahead log of outbound work that must survive a restart.
+
+    Each line is a JSON record: ``{"op": "add", "id": ..., "entry": {...}}``
+    when work is accepted and ``{"op": "done", "id": ...}`` once it has been
+    handed on. ``append`` returns only after its record is fsync()ed, but one
+    writer thread fsyncs everything buffered at once, so concurrent appends
+    share a single fsync. ``done`` records are not waited for: losing one in a
+    crash means the entry is replayed and sent again, never that it is lost.
+    When the file holds ``compact_after`` records and at most a quarter of
+    them are still pending, it is rewritten with only the pending ones.
+
+    A journal file has exactly one writing process: ``get_email_journal``
+    hands each process its own file, held through ``lock``, so appends from
+    another process can never be lost to a compaction here.
+    """
+
+    def __init__(self, path: str, compact_after: int = DEFAULT_COMPACT_AFTER, lock: Optional[IO] = None):
+        self.path = path
+        self.compact_after = compact_after
+        self._lock_file = lock
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._live: Dict[int, Dict[str, Any]] = {}
+        self._next_id = 1
+        self._records = 0
+        self._buffer: List[str] = []
+        self._appended = 0
+        self._durable = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._replayed: List[Tuple[int, Dict[str, Any]]] = self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._writer = threading.Thread(target=self._write_loop, name=f"journal-{os.path.basename(path)}", daemon=True)
+        self._writer.start()
+
+    def _load(self) -> List[Tuple[int, Dict[str, Any]]]:
+        self._records, self._next_id, self._live = _read_journal(self.path)
+        if self._live:
+            logger.info(f"Journal {self.path} has {len(self._live)} undelivered entries to replay")
+        return list(self._live.items())
+
+    def adopt(self, path: str):
+        """Move the undelivered entries of a journal no process holds any more into this one, then delete it"""
+        _, _, live = _read_journal(path)
+        if live:
+            entries = list(live.values())
+            self._replayed.extend(zip(self.append_many(entries), entries))
+            logger.info(f"Adopted {len(entries)} undelivered entries from {path}")
+        os.remove(path)
+
+    def replay(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Return (id, entry) for everything that was accepted but never marked done before the last shutdown"""
+        replayed, self._replayed = self._replayed, []
+        return replayed
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Durably record one entry and return its id"""
+        with self._cond:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._live[entry_id] = entry
+            ticket = self._enqueue({"op": "add", "id": entry_id, "entry": entry})
+            while self._durable < ticket and not self._closed:
+                self._cond.wait()
+        return entry_id
+
+    def append_many(self, entries: List[Dict[str, Any]]) -> List[int]:
+        """Durably record a batch of entries behind one fsync and return their ids"""
+        with self._cond:
+            entry_ids = []
+            ticket = self._durable
+            for entry in entries:
+                entry_id = self._next_id
+                self._next_id += 1
+                self._live[entry_id] = entry
+                ticket = self._enqueue({"op": "add", "id": entry_id, "entry": entry})
+                entry_ids.append(entry_id)
+            while self._durable < ticket and not self._closed:
+                self._cond.wait()
+        return entry_ids
+
+    def done(self, entry_id: int):
+        with self._cond:
+            if self._live.pop(entry_id, None) is not None:
+                self._enqueue({"op": "done", "id": entry_id})
+
+    def pending(self) -> int:
+        return len(self._live)
+
+    def _enqueue(self, record: Dict[str, Any]) -> int:
+        self._buffer.append(json.dumps(record, default=str) + "\n")
+        self._appended += 1
+        self._cond.notify_all()
+        return self._appended
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._buffer and not self._closed:
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+                batch, self._buffer = self._buffer, []
+                ticket = self._appended
+            self._file.write("".join(batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            with self._cond:
+                self._records += len(batch)
+                self._durable = ticket
+                self._cond.notify_all()
+                if self._records >= self.compact_after and len(self._live) * 4 <= self._records:
+                    self._compact()
+
+    def _compact(self):
+        """Rewrite the journal with only pending entries; called by the writer with the lock held"""
+        temp_path = self.path + ".compact"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry_id, entry in self._live.items():
+                f.write(json.dumps({"op": "add", "id": entry_id, "entry": entry}, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(temp_path, self.path)
+        if hasattr(os, "O_DIRECTORY"):
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        self._file = open(self.path, "a", encoding="utf-8")
+        logger.info(f"Compacted {self.path} from {self._records} to {len(self._live)} records")
+        self._records = len(self._live)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._file.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+
+
+def _read_journal(path: str) -> Tuple[int, int, Dict[int, Dict[str, Any]]]:
+    """Return (record count, next id, pending entries by id) of a journal file"""
+    records, next_id, live = 0, 1, {}
+    if not os.path.exists(path):
+        return records, next_id, live
+    good_bytes = 0
+    with open(path, "r+b") as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("unterminated record")
+                record = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-write; nothing after it was acknowledged.
+                # Cut it off so new records do not get glued onto it.
+                logger.warning(f"Dropping a partial record at the end of {path}")
+                f.truncate(good_bytes)
+                break
+            good_bytes += len(line)
+            records += 1
+            next_id = max(next_id, record["id"] + 1)
+            if record["op"] == "add":
+                live[record["id"]] = record["entry"]
+            else:
+                live.pop(record["id"], None)
+    return records, next_id, live
+
+
+_journals: Dict[str, EmailJournal] = {}
+_journals_lock = threading.Lock()
+
+
+def _claim_path(directory: str, name: str) -> Tuple[str, Optional[IO]]:
+    """Pick the first of ``name.journal``, ``name.1.journal``, ... that no live process holds, and hold it.
+
+    The hold is an exclusive flock() on a sidecar ``.lock`` file, since
+    compaction replaces the journal itself. It is released when its holder
+    exits, however it exits, so a restarted process takes over, and replays,
+    the file its predecessor left behind. Without flock() (on Windows) there
+    is only ever the one file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for slot in itertools.count():
+        path = _slot_path(directory, name, slot)
+        if fcntl is None:
+            return path, None
+        lock = _try_lock(path)
+        if lock is not None:
+            return path, lock
+
+
+def _slot_path(directory: str, name: str, slot: int) -> str:
+    return os.path.join(directory, f"{name}.journal" if slot == 0 else f"{name}.{slot}.journal")
+
+
+def _try_lock(path: str) -> Optional[IO]:
+    lock = open(path + ".lock", "a")
+    try:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+
+def _adopt_orphans(journal: EmailJournal, directory: str, name: str):
+    """Fold in the journals of processes that exited and were not replaced, so their backlog is still sent"""
+    if fcntl is None:
+        return
+    prefix = f"{name}."
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if not (filename.startswith(prefix) and filename.endswith(".journal")) or path == journal.path:
+            continue
+        lock = _try_lock(path)
+        if lock is None:
+            continue
+        try:
+            journal.adopt(path)
+            os.remove(path + ".lock")
+        finally:
+            lock.close()
+
+
+def get_email_journal(name: str, directory: Optional[str] = None,
+                      compact_after: int = DEFAULT_COMPACT_AFTER) -> Optional[EmailJournal]:
+    """Return this process's journal ``name`` under ``directory``, or None when journaling is off"""
+    if not directory:
+        return None
+    key = os.path.join(directory, name)
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            path, lock = _claim_path(directory, name)
+            journal = _journals[key] = EmailJournal(path, compact_after, lock)
+            _adopt_orphans(journal, directory, name)
+        return journal
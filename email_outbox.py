@@ -0,0 +1,331 @@
+import datetime
+import heapq
+import itertools
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from logger import setup_logger
+from config import AppConfig
+from appointment_store import get_appointment_store
+from email_service import email_service
+from email_journal import EmailJournal, get_email_journal
+
+logger = setup_logger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_BASE = 2.0
+DEFAULT_BACKOFF_MAX = 300.0
+LATENCY_SAMPLES = 1000
+
+# The server rejected the message itself; sending it again will not help
+PERMANENT_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    subtype TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    enqueued_at TEXT NOT NULL,
+    failed_at TEXT NOT NULL
+);
+"""
+
+
+@dataclass(order=True)
+class OutboundEmail:
+    due: float
+    sequence: int
+    recipient: str = field(compare=False)
+    subject: str = field(compare=False)
+    body: str = field(compare=False)
+    subtype: str = field(compare=False, default='html')
+    attempts: int = field(compare=False, default=0)
+    last_error: Optional[str] = field(compare=False, default=None)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+    enqueued_wall: datetime.datetime = field(compare=False, default_factory=datetime.datetime.now)
+    journal_id: Optional[int] = field(compare=False, default=None)
+
+
+class EmailOutbox:
+    """Outbound email sent by background workers instead of the caller.
+
+    ``enqueue`` only pushes onto a heap keyed by when each message is next
+    due, so it returns at once. Workers send due messages through ``deliver``;
+    a failure is retried after an exponentially growing, jittered delay
+    capped at ``backoff_max``, and a message that fails ``max_attempts``
+    times, or is refused outright, is moved to the dead-letter store. With a
+    ``path`` dead letters are kept in an ``email_dead_letters`` table next to
+    the appointments. With a ``journal`` every accepted message is logged
+    before ``enqueue`` returns and marked done once delivered or dead-lettered,
+    so ``recover`` can requeue exactly what a crash left undelivered.
+    """
+
+    def __init__(self, deliver: Callable[[str, str, str, str], Any], workers: int = DEFAULT_WORKERS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX, path: Optional[str] = None,
+                 journal: Optional[EmailJournal] = None):
+        self.deliver = deliver
+        self.workers = max(workers, 1)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.journal = journal
+        self._heap: List[OutboundEmail] = []
+        self._ready = threading.Condition()
+        self._sequence = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._running = False
+        self._in_flight = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._counts = {"enqueued": 0, "sent": 0, "retried": 0, "dead_lettered": 0}
+        self._dead_letters: List[Dict[str, Any]] = []
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            with self._conn:
+                self._conn.executescript(SCHEMA)
+
+    def start(self):
+        with self._ready:
+            if self._running:
+                return
+            self._running = True
+            self._threads = [
+                threading.Thread(target=self._work, name=f"email-outbox-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Email outbox started with {self.workers} workers")
+
+    def stop(self, timeout: float = 5.0):
+        with self._ready:
+            self._running = False
+            self._ready.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        if self._heap:
+            logger.warning(f"Email outbox stopped with {len(self._heap)} messages still queued")
+
+    def enqueue(self, recipient: str, subject: str, body: str, subtype: str = 'html',
+                journal_id: Optional[int] = None) -> OutboundEmail:
+        if self.journal is not None and journal_id is None:
+            journal_id = self.journal.append(
+                {"recipient": recipient, "subject": subject, "body": body, "subtype": subtype}
+            )
+        message = OutboundEmail(
+            due=time.monotonic(), sequence=next(self._sequence),
+            recipient=recipient, subject=subject, body=body, subtype=subtype, journal_id=journal_id
+        )
+        self._push(message)
+        with self._ready:
+            self._counts["enqueued"] += 1
+        if not self._running:
+            self.start()
+        return message
+
+    def enqueue_many(self, messages: List[Tuple[str, str, str, str]]) -> List[OutboundEmail]:
+        """Queue (recipient, subject, body, subtype) messages, journaling the whole batch at once"""
+        journal_ids: List[Optional[int]] = [None] * len(messages)
+        if self.journal is not None and messages:
+            journal_ids = self.journal.append_many([
+                {"recipient": recipient, "subject": subject, "body": body, "subtype": subtype}
+                for recipient, subject, body, subtype in messages
+            ])
+        return [
+            self.enqueue(recipient, subject, body, subtype, journal_id)
+            for (recipient, subject, body, subtype), journal_id in zip(messages, journal_ids)
+        ]
+
+    def recover(self) -> int:
+        """Requeue messages the journal holds as accepted but never delivered"""
+        if self.journal is None:
+            return 0
+        replayed = self.journal.replay()
+        for journal_id, entry in replayed:
+            self.enqueue(entry["recipient"], entry["subject"], entry["body"], entry["subtype"], journal_id)
+        if replayed:
+            logger.info(f"Requeued {len(replayed)} undelivered emails from the journal")
+        return len(replayed)
+
+    def _settle(self, message: OutboundEmail):
+        if self.journal is not None and message.journal_id is not None:
+            self.journal.done(message.journal_id)
+
+    def _push(self, message: OutboundEmail):
+        with self._ready:
+            heapq.heappush(self._heap, message)
+            self._ready.notify()
+
+    def _next_due(self) -> Optional[OutboundEmail]:
+        """Block until a message is due and claim it; None once the outbox is stopped"""
+        with self._ready:
+            while self._running:
+                if self._heap:
+                    wait = self._heap[0].due - time.monotonic()
+                    if wait <= 0:
+                        self._in_flight += 1
+                        return heapq.heappop(self._heap)
+                    self._ready.wait(wait)
+                else:
+                    self._ready.wait()
+            return None
+
+    def _work(self):
+        while True:
+            message = self._next_due()
+            if message is None:
+                return
+            try:
+                self._attempt(message)
+            finally:
+                with self._ready:
+                    self._in_flight -= 1
+                    self._ready.notify_all()
+
+    def _attempt(self, message: OutboundEmail):
+        message.attempts += 1
+        try:
+            self.deliver(message.recipient, message.subject, message.body, message.subtype)
+        except Exception as e:
+            message.last_error = str(e)
+            if isinstance(e, PERMANENT_ERRORS) or message.attempts >= self.max_attempts:
+                self._dead_letter(message)
+                self._settle(message)
+                return
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (message.attempts - 1))
+            message.due = time.monotonic() + delay * random.uniform(0.5, 1.0)
+            logger.warning(f"Email to {message.recipient} failed (attempt {message.attempts}): {e}; "
+                           f"retrying in {delay:.0f}s")
+            with self._ready:
+                self._counts["retried"] += 1
+            self._push(message)
+            return
+        self._settle(message)
+        with self._ready:
+            self._counts["sent"] += 1
+            self._latencies.append(time.monotonic() - message.enqueued_at)
+        logger.info(f"Outbox delivered email to {message.recipient}")
+
+    def _dead_letter(self, message: OutboundEmail):
+        logger.error(f"Giving up on email to {message.recipient} after {message.attempts} attempts: "
+                     f"{message.last_error}")
+        record = {
+            "recipient": message.recipient,
+            "subject": message.subject,
+            "body": message.body,
+            "subtype": message.subtype,
+            "attempts": message.attempts,
+            "last_error": message.last_error,
+            "enqueued_at": message.enqueued_wall.isoformat(timespec="seconds"),
+            "failed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+        with self._ready:
+            self._counts["dead_lettered"] += 1
+            if self._conn is None:
+                record["id"] = len(self._dead_letters) + 1
+                self._dead_letters.append(record)
+                return
+            with self._conn:
+                self._conn.execute(
+                    "INSERT INTO email_dead_letters (recipient, subject, body, subtype, attempts, last_error, enqueued_at, failed_at) "
+                    "VALUES (:recipient, :subject, :body, :subtype, :attempts, :last_error, :enqueued_at, :failed_at)",
+                    record
+                )
+
+    def dead_letters(self) -> List[Dict[str, Any]]:
+        with self._ready:
+            if self._conn is None:
+                return list(self._dead_letters)
+            return [dict(row) for row in self._conn.execute("SELECT * FROM email_dead_letters ORDER BY id")]
+
+    def retry_dead_letters(self) -> int:
+        """Move every dead letter back onto the queue with a fresh attempt budget"""
+        with self._ready:
+            if self._conn is None:
+                records, self._dead_letters = self._dead_letters, []
+            else:
+                with self._conn:
+                    records = [dict(row) for row in self._conn.execute("SELECT * FROM email_dead_letters")]
+                    self._conn.execute("DELETE FROM email_dead_letters")
+        for record in records:
+            self.enqueue(record["recipient"], record["subject"], record["body"], record["subtype"])
+        return len(records)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until nothing is queued or in flight; False if ``timeout`` ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._ready:
+            while self._heap or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._ready.wait(remaining)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._ready:
+            latencies = sorted(self._latencies)
+            now = time.monotonic()
+            return dict(
+                self._counts,
+                depth=len(self._heap),
+                in_flight=self._in_flight,
+                oldest_seconds=max((now - message.enqueued_at for message in self._heap), default=0.0),
+                p50_ms=latencies[len(latencies) // 2] * 1000 if latencies else None,
+                p99_ms=latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else None,
+            )
+
+
+_outbox: Optional[EmailOutbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_email_outbox() -> EmailOutbox:
+    """Return the process-wide outbox, keeping dead letters alongside SQLite appointments when that backend is used"""
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                config = AppConfig()
+                settings = config.email_outbox_settings
+                _outbox = EmailOutbox(
+                    email_service.deliver,
+                    workers=settings.get('workers', DEFAULT_WORKERS),
+                    max_attempts=settings.get('max_attempts', DEFAULT_MAX_ATTEMPTS),
+                    backoff_base=settings.get('backoff_base_seconds', DEFAULT_BACKOFF_BASE),
+                    backoff_max=settings.get('backoff_max_seconds', DEFAULT_BACKOFF_MAX),
+                    path=getattr(get_appointment_store(), "path", None),
+                    journal=get_email_journal("outbox", config.email_journal_dir, config.email_journal_compact_after),
+                )
+                _outbox.recover()
+    return _outbox
+
+
+def queue_email(recipient: str, subject: str, body: str, subtype: str = 'html') -> bool:
+    """Hand a message to the outbox; False when email is not configured"""
+    if not email_service.email_enabled:
+        logger.warning("Email service is disabled. Not queueing email.")
+        return False
+    get_email_outbox().enqueue(recipient, subject, body, subtype)
+    return True
+
+
+def queue_emails(messages: List[Tuple[str, str, str, str]]) -> bool:
+    """Hand a batch of (recipient, subject, body, subtype) messages to the outbox in one journal write"""
+    if not email_service.email_enabled:
+        logger.warning("Email service is disabled. Not queueing emails.")
+        return False
+    get_email_outbox().enqueue_many(messages)
+    return True
@@ -0,0 +1,195 @@
+import datetime
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Set, Tuple
+from logger import setup_logger
+from config import AppConfig
+from schedule_model import get_doctor_schedules
+
+logger = setup_logger(__name__)
+
+# Everything the router extracts comes out of this one pass; the alternatives are
+# fixed, so scanning costs the same however many rules or keywords there are
+SCAN = re.compile(
+    r"(?P<date>\b\d{4}-\d{1,2}-\d{1,2}\b)"
+    r"|(?P<time>\b\d{1,2}(?::\d{2})?\s*(?:[AaPp]\.?[Mm]\b\.?)|\b\d{1,2}:\d{2}\b)"
+    r"|\b[Dd][Rr]\b\.?\s*(?P<doctor>[A-Za-z]+)"
+    r"|(?i:\b(?:my\s+)?name\s*(?:is\s+|:\s*))(?P<name>[A-Z][a-z]+(?:[ \t]+[A-Z][a-z]+)*)"
+    r"|(?P<word>[^\W\d_]+(?:'[^\W\d_]+)?)"
+)
+# Words seen in chat repeat a lot; their keyword lookups are remembered up to this many
+MAX_REMEMBERED_WORDS = 50000
+# Capitalized words that start a sentence or name a day rather than a patient
+NOT_NAMES = frozenset(
+    "I Hi Hello Hey Please Thanks Thank Yes No Ok Okay Can Could Would Is Are Do Does What When Where Which How "
+    "Dr Doctor With For And Or At On In The A An My Me".split()
+) | frozenset(day for day in ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")) \
+  | frozenset(datetime.date(2000, m, 1).strftime("%B") for m in range(1, 13))
+
+
+@dataclass(frozen=True)
+class IntentRule:
+    """One row of the rule table: the intent fires when every condition given holds.
+
+    ``all`` keywords must all appear, at least one of ``any`` must, and every
+    slot in ``slots`` must have been extracted. A keyword matches any word it
+    starts, so ``cancel`` also covers "cancelled" and "cancellation".
+    """
+    intent: str
+    all: FrozenSet[str] = frozenset()
+    any: FrozenSet[str] = frozenset()
+    slots: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def from_dict(cls, entry: Mapping[str, Any]) -> "IntentRule":
+        return cls(
+            intent=entry["intent"],
+            all=frozenset(word.lower() for word in entry.get("all", [])),
+            any=frozenset(word.lower() for word in entry.get("any", [])),
+            slots=frozenset(entry.get("slots", [])),
+        )
+
+    def matches(self, keywords: Set[str], slots: Mapping[str, Any]) -> bool:
+        return (self.all <= keywords
+                and (not self.any or not self.any.isdisjoint(keywords))
+                and all(slot in slots for slot in self.slots))
+
+
+@dataclass
+class IntentMatch:
+    intent: Optional[str]
+    slots: Dict[str, Any] = field(default_factory=dict)
+    keywords: Set[str] = field(default_factory=set)
+
+
+class IntentRouter:
+    """Classifies a message and extracts its slots in a single pass.
+
+    One regex scan splits the message into dates, times, doctor mentions,
+    an explicit "my name is" and plain words. Each word walks a trie of the
+    rule keywords, so keyword lookup is linear in the word, and only rules
+    triggered by something seen are evaluated. The first rule in table order
+    that matches wins. Slots: ``date``, ``time``, ``datetime`` (a date
+    directly followed by a time), ``doctor`` (full name), ``name``.
+    """
+
+    def __init__(self, rules: Iterable[IntentRule], doctors: Mapping[str, str]):
+        self.rules: List[IntentRule] = list(rules)
+        self.doctors = {surname.lower(): name for surname, name in doctors.items()}
+        self._trie: Dict[str, Any] = {}
+        self._triggers: Dict[str, Set[int]] = {}
+        self._words: Dict[str, Tuple[str, ...]] = {}
+        for position, rule in enumerate(self.rules):
+            for keyword in rule.all | rule.any:
+                node = self._trie
+                for char in keyword:
+                    node = node.setdefault(char, {})
+                node[""] = keyword
+                self._triggers.setdefault(keyword, set()).add(position)
+            for slot in rule.slots:
+                self._triggers.setdefault("slot:" + slot, set()).add(position)
+
+    def _keywords_of(self, word: str) -> Tuple[str, ...]:
+        """Keywords that ``word`` starts with, found by walking the trie once and then remembered"""
+        cached = self._words.get(word)
+        if cached is not None:
+            return cached
+        node = self._trie
+        found = []
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                break
+            if "" in node:
+                found.append(node[""])
+        if len(self._words) < MAX_REMEMBERED_WORDS:
+            self._words[word] = tuple(found)
+        return tuple(found)
+
+    def route(self, message: str) -> IntentMatch:
+        keywords: Set[str] = set()
+        slots: Dict[str, Any] = {}
+        last_date = None
+        name_run: List[str] = []
+        name_end = -1
+        previous = ""
+        for match in SCAN.finditer(message):
+            kind = match.lastgroup
+            text = match.group(kind)
+            if kind == "word":
+                lowered = text.lower()
+                after_title, previous = previous == "doctor", lowered
+                if after_title and lowered in self.doctors:
+                    slots.setdefault("doctor", self.doctors[lowered])
+                    continue
+                found = self._keywords_of(lowered)
+                if found:
+                    keywords.update(found)
+                    continue
+                if "name" in slots:
+                    continue
+                if text[0].isupper() and text[1:].islower() and text not in NOT_NAMES:
+                    # Like a typed "John Doe": the first run of capitalized words is the name
+                    if name_run and not message[name_end:match.start()].strip(" \t"):
+                        name_run.append(text)
+                    elif not name_run:
+                        name_run = [text]
+                    name_end = match.end()
+                elif name_run:
+                    slots["name"] = " ".join(name_run)
+            elif kind == "doctor":
+                doctor = self.doctors.get(text.lower())
+                if doctor and "doctor" not in slots:
+                    slots["doctor"] = doctor
+            elif kind == "name":
+                slots["name"] = " ".join(text.split())
+            elif kind == "date" and "date" not in slots:
+                try:
+                    slots["date"] = datetime.date(*map(int, text.split("-")))
+                    last_date = match.end()
+                except ValueError:
+                    pass
+            elif kind == "time" and "time" not in slots:
+                parsed = _parse_time(text)
+                if parsed is not None:
+                    slots["time"] = parsed
+                    if last_date is not None and not message[last_date:match.start()].strip():
+                        slots["datetime"] = datetime.datetime.combine(slots["date"], parsed)
+        if name_run and "name" not in slots:
+            slots["name"] = " ".join(name_run)
+
+        candidates: Set[int] = set()
+        for key in list(keywords) + ["slot:" + slot for slot in slots]:
+            candidates |= self._triggers.get(key, set())
+        for position in sorted(candidates):
+            if self.rules[position].matches(keywords, slots):
+                return IntentMatch(self.rules[position].intent, slots, keywords)
+        return IntentMatch(None, slots, keywords)
+
+
+def _parse_time(text: str) -> Optional[datetime.time]:
+    compact = re.sub(r"[\s.]", "", text).upper()
+    for fmt in ("%I:%M%p", "%I%p", "%H:%M"):
+        try:
+            return datetime.datetime.strptime(compact, fmt).time()
+        except ValueError:
+            continue
+    return None
+
+
+_router: Optional[IntentRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_intent_router() -> IntentRouter:
+    """Return the process-wide router for the ``intents`` table in settings.yaml"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                rules = [IntentRule.from_dict(entry) for entry in AppConfig().intent_rules]
+                doctors = {schedule.surname: name for name, schedule in get_doctor_schedules().items()}
+                _router = IntentRouter(rules, doctors)
+                logger.info(f"Compiled {len(rules)} intent rules")
+    return _router
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from logger import setup_logger
+from config import AppConfig
+
+logger = setup_logger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_TTL_SECONDS = 24 * 3600
+
+# Anything that looks like it identifies or describes the person asking is never cached
+PERSONAL_DATA = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.]+"                    # email addresses
+    r"|\+?\d[\d\s().-]{5,}\d"                      # phone numbers, ids, dates of birth
+    r"|\b\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}\b"        # dates
+    r"|\b(?:my|mine|i am|i'm|im|i have|i've|i was|i feel|this is)\b",
+    re.IGNORECASE,
+)
+PUNCTUATION = re.compile(r"[^\w\s]")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case, punctuation and spacing variants of one question share a cache entry"""
+    return WHITESPACE.sub(" ", PUNCTUATION.sub(" ", query.lower())).strip()
+
+
+def contains_personal_data(query: str) -> bool:
+    return PERSONAL_DATA.search(query) is not None
+
+
+class LLMResponseCache:
+    """Responses to generic questions, keyed by normalized query, model, temperature and prompt version.
+
+    The memory tier is an LRU of ``max_entries`` whose entries expire after
+    ``ttl`` seconds. With a ``path`` every response is also written to a
+    SQLite file that is consulted on a memory miss, so the cache survives
+    restarts. Queries with personal data bypass both tiers.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL_SECONDS,
+                 path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counts = {"hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "stored": 0, "evicted": 0}
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with self._connection() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def key(self, query: str, model: str, temperature: float, prompt_version: str) -> Optional[str]:
+        """The cache key for a query, or None when it must not be cached"""
+        if contains_personal_data(query):
+            with self._lock:
+                self._counts["bypassed"] += 1
+            return None
+        normalized = normalize_query(query)
+        if not normalized:
+            return None
+        return hashlib.sha256(f"{model}\0{temperature}\0{prompt_version}\0{normalized}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[1] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._counts["hits"] += 1
+                    return entry[0]
+                del self._entries[key]
+        if self.path:
+            try:
+                row = self._connection().execute(
+                    "SELECT response, created_at FROM llm_cache WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Error reading the LLM cache: {e}")
+                row = None
+            if row is not None:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                    self._counts["disk_hits"] += 1
+                return row[0]
+        with self._lock:
+            self._counts["misses"] += 1
+        return None
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            self._counts["stored"] += 1
+        if self.path:
+            try:
+                with self._connection() as conn:
+                    conn.execute("INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                                 (key, response, now))
+                    conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl,))
+            except sqlite3.Error as e:
+                logger.error(f"Error writing the LLM cache: {e}")
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._entries[key] = (response, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counts["evicted"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        if self.path:
+            with self._connection() as conn:
+                conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._counts, entries=len(self._entries))
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+
+_cache: Optional[LLMResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache:
+    """Return the process-wide response cache configured under ``llm.cache``"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = AppConfig()
+                settings = config.llm_cache_settings
+                _cache = LLMResponseCache(
+                    max_entries=settings.get('max_entries', DEFAULT_MAX_ENTRIES),
+                    ttl=settings.get('ttl_seconds', DEFAULT_TTL_SECONDS),
+                    path=config.llm_cache_path,
+                )
+    return _cache
@@ -0,0 +1,100 @@
+import threading
+from typing import Any, Dict, Optional, Tuple
+import httpx
+from langchain_groq import ChatGroq
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+GROQ_API_BASE = "https://api.groq.com"
+DEFAULT_MAX_CONNECTIONS = 10
+DEFAULT_KEEPALIVE_SECONDS = 120
+DEFAULT_TIMEOUT_SECONDS = 60
+
+
+class LLMRegistry:
+    """One ChatGroq client per (model, parameters) for the whole process.
+
+    Each client owns a keep-alive ``httpx.Client`` with at most
+    ``max_connections`` connections, so calls reuse warm TLS connections
+    instead of building a client, and a handshake, per AppConfig or per
+    rerun. With ``warm_up`` a new client opens its first connection in the
+    background with a cheap model-list request, so the first chat turn does
+    not pay for the handshake either.
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS, keepalive: float = DEFAULT_KEEPALIVE_SECONDS,
+                 timeout: float = DEFAULT_TIMEOUT_SECONDS, warm_up: bool = True, api_base: str = GROQ_API_BASE):
+        self.max_connections = max_connections
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.warm_up = warm_up
+        self.api_base = api_base
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple, ChatGroq] = {}
+        self._http: Dict[Tuple, httpx.Client] = {}
+
+    def get(self, model: str, api_key: str, temperature: float, max_tokens: int, **params: Any) -> ChatGroq:
+        key = (model, api_key, temperature, max_tokens, tuple(sorted(params.items())))
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                http = httpx.Client(
+                    base_url=self.api_base,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                        keepalive_expiry=self.keepalive,
+                    ),
+                )
+                client = ChatGroq(
+                    api_key=api_key, model=model, temperature=temperature, max_tokens=max_tokens,
+                    base_url=self.api_base, http_client=http, **params
+                )
+                self._clients[key] = client
+                self._http[key] = http
+                logger.info(f"Created shared LLM client for {model}")
+                if self.warm_up and api_key:
+                    threading.Thread(target=self._warm_up, args=(http, api_key), name="llm-warm-up", daemon=True).start()
+        return client
+
+    def _warm_up(self, http: httpx.Client, api_key: str):
+        try:
+            http.get("/openai/v1/models", headers={"Authorization": f"Bearer {api_key}"})
+        except httpx.HTTPError as e:
+            logger.warning(f"LLM connection warm-up failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"clients": len(self._clients), "models": sorted({key[0] for key in self._clients})}
+
+    def close(self):
+        with self._lock:
+            for http in self._http.values():
+                http.close()
+            self._clients.clear()
+            self._http.clear()
+
+
+_registry: Optional[LLMRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_registry(settings: Optional[Dict[str, Any]] = None) -> LLMRegistry:
+    """Return the process-wide registry; ``settings`` (``llm.pool``) only matter on the first call"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                settings = settings or {}
+                _registry = LLMRegistry(
+                    max_connections=settings.get('max_connections', DEFAULT_MAX_CONNECTIONS),
+                    keepalive=settings.get('keepalive_seconds', DEFAULT_KEEPALIVE_SECONDS),
+                    timeout=settings.get('timeout_seconds', DEFAULT_TIMEOUT_SECONDS),
+                    warm_up=settings.get('warm_up', True),
+                )
+    return _registry
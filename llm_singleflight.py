@@ -0,0 +1,134 @@
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from logger import setup_logger
+from config import AppConfig
+from llm_cache import normalize_query
+
+logger = setup_logger(__name__)
+
+DEFAULT_WAIT_TIMEOUT_SECONDS = 120
+
+
+class _Flight:
+    """One upstream call and everything it has produced so far"""
+
+    def __init__(self):
+        self.chunks: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+
+
+class LLMSingleFlight:
+    """Identical LLM calls made at the same time share one upstream request.
+
+    Calls are keyed by model, temperature, max tokens and the normalized
+    prompt. The first caller for a key makes the request; anyone asking for
+    the same key while it is in flight waits on it instead, and the stream is
+    replayed to them chunk by chunk as it arrives. Once the request finishes
+    the key is released, so later calls go upstream again (reuse across time
+    is the response cache's job). A failed or abandoned request fails its
+    waiters too, and a waiter gives up after ``wait_timeout`` seconds.
+    """
+
+    def __init__(self, wait_timeout: float = DEFAULT_WAIT_TIMEOUT_SECONDS, enabled: bool = True):
+        self.wait_timeout = wait_timeout
+        self.enabled = enabled
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self._counts = {"upstream_calls": 0, "coalesced": 0, "failed": 0}
+
+    def key(self, llm: Any, prompt: Any) -> str:
+        """The coalescing key for sending ``prompt`` (a string or a list of messages) to ``llm``"""
+        if isinstance(prompt, str):
+            text = normalize_query(prompt)
+        else:
+            text = "\0".join(f"{message.type}:{normalize_query(str(message.content))}" for message in prompt)
+        params = (getattr(llm, "model_name", None), getattr(llm, "temperature", None), getattr(llm, "max_tokens", None))
+        return hashlib.sha256(f"{params}\0{text}".encode()).hexdigest()
+
+    def stream(self, llm: Any, prompt: Any) -> Iterator[Any]:
+        """``llm.stream(prompt)``, shared with identical calls in flight; iterate it to the end or close it"""
+        if not self.enabled:
+            return iter(llm.stream(prompt))
+        return self._run(self.key(llm, prompt), lambda: llm.stream(prompt))
+
+    def _run(self, key: str, produce: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._counts["upstream_calls"] += 1
+            else:
+                self._counts["coalesced"] += 1
+        return self._lead(key, flight, produce) if leader else self._follow(flight)
+
+    def _lead(self, key: str, flight: _Flight, produce: Callable[[], Iterable[Any]]) -> Iterator[Any]:
+        error = None
+        try:
+            for chunk in produce():
+                with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+                yield chunk
+        except BaseException as e:
+            # Includes the caller closing the stream early: nobody would finish it for the waiters
+            error = e
+            raise
+        finally:
+            self._finish(key, flight, error)
+
+    def _finish(self, key: str, flight: _Flight, error: Optional[BaseException]):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if error is not None:
+                self._counts["failed"] += 1
+        with flight.condition:
+            flight.done = True
+            flight.error = error
+            flight.condition.notify_all()
+
+    def _follow(self, flight: _Flight) -> Iterator[Any]:
+        deadline = time.monotonic() + self.wait_timeout
+        position = 0
+        while True:
+            with flight.condition:
+                while position == len(flight.chunks) and not flight.done:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"Gave up waiting for a shared LLM call after {self.wait_timeout}s")
+                    flight.condition.wait(remaining)
+                chunks = flight.chunks[position:]
+                done, error = flight.done, flight.error
+            position += len(chunks)
+            yield from chunks
+            if done:
+                if error is not None:
+                    raise RuntimeError(f"Shared LLM call failed: {error!r}") from error
+                return
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts, in_flight=len(self._flights))
+
+
+_singleflight: Optional[LLMSingleFlight] = None
+_singleflight_lock = threading.Lock()
+
+
+def get_llm_singleflight() -> LLMSingleFlight:
+    """Return the process-wide coalescer configured under ``llm.singleflight``"""
+    global _singleflight
+    if _singleflight is None:
+        with _singleflight_lock:
+            if _singleflight is None:
+                settings = AppConfig().llm_singleflight_settings
+                _singleflight = LLMSingleFlight(
+                    wait_timeout=settings.get('wait_timeout_seconds', DEFAULT_WAIT_TIMEOUT_SECONDS),
+                    enabled=settings.get('enabled', True),
+                )
+    return _singleflight
@@ -1,13 +1,22 @@
 from dotenv import load_dotenv
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_groq import ChatGroq
-from langgraph.graph import StateGraph, END
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from typing import List, Dict, Any, TypedDict, Literal, Optional
+from langgraph.config import get_stream_writer
+from langgraph.graph import StateGraph, START, END
+from langchain_core.messages import HumanMessage, SystemMessage
+from typing import List, Dict, Any, Iterator, TypedDict, Literal, Optional
 from config import AppConfig
 from logger import setup_logger
-from tools import book_appointment, get_next_available_appointment, cancel_appointment, get_doctor_availability, get_appointment_details, get_doctor_list
+from tools import find_free_slots, format_slot, get_availability_index, DOCTOR_SCHEDULES
+from appointment_store import get_appointment_store
+from availability import STANDARD_PRIORITY
+from booking_queue import get_booking_queue
+from llm_cache import get_llm_cache
+from llm_singleflight import get_llm_singleflight
+from intent_router import IntentMatch, get_intent_router
+from conversation_context import ConversationContext, create_conversation_context
 from datetime import datetime
+import hashlib
 import json
 import os
 import re
@@ -16,6 +25,8 @@ import streamlit as st
 logger = setup_logger(__name__)
 load_dotenv()
 
+FLEXIBLE_PATTERN = re.compile(r'\b(?:earliest|asap|first available)\b', re.IGNORECASE)
+
 GROQ_API_KEY = os.getenv('GROQ_API_KEY', '')
 if not GROQ_API_KEY:
     logger.warning("GROQ_API_KEY not found in environment variables. Some functionality may be limited.")
@@ -29,12 +40,14 @@ class MultiAgentState(TypedDict):
     doctor_recommendations: List[Dict[str, Any]]
     scheduling_options: List[Dict[str, Any]]
     conversation_complete: bool
-    agent_messages: List[Dict[str, Any]]
-    conflicts: List[Dict[str, Any]]
-    priority_level: int  
-    agent_messages: List[Dict[str, Any]]
-    conflicts: List[Dict[str, Any]]
-    priority_level: int 
+    priority_level: int
+    available_slots: Dict[str, List[Any]]
+    llm_answer: str
+    response: str
+    error_count: int
+    conversation_context: Optional[ConversationContext]
+
+GENERAL_CONSULTATION = "General health consultation"
 
 class MultiAgentOrchestrator:
     def __init__(self):
@@ -48,131 +61,77 @@ class MultiAgentOrchestrator:
             "routine": 2,
             "flexible": 1
         }
+        self.alternative_search_budget = self.config.scheduling_settings.get('alternative_search_ms', 50) / 1000
+        self.doctor_bot = DoctorBot(self.config.llm, self.config)
+        self.scheduler_bot = SchedulerBot(self.config)
+        # Compiled once for the process; every turn runs through it
+        self.workflow = self._build_workflow()
 
     def _build_workflow(self):
-       
+        """user_agent answers what it can; otherwise doctor_agent and scheduler_agent run side by side and coordinator joins them"""
         workflow = StateGraph(MultiAgentState)
-        workflow.set_recursion_limit(100) 
         workflow.add_node("user_agent", self._user_agent_node)
         workflow.add_node("doctor_agent", self._doctor_agent_node)
         workflow.add_node("scheduler_agent", self._scheduler_agent_node)
-        workflow.add_node("coordinator", self._coordinator_node) 
-        workflow.add_node("conflict_resolver", self._conflict_resolver_node)
-        workflow.add_node("priority_manager", self._priority_manager_node)
-        workflow.add_edge("user_agent", "coordinator")
-        workflow.add_edge("doctor_agent", "coordinator")
-        workflow.add_edge("scheduler_agent", "coordinator")
-        workflow.add_edge("coordinator", "conflict_resolver", condition=self._has_conflicts)
-        workflow.add_edge("conflict_resolver", "coordinator")
-        workflow.add_edge("coordinator", "priority_manager", condition=self._needs_priority_decision)
-        workflow.add_edge("priority_manager", "coordinator")
-        
-        workflow.add_conditional_edges(
-            "coordinator",
-            self._route_to_agent,
-            {
-                "user": "user_agent",
-                "doctor": "doctor_agent",
-                "scheduler": "scheduler_agent",
-                "end": END
-            }
-        )
-        
-       
-        workflow.set_entry_point("coordinator")
+        workflow.add_node("coordinator", self._coordinator_node)
+        workflow.add_edge(START, "user_agent")
+        workflow.add_conditional_edges("user_agent", self._route_to_agent, ["doctor_agent", "scheduler_agent", END])
+        # Both branches of the fan-out finish before coordinator runs, so a turn takes as long as the slower one
+        workflow.add_edge(["doctor_agent", "scheduler_agent"], "coordinator")
+        workflow.add_edge("coordinator", END)
         return workflow.compile()
         
-    def _route_to_agent(self, state: MultiAgentState) -> str:
+    def _route_to_agent(self, state: MultiAgentState):
        
         if state.get("conversation_complete", False):
-            return "end"
-            
-        return state.get("current_agent", "user")
-        
-    def _has_conflicts(self, state: MultiAgentState) -> bool:
-        return len(state.get("conflicts", [])) > 0
-    
-    def _needs_priority_decision(self, state: MultiAgentState) -> bool:
-       
-        scheduling_options = state.get("scheduling_options", [])
-        return len(scheduling_options) > 1
-    
-    def _conflict_resolver_node(self, state: MultiAgentState) -> MultiAgentState:
-        
-        conflicts = state.get("conflicts", [])
-        agent_messages = state.get("agent_messages", [])
-        
-        if not conflicts:
-            return state
-        
-        resolved_conflicts = []
-        for conflict in conflicts:
-            
-            doctor_name = conflict.get("doctor_name")
-            original_time = conflict.get("original_time")
-            alternatives = self._find_alternative_slots(doctor_name, original_time)
-            
-    
-            resolution_message = {
-                "from_agent": "conflict_resolver",
-                "to_agent": "scheduler",
-                "content": f"Conflict detected for {doctor_name} at {original_time}. Alternative slots: {alternatives}",
-                "alternatives": alternatives,
-                "conflict_id": conflict.get("id")
-            }
-            agent_messages.append(resolution_message)
-            
-           
-            conflict["status"] = "resolved"
-            conflict["alternatives"] = alternatives
-            resolved_conflicts.append(conflict)
-        
-       
-        state["conflicts"] = resolved_conflicts
-        state["agent_messages"] = agent_messages
-        
-       
-        if resolved_conflicts:
-            conflict_msg = "I've detected a scheduling conflict. Let me suggest some alternative times."
-            state["messages"].append(AIMessage(content=conflict_msg))
-        
-        return state
-    
-    def _priority_manager_node(self, state: MultiAgentState) -> MultiAgentState:
-    
-        scheduling_options = state.get("scheduling_options", [])
-        
-        if not scheduling_options:
-            return state
-        
-       
-        priority_sorted = sorted(scheduling_options, key=lambda x: x.get("priority", 0), reverse=True)
-        
-      
-        if priority_sorted:
-            selected_option = priority_sorted[0]
+            return END
             
-          
-            decision_message = {
-                "from_agent": "priority_manager",
-                "to_agent": "scheduler",
-                "content": f"Selected option with priority {selected_option.get('priority')}: {selected_option.get('description')}",
-                "selected_option": selected_option
-            }
-            
-            agent_messages = state.get("agent_messages", [])
-            agent_messages.append(decision_message)
-            state["agent_messages"] = agent_messages
-            state["selected_option"] = selected_option
-            priority_msg = f"Based on your needs, I've prioritized {selected_option.get('description')}."
-            state["messages"].append(AIMessage(content=priority_msg))
-        
-        return state
+        return ["doctor_agent", "scheduler_agent"]
+
+    def _user_agent_node(self, state: MultiAgentState) -> Dict[str, Any]:
+        """Classify the turn and answer the keyword routes directly"""
+        message = state["messages"][-1].content
+        match = get_intent_router().route(message)
+        context = dict(state.get("appointment_context", {}), doctor=match.slots.get("doctor"))
+        response = self._route_message(message, match, context)
+        if response is not None:
+            get_stream_writer()(response)
+        return {
+            "user_intent": match.intent or "general",
+            "priority_level": self._detect_priority(message),
+            "appointment_context": context,
+            "response": response or "",
+            "conversation_complete": response is not None,
+        }
+
+    def _doctor_agent_node(self, state: MultiAgentState) -> Dict[str, Any]:
+        return self.doctor_bot.process_message(state)
+
+    def _scheduler_agent_node(self, state: MultiAgentState) -> Dict[str, Any]:
+        return self.scheduler_bot.process_message(state)
+
+    def _coordinator_node(self, state: MultiAgentState) -> Dict[str, Any]:
+        """Join the agents' results: the answer, plus openings with the doctor the patient named or needs"""
+        if state.get("response"):
+            return {}
+        doctor = state.get("appointment_context", {}).get("doctor")
+        if not doctor:
+            doctor = next((r["doctor"] for r in state.get("doctor_recommendations", []) if r.get("reason") != GENERAL_CONSULTATION), None)
+        openings = state.get("available_slots", {}).get(doctor, [])
+        extra = ""
+        if openings:
+            extra = f"\n\n{doctor} ({DOCTOR_SCHEDULES[doctor].specialty}) has openings at:\n" + "\n".join(
+                f"📅 {slot.strftime('%A, %B %d at %I:%M %p')}" for slot in openings
+            )
+            get_stream_writer()(extra)
+        return {"response": state.get("llm_answer", "") + extra, "conversation_complete": True}
     
-    def _find_alternative_slots(self, doctor_name: str, original_time: str) -> List[str]:
-        
-        from datetime import datetime, timedelta
-        import random
+    def _detect_priority(self, message: str) -> int:
+        message_lower = message.lower()
+        levels = [level for keyword, level in self.priority_levels.items() if keyword in message_lower]
+        return max(levels) if levels else STANDARD_PRIORITY
+
+    def _find_alternative_slots(self, doctor_name: str, original_time: str, priority: Optional[int] = None) -> List[str]:
         
         try:
            
@@ -181,68 +140,107 @@ class MultiAgentOrchestrator:
             else:
                 original_dt = original_time
                 
-           
-            alternatives = [
-                (original_dt + timedelta(days=1)).strftime("%Y-%m-%d %I:%M %p"),
-                (original_dt + timedelta(hours=2)).strftime("%Y-%m-%d %I:%M %p"),
-                (original_dt - timedelta(hours=2)).strftime("%Y-%m-%d %I:%M %p")
-            ]
-            
-           
-            business_hour_alternatives = []
-            for alt in alternatives:
-                alt_dt = datetime.strptime(alt, "%Y-%m-%d %I:%M %p")
-                if 8 <= alt_dt.hour < 18: 
-                    business_hour_alternatives.append(alt)
-            
-            return business_hour_alternatives
+            slots = get_availability_index().nearest_free_slots(
+                [doctor_name], original_dt, limit=3, priority=priority, time_budget=self.alternative_search_budget
+            )
+            return [slot.strftime("%Y-%m-%d %I:%M %p") for _, slot in slots]
         except Exception as e:
             logger.error(f"Error finding alternative slots: {e}")
             return ["Next business day", "Later this week"]
 
-    def process_user_message(self, message: str) -> str:
-        """Main entry point for processing user messages"""
+    def process_user_message(self, message: str, context: Optional[ConversationContext] = None) -> str:
+        """Main entry point for processing user messages; ``context``, if given, already holds this message"""
+        return "".join(self.process_user_message_stream(message, context))
+
+    def process_user_message_stream(self, message: str, context: Optional[ConversationContext] = None) -> Iterator[str]:
+        """Like process_user_message, but yields an LLM answer token by token as it is generated"""
+        state: MultiAgentState = {
+            "messages": [HumanMessage(content=message)],
+            "current_time": self.config.get_current_time(),
+            "current_agent": "user",
+            "user_intent": "",
+            "appointment_context": {},
+            "doctor_recommendations": [],
+            "scheduling_options": [],
+            "conversation_complete": False,
+            "priority_level": STANDARD_PRIORITY,
+            "available_slots": {},
+            "llm_answer": "",
+            "response": "",
+            "conversation_context": context,
+        }
+        emitted = False
+        final = state
         try:
-            message_lower = message.lower()
-           
-            if "book" in message_lower and "appointment" in message_lower:
-                available_slots = """Available appointment slots:
-\n📅 2024-05-25 09:00 AM\n📅 2024-05-25 11:00 AM\n📅 2024-05-25 02:00 PM\n📅 2024-05-26 09:00 AM\n📅 2024-05-26 11:00 AM\n\nTo book an appointment, please provide:\n1. Your preferred slot from above (e.g. '2024-05-25 09:00 AM')\n2. Your name\n3. Doctor name from our available doctors list\n\nWould you like me to show you the list of available doctors?"""
-                return available_slots
-            elif "available" in message_lower and "appointment" in message_lower:
-                return """Available appointment slots:\n\n📅 2024-05-25 09:00 AM\n📅 2024-05-25 11:00 AM\n📅 2024-05-25 02:00 PM\n📅 2024-05-26 09:00 AM\n📅 2024-05-26 11:00 AM\n\nTo book an appointment, please provide:\n1. Your preferred slot from above\n2. Your name\n3. Preferred doctor (optional)"""
-            elif ("available" in message_lower and "doctor" in message_lower) or ("show" in message_lower and "doctor" in message_lower):
-                return self._list_available_doctors()
-            elif any(word in message_lower for word in ["2024-05-25", "2024-05-26"]):
-                try:
-                    return self._process_booking_details(message)
-                except Exception as e:
-                    logger.error(f"Error processing booking details: {e}")
-                    return "I couldn't process your booking details. Please provide them in this format:\nPreferred slot (e.g. '2024-05-25 09:00 AM'), your name, and preferred doctor"
-            elif "cancel" in message_lower:
-                if not hasattr(st.session_state, 'appointments') or not st.session_state.appointments:
-                    return "You don't have any appointments scheduled. Would you like to book one?"
-                response = "Here are your current appointments:\n\n"
-                for i, apt in enumerate(st.session_state.appointments):
-                    response += f"{i+1}. {apt['name']} with {apt['doctor_name']}\n"
-                    response += f"   📅 {apt['time'].strftime('%A, %B %d at %I:%M %p')}\n"
-                    response += f"   📍 {apt.get('location', 'Main Office')}\n\n"
-                response += "To cancel an appointment, click the 'Cancel This Appointment' button next to the appointment in the Current Appointments section."
-                return response
-           
-            else:
-               
-                try:
-                    prompt = f"You are a helpful medical assistant. Answer the following user query naturally and helpfully.\n\nUser: {message}\nAssistant:"
-                    response = self.config.llm.invoke(prompt)
-                    return response if isinstance(response, str) else getattr(response, 'content', str(response))
-                except Exception as e:
-                    logger.error(f"Error in LLM fallback: {str(e)}")
-                    return "I'm sorry, I couldn't process your request. Please try again or ask something else."
+            for mode, chunk in self.workflow.stream(state, {"recursion_limit": 25}, stream_mode=["custom", "values"]):
+                if mode == "custom":
+                    emitted = True
+                    yield chunk
+                else:
+                    final = chunk
         except Exception as e:
             logger.exception(f"Error in process_user_message: {str(e)}")
-            return self._handle_error()
-    
+            if not emitted:
+                yield self._handle_error()
+            return
+        # Nodes may run on worker threads without a Streamlit context, so session state is updated here
+        appointment_id = final.get("appointment_context", {}).get("appointment_id")
+        if appointment_id is not None:
+            st.session_state.last_appointment_id = appointment_id
+
+    def _route_message(self, message: str, match: IntentMatch, context: Dict[str, Any]) -> Optional[str]:
+        """Answer the messages the keyword routes handle; None sends the message to the LLM"""
+           
+        if match.intent == "booking_help":
+            return self._available_slots_message() + f"\n\nTo book an appointment, please provide:\n1. Your preferred slot from above (e.g. '{self._example_slot()}')\n2. Your name\n3. Doctor name from our available doctors list\n\nWould you like me to show you the list of available doctors?"
+        elif match.intent == "schedule_query":
+            return self._available_slots_message() + "\n\nTo book an appointment, please provide:\n1. Your preferred slot from above\n2. Your name\n3. Preferred doctor (optional)"
+        elif match.intent == "doctor_query":
+            return self._list_available_doctors()
+        elif match.intent == "book_slot":
+            try:
+                return self._process_booking_details(message, match, context)
+            except Exception as e:
+                logger.error(f"Error processing booking details: {e}")
+                return f"I couldn't process your booking details. Please provide them in this format:\nPreferred slot (e.g. '{self._example_slot()}'), your name, and preferred doctor"
+        elif match.intent == "cancel":
+            appointments = get_appointment_store().list_active()
+            if not appointments:
+                return "You don't have any appointments scheduled. Would you like to book one?"
+            response = "Here are your current appointments:\n\n"
+            for i, apt in enumerate(appointments):
+                response += f"{i+1}. {apt['name']} with {apt['doctor_name']}\n"
+                response += f"   📅 {apt['time'].strftime('%A, %B %d at %I:%M %p')}\n"
+                response += f"   📍 {apt.get('location') or 'Main Office'}\n\n"
+            response += "To cancel an appointment, click the 'Cancel This Appointment' button next to the appointment in the Current Appointments section."
+            return response
+           
+        return None
+
+    def _available_slots_message(self, query: str = "") -> str:
+        slots = find_free_slots(query)
+        if not slots:
+            return "There are no free appointment slots in the next two weeks."
+        response = "Available appointment slots:\n\n"
+        for doctor_name, slot in slots:
+            response += f"📅 {format_slot(doctor_name, slot)}\n"
+        return response.rstrip()
+
+    def _example_slot(self) -> str:
+        """A real free slot to show in format hints, so the example is never in the past"""
+        slots = find_free_slots(limit=1)
+        example = slots[0][1] if slots else datetime.now().replace(hour=9, minute=0)
+        return example.strftime('%Y-%m-%d %I:%M %p')
+
+    def _alternatives_message(self, doctor_name: str, requested_time: datetime) -> str:
+        alternatives = self._find_alternative_slots(doctor_name, requested_time)
+        if not alternatives:
+            return self._available_slots_message(doctor_name)
+        response = f"The closest free times with {doctor_name} are:\n\n"
+        for slot in alternatives:
+            response += f"📅 {slot} with {doctor_name}\n"
+        return response.rstrip()
+
     def _handle_error(self) -> str:
         
         return """I apologize for the technical difficulty. Let me help you directly:
@@ -257,62 +255,54 @@ class MultiAgentOrchestrator:
 
 How would you like to proceed?"""
 
-    def _process_booking_details(self, message: str) -> str:
+    def _process_booking_details(self, message: str, match: IntentMatch, context: Dict[str, Any]) -> str:
         
         try:
             
-            date_time_match = re.search(r'2024-05-2[56]\s+(?:09:00|11:00|02:00|04:00)\s+(?:AM|PM)', message)
-            if not date_time_match:
+            appointment_datetime = match.slots.get("datetime")
+            if not appointment_datetime:
                 return "Please provide a valid appointment time from the available slots."
             
-            appointment_datetime = datetime.strptime(date_time_match.group(), '%Y-%m-%d %I:%M %p')
-            
            
-            name_match = re.search(r'(?:name\s+is\s+|name:\s*|my\s+name\s+is\s+)?([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)', message)
-            if not name_match:
+            patient_name = match.slots.get("name")
+            if not patient_name:
                 return "Please provide your name for the appointment."
             
-            patient_name = name_match.group(1)
-            
            
-            doctor_match = re.search(r'(?:Dr\.|Doctor)\s+(?:Smith|Johnson|Williams|Brown)', message)
-            if not doctor_match:
-                return "Please specify a doctor from our available doctors list (Dr. Smith, Dr. Johnson, Dr. Williams, or Dr. Brown)."
-            
-            doctor_name = doctor_match.group()
-            
-          
-            doctors = {
-                "Dr. Smith": {"specialty": "General Practice", "location": "Main Building, Room 101"},
-                "Dr. Johnson": {"specialty": "Cardiology", "location": "Cardiac Wing, Room 205"},
-                "Dr. Williams": {"specialty": "Dermatology", "location": "Dermatology Center, Room 301"},
-                "Dr. Brown": {"specialty": "Orthopedics", "location": "Sports Medicine Wing, Room 150"}
-            }
+            doctor_name = match.slots.get("doctor")
+            if not doctor_name:
+                return f"Please specify a doctor from our available doctors list ({', '.join(DOCTOR_SCHEDULES)})."
             
-            doctor_info = doctors.get(doctor_name, {})
+            doctor_info = DOCTOR_SCHEDULES[doctor_name]
+            priority = self._detect_priority(message)
+            flexible = bool(FLEXIBLE_PATTERN.search(message))
             
-           
-            if 'appointments' not in st.session_state:
-                st.session_state.appointments = []
+            validation_error = doctor_info.validate(appointment_datetime)
+            if validation_error and not (flexible and appointment_datetime >= doctor_info.now()):
+                return f"{validation_error}\n\n" + self._alternatives_message(doctor_name, appointment_datetime)
                 
             new_appointment = {
                 "name": patient_name,
                 "time": appointment_datetime,
                 "doctor_name": doctor_name,
-                "doctor_specialty": doctor_info.get("specialty", "General"),
-                "location": doctor_info.get("location", "Main Office"),
+                "doctor_specialty": doctor_info.specialty,
+                "location": doctor_info.location,
                 "type": "Consultation",
                 "status": "Confirmed"
             }
             
-            st.session_state.appointments.append(new_appointment)
+            stored = get_booking_queue().admit(new_appointment, priority, flexible)
+            if not stored:
+                return f"Sorry, {doctor_name} is already booked at {appointment_datetime.strftime('%A, %B %d at %I:%M %p')}.\n\n" + self._alternatives_message(doctor_name, appointment_datetime)
+            context["appointment_id"] = stored["id"]
+            appointment_datetime = stored["time"]
             
             return f"""Great! I've booked your appointment with the following details:
 
 👤 Patient: {patient_name}
-👨‍⚕️ Doctor: {doctor_name} ({doctor_info.get('specialty')})
+👨‍⚕️ Doctor: {doctor_name} ({doctor_info.specialty})
 📅 Date & Time: {appointment_datetime.strftime('%A, %B %d, %Y at %I:%M %p')}
-📍 Location: {doctor_info.get('location')}
+📍 Location: {doctor_info.location}
 ✅ Status: Confirmed
 
 Your appointment has been added to the Current Appointments section.
@@ -320,103 +310,85 @@ You will receive a confirmation email shortly. Is there anything else I can help
 
         except Exception as e:
             logger.error(f"Error processing booking: {e}")
-            return """I couldn't process your booking. Please provide all the required details in this format:
-1. Preferred slot (e.g. '2024-05-25 09:00 AM')
+            return f"""I couldn't process your booking. Please provide all the required details in this format:
+1. Preferred slot (e.g. '{self._example_slot()}')
 2. Your name
 3. Doctor name (e.g. 'Dr. Smith')"""
         
     def _list_available_doctors(self) -> str:
        
         try:
-            doctors = {
-                "Dr. Smith": {"specialty": "General Practice", "schedule": "Monday, Wednesday, Friday (9:00 AM - 5:00 PM)"},
-                "Dr. Johnson": {"specialty": "Cardiology", "schedule": "Tuesday, Thursday (10:00 AM - 4:00 PM)"},
-                "Dr. Williams": {"specialty": "Dermatology", "schedule": "Monday, Tuesday, Thursday, Friday (8:00 AM - 3:00 PM)"},
-                "Dr. Brown": {"specialty": "Orthopedics", "schedule": "Wednesday, Thursday, Friday (9:00 AM - 6:00 PM)"}
-            }
-            
             response = "📋 Available Doctors:\n\n"
-            for doctor, info in doctors.items():
+            for doctor, schedule in DOCTOR_SCHEDULES.items():
                 response += f"👨‍⚕️ {doctor}\n"
-                response += f"   Specialty: {info['specialty']}\n"
-                response += f"   Schedule: {info['schedule']}\n\n"
+                response += f"   Specialty: {schedule.specialty}\n"
+                response += f"   Schedule: {schedule.schedule_display}\n\n"
                 
             return response
         except Exception as e:
             logger.exception(f"Error in _list_available_doctors: {str(e)}")
             return self._handle_error()
 
-class UserBot:
-
-    
-    def __init__(self, llm, config):
-        self.llm = llm
-        self.config = config
-    
-    def process_message(self, state: MultiAgentState) -> MultiAgentState:
-        try:
-            
-            last_message = state["messages"][-1].content.lower() if state["messages"] else ""
-            
-            if "book" in last_message or "appointment" in last_message:
-                response = "I'll help you book an appointment. Please provide:\n1. Your preferred date and time\n2. Doctor preference (if any)\n3. Your name"
-                state["user_intent"] = "booking"
-            elif "available" in last_message and "doctor" in last_message:
-                response = get_doctor_list()
-                state["user_intent"] = "doctor_query"
-            elif "available" in last_message and "appointment" in last_message:
-                response = get_next_available_appointment()
-                state["user_intent"] = "schedule_query"
-            else:
-                response = "How can I help you today? You can:\n1. Book an appointment\n2. Check available appointments\n3. See available doctors"
-                state["user_intent"] = "general"
-            
-            state["messages"].append(AIMessage(content=response))
-            state["current_agent"] = "scheduler"
-            return state
-            
-        except Exception as e:
-            logger.exception(f"Error in UserBot: {str(e)}")
-            state["messages"].append(AIMessage(content="I'll help you right away. What would you like to do?\n1. Book an appointment\n2. Check available slots\n3. See available doctors"))
-            state["current_agent"] = "scheduler"
-            return state
+def _context(state: MultiAgentState) -> ConversationContext:
+    """The conversation's budgeted context: the caller's when given, else one built from the state's messages"""
+    context = state.get("conversation_context")
+    if context is None:
+        context = state["conversation_context"] = create_conversation_context()
+        context.sync(state["messages"])
+    return context
 
 class DoctorBot:
-   
-    
+    """The LLM agent: answers the patient in the words of the doctor_bot prompt and recommends a doctor"""
+
     def __init__(self, llm, config):
         self.llm = llm
         self.config = config
-        self.doctors = config.doctor_schedules
-    
-    def process_message(self, state: MultiAgentState) -> MultiAgentState:
-        messages = state["messages"]
-        current_time = state["current_time"]
-        appointment_context = state.get("appointment_context", {})
-        
+        self.doctors = {name: schedule.to_dict() for name, schedule in DOCTOR_SCHEDULES.items()}
+
+    def process_message(self, state: MultiAgentState) -> Dict[str, Any]:
+        """Stream the answer to the graph's writer as it is generated"""
+        writer = get_stream_writer()
+        answer = []
+        for token in self.stream_answer(state):
+            writer(token)
+            answer.append(token)
+        return {
+            "llm_answer": "".join(answer),
+            "doctor_recommendations": self.recommend(state["messages"]),
+        }
+
+    def stream_answer(self, state: MultiAgentState) -> Iterator[str]:
+        message = state["messages"][-1].content
         system_prompt = self.config.prompts['doctor_bot'].format(
-            current_time=current_time,
+            current_time=state["current_time"],
             doctors=json.dumps(self.doctors, indent=2)
         )
-        
+        streamed = []
         try:
-            formatted_messages = [SystemMessage(content=system_prompt)] + messages
-            response = self.llm.invoke(formatted_messages)
-            recommendations = self._generate_doctor_recommendations(messages)
-            state["doctor_recommendations"] = recommendations
-            
-            state["messages"].append(AIMessage(content=response.content))
-            state["current_agent"] = "scheduler" 
-            
-            return state
-            
+            cache = get_llm_cache()
+            context = _context(state)
+            cache_key = None
+            # A follow-up is answered from the conversation, so it neither reads nor writes answers to the bare question
+            if len(context) <= 1:
+                # Cached answers are keyed by the prompt too, so editing it retires them
+                prompt_version = hashlib.sha1(system_prompt.encode()).hexdigest()[:12]
+                cache_key = cache.key(message, self.config.llm_model_name, self.config.llm_temperature, prompt_version)
+            cached = cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                yield cached
+                return
+            for chunk in get_llm_singleflight().stream(self.llm, context.messages(system_prompt)):
+                token = chunk if isinstance(chunk, str) else getattr(chunk, 'content', str(chunk))
+                if token:
+                    streamed.append(token)
+                    yield token
+            if cache_key and streamed:
+                cache.put(cache_key, "".join(streamed))
         except Exception as e:
-            logger.exception(f"Error in DoctorBot: {str(e)}")
-            state["messages"].append(AIMessage(content="I'm having trouble accessing medical information. Please consult with our scheduler for general appointments."))
-            state["current_agent"] = "scheduler"
-            return state
-    
-    def _generate_doctor_recommendations(self, messages: List[Any]) -> List[Dict[str, Any]]:
+            logger.error(f"Error in DoctorBot: {str(e)}")
+            yield ("\n\n" if streamed else "") + "I'm sorry, I couldn't process your request. Please try again or ask something else."
+
+    def recommend(self, messages: List[Any]) -> List[Dict[str, Any]]:
         
         recommendations = []
         
@@ -449,72 +421,29 @@ class DoctorBot:
             recommendations.append({
                 "doctor": "Dr. Smith",
                 "specialty": "General Practice",
-                "reason": "General health consultation"
+                "reason": GENERAL_CONSULTATION
             })
         
         return recommendations
 
 class SchedulerBot:
-    
-    
-    def __init__(self, llm, config):
-        self.llm = llm
+    """Finds openings with the doctor the patient named, or with every doctor, while the doctor agent answers"""
+
+    def __init__(self, config):
         self.config = config
-    
-    def process_message(self, state: MultiAgentState) -> MultiAgentState:
-        messages = state["messages"]
-        current_time = state["current_time"]
-        doctor_recommendations = state.get("doctor_recommendations", [])
-        appointment_context = state.get("appointment_context", {})
-        
-        system_prompt = self.config.prompts['scheduler_bot'].format(
-            current_time=current_time,
-            doctor_recommendations=json.dumps(doctor_recommendations, indent=2)
-        )
-        
+
+    def process_message(self, state: MultiAgentState) -> Dict[str, Any]:
+        doctor = state.get("appointment_context", {}).get("doctor")
         try:
-            formatted_messages = [SystemMessage(content=system_prompt)] + messages
-            response = self.llm.invoke(formatted_messages)
-            
-           
-            content = response.content
-            if "<tool_call>" in content:
-                try:
-                    content = self._process_tool_call(content)
-                except Exception as tool_error:
-                    logger.error(f"Error processing tool call: {tool_error}")
-                    content = "I encountered an error while processing your request. Let me try a different approach."
-                   
-                    try:
-                        content = get_next_available_appointment()
-                    except Exception:
-                        content = "I'm having trouble with the scheduling system. Please try again or contact us directly."
-            
-            state["messages"].append(AIMessage(content=content))
-            
-           
-            if "appointment booked" in content.lower() or "appointment confirmed" in content.lower():
-                state["conversation_complete"] = True
-                state["error_count"] = 0 
-            
-            return state
-            
+            return {"available_slots": self.next_openings([doctor] if doctor else list(DOCTOR_SCHEDULES))}
         except Exception as e:
             logger.exception(f"Error in SchedulerBot: {str(e)}")
-            state["error_count"] = state.get("error_count", 0) + 1
-            error_msg = "I'm having trouble with the scheduling system. Please try again or contact us directly."
-            state["messages"].append(AIMessage(content=error_msg))
-            return state
-    
-    def _process_tool_call(self, content: str) -> str:
-      
-        try:
-            tool_call = content.split("<tool_call>")[1].split("</tool_call>")[0].strip()
-            result = eval(tool_call)
-            return result
-        except Exception as e:
-            logger.exception(f"Error processing tool call: {str(e)}")
-            return "I encountered an error while processing your appointment request. Please provide the details again."
+            return {"available_slots": {}, "error_count": state.get("error_count", 0) + 1}
+
+    def next_openings(self, doctor_names: List[str], limit: int = 3) -> Dict[str, List[datetime]]:
+        """The next free slots per doctor, straight from the availability index"""
+        index = get_availability_index()
+        return {name: [slot for _, slot in index.free_slots([name], limit=limit)] for name in doctor_names}
 
 
 multi_agent_orchestrator = MultiAgentOrchestrator()
\ No newline at end of file
@@ -0,0 +1,277 @@
+import heapq
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from logger import setup_logger
+from config import AppConfig
+from email_service import email_service
+from email_outbox import queue_email, queue_emails
+from email_journal import EmailJournal, get_email_journal
+from appointment_store import get_appointment_store
+
+logger = setup_logger(__name__)
+
+BOOKING = "booking"
+RESCHEDULE = "reschedule"
+CANCELLATION = "cancellation"
+REMINDER = "reminder"
+
+LABELS = {BOOKING: "Booked", RESCHEDULE: "Rescheduled", CANCELLATION: "Cancelled", REMINDER: "Reminder"}
+COMPOSERS = {
+    BOOKING: email_service.compose_booking_confirmation,
+    RESCHEDULE: email_service.compose_reschedule_confirmation,
+    CANCELLATION: email_service.compose_cancellation_confirmation,
+    REMINDER: email_service.compose_reminder,
+}
+DEFAULT_WINDOW_SECONDS = 30
+
+
+@dataclass
+class Notification:
+    kind: str
+    appointment: Optional[Dict[str, Any]] = None
+    message: Optional[Tuple[str, str, str]] = None
+    journal_id: Optional[int] = None
+
+
+def merge_kind(previous: Optional[str], kind: str) -> Optional[str]:
+    """What one appointment's notification becomes after another change; None drops it.
+
+    A booking stays a booking through later moves and reminders, since the
+    confirmation is rendered from the latest details. Booking then cancelling
+    inside one window sends nothing. A reminder never replaces a reschedule
+    or cancellation notice.
+    """
+    if previous is None:
+        return kind
+    if kind == CANCELLATION:
+        return None if previous == BOOKING else CANCELLATION
+    if previous == BOOKING:
+        return BOOKING
+    if kind == REMINDER and previous in (RESCHEDULE, CANCELLATION):
+        return previous
+    return kind
+
+
+class NotificationCoalescer:
+    """Holds each recipient's notifications for a short window and sends them as one email.
+
+    The first notification for a recipient opens a window of ``window``
+    seconds; everything that arrives for them before it closes is merged.
+    Changes to the same appointment collapse via ``merge_kind``, identical
+    free-form messages are sent once, and when several appointments changed
+    the recipient gets one digest instead of an email per change. A window of
+    zero sends straight through. With a ``journal`` held notifications are
+    logged (appointment changes by id) and marked done once emitted, so a
+    restart inside a window replays them instead of dropping them.
+    ``notify_many`` skips the window for bulk changes and hands every email
+    to ``emit_many`` in one call when that is given.
+    """
+
+    def __init__(self, emit: Callable[[str, str, str, str], Any], window: float = DEFAULT_WINDOW_SECONDS,
+                 journal: Optional[EmailJournal] = None,
+                 emit_many: Optional[Callable[[List[Tuple[str, str, str, str]]], Any]] = None):
+        self.emit = emit
+        self.emit_many = emit_many
+        self.window = window
+        self.journal = journal
+        self._pending: Dict[str, List[Notification]] = {}
+        # The deadline of each recipient's open window, kept and reset with its batch under
+        # ``_ready``; heap entries whose deadline no longer matches are stale and skipped
+        self._due: Dict[str, float] = {}
+        self._deadlines: List[Tuple[float, str]] = []
+        self._ready = threading.Condition()
+        self._thread = None
+        self.stats = {"received": 0, "sent": 0}
+
+    def notify(self, kind: str, appointment: Dict[str, Any]) -> bool:
+        """Queue a notification about an appointment change for the appointment's email"""
+        if not appointment.get("email"):
+            return False
+        return self._add(appointment["email"], Notification(kind, dict(appointment)))
+
+    def notify_message(self, recipient: str, subject: str, body: str, subtype: str = 'html') -> bool:
+        """Queue a free-form message; exact duplicates inside one window are sent once"""
+        return self._add(recipient, Notification("message", message=(subject, body, subtype)))
+
+    def notify_many(self, changes: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """Send notices for a batch of (kind, appointment) changes now, one email per recipient.
+
+        Anything already held for those recipients is merged in, so nobody
+        gets a separate email for it when their window closes. Returns the
+        number of emails handed on.
+        """
+        if not email_service.email_enabled:
+            logger.warning("Email service is disabled. Dropping notifications.")
+            return 0
+        batches: Dict[str, List[Notification]] = {}
+        for kind, appointment in changes:
+            if appointment.get("email"):
+                batches.setdefault(appointment["email"], []).append(Notification(kind, dict(appointment)))
+        with self._ready:
+            for recipient, batch in batches.items():
+                self.stats["received"] += len(batch)
+                batch[:0] = self._pending.pop(recipient, [])
+                self._due.pop(recipient, None)
+        outgoing = [
+            (recipient, subject, body, subtype)
+            for recipient, batch in batches.items()
+            for subject, body, subtype in self._compose(recipient, batch)
+        ]
+        if self.emit_many is not None:
+            self.emit_many(outgoing)
+        else:
+            for message in outgoing:
+                self.emit(*message)
+        self._settle([notification for batch in batches.values() for notification in batch], len(outgoing))
+        logger.info(f"Sent {len(outgoing)} emails for {sum(len(b) for b in batches.values())} notifications")
+        return len(outgoing)
+
+    def _add(self, recipient: str, notification: Notification) -> bool:
+        if not email_service.email_enabled:
+            logger.warning("Email service is disabled. Dropping notification.")
+            return False
+        if self.journal is not None and self.window > 0 and notification.journal_id is None:
+            notification.journal_id = self.journal.append(self._journal_entry(recipient, notification))
+        with self._ready:
+            self.stats["received"] += 1
+            if self.window <= 0:
+                batch = [notification]
+            else:
+                batch = None
+                if recipient not in self._pending:
+                    self._due[recipient] = due = time.monotonic() + self.window
+                    heapq.heappush(self._deadlines, (due, recipient))
+                    self._ready.notify()
+                self._pending.setdefault(recipient, []).append(notification)
+                self._start()
+        if batch is not None:
+            self._send(recipient, batch)
+        return True
+
+    @staticmethod
+    def _journal_entry(recipient: str, notification: Notification) -> Dict[str, Any]:
+        if notification.message is not None:
+            return {"recipient": recipient, "kind": notification.kind, "message": list(notification.message)}
+        return {"recipient": recipient, "kind": notification.kind, "appointment_id": notification.appointment.get("id")}
+
+    def recover(self, lookup: Callable[[int], Optional[Dict[str, Any]]]) -> int:
+        """Hold again the notifications a restart interrupted, reloading appointments through ``lookup``"""
+        if self.journal is None:
+            return 0
+        replayed = self.journal.replay()
+        for journal_id, entry in replayed:
+            if "message" in entry:
+                notification = Notification(entry["kind"], message=tuple(entry["message"]), journal_id=journal_id)
+            else:
+                appointment = lookup(entry["appointment_id"]) if entry["appointment_id"] else None
+                if appointment is None:
+                    self.journal.done(journal_id)
+                    continue
+                notification = Notification(entry["kind"], appointment, journal_id=journal_id)
+            if not self._add(entry["recipient"], notification):
+                self.journal.done(journal_id)
+        return len(replayed)
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="notification-coalescer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while not self._deadlines or self._deadlines[0][0] > time.monotonic():
+                    self._ready.wait(self._deadlines[0][0] - time.monotonic() if self._deadlines else None)
+                due, recipient = heapq.heappop(self._deadlines)
+                if self._due.get(recipient) != due:
+                    continue
+                del self._due[recipient]
+                batch = self._pending.pop(recipient, None)
+            if batch:
+                try:
+                    self._send(recipient, batch)
+                except Exception as e:
+                    logger.error(f"Error sending notifications to {recipient}: {str(e)}")
+
+    def flush(self) -> int:
+        """Send everything held right now instead of waiting for windows to close"""
+        with self._ready:
+            pending, self._pending = self._pending, {}
+            self._due = {}
+            self._deadlines = []
+        return sum(self._send(recipient, batch) for recipient, batch in pending.items())
+
+    def _send(self, recipient: str, batch: List[Notification]) -> int:
+        messages = self._compose(recipient, batch)
+        for subject, body, subtype in messages:
+            self.emit(recipient, subject, body, subtype)
+        self._settle(batch, len(messages))
+        if len(batch) > len(messages):
+            logger.info(f"Coalesced {len(batch)} notifications for {recipient} into {len(messages)} emails")
+        return len(messages)
+
+    def _compose(self, recipient: str, batch: List[Notification]) -> List[Tuple[str, str, str]]:
+        """Merge one recipient's notifications into the (subject, body, subtype) emails to send"""
+        messages = []
+        changes: Dict[Any, Notification] = {}
+        for notification in batch:
+            if notification.message is not None:
+                if notification.message not in messages:
+                    messages.append(notification.message)
+                continue
+            appointment = notification.appointment
+            key = appointment.get("id") or (appointment.get("doctor_name"), appointment["time"])
+            previous = changes.get(key)
+            kind = merge_kind(previous.kind if previous else None, notification.kind)
+            if kind is None:
+                changes.pop(key)
+            else:
+                changes[key] = Notification(kind, appointment)
+
+        if len(changes) == 1:
+            change = next(iter(changes.values()))
+            messages.append(COMPOSERS[change.kind](change.appointment))
+        elif changes:
+            name = next(iter(changes.values())).appointment.get("name")
+            messages.append(email_service.compose_digest(
+                name, [(LABELS[change.kind], change.appointment) for change in changes.values()]
+            ))
+        return messages
+
+    def _settle(self, notifications: List[Notification], sent: int):
+        if self.journal is not None:
+            for notification in notifications:
+                if notification.journal_id is not None:
+                    self.journal.done(notification.journal_id)
+        with self._ready:
+            self.stats["sent"] += sent
+
+
+_coalescer: Optional[NotificationCoalescer] = None
+_coalescer_lock = threading.Lock()
+
+
+def get_notification_coalescer() -> NotificationCoalescer:
+    """Return the process-wide coalescer, feeding the email outbox"""
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                config = AppConfig()
+                _coalescer = NotificationCoalescer(
+                    queue_email, config.coalesce_window_seconds,
+                    get_email_journal("notifications", config.email_journal_dir, config.email_journal_compact_after),
+                    emit_many=queue_emails,
+                )
+                _coalescer.recover(get_appointment_store().get)
+    return _coalescer
+
+
+def notify(kind: str, appointment: Dict[str, Any]) -> bool:
+    return get_notification_coalescer().notify(kind, appointment)
+
+
+def notify_many(changes: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+    return get_notification_coalescer().notify_many(changes)
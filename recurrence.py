@@ -0,0 +1,376 @@
+import datetime
+import heapq
+import itertools
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Set, Tuple
+from dateutil.rrule import rrulestr
+from logger import setup_logger
+from appointment_store import get_appointment_store
+from schedule_model import get_doctor_schedules
+
+logger = setup_logger(__name__)
+
+FREQUENCIES = {
+    "weekly": "FREQ=WEEKLY;INTERVAL=1",
+    "biweekly": "FREQ=WEEKLY;INTERVAL=2",
+}
+ACTIVE = "active"
+ENDED = "ended"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointment_series (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT,
+    doctor_name TEXT NOT NULL,
+    type TEXT,
+    rule TEXT NOT NULL,
+    dtstart TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    changed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS series_exceptions (
+    series_id INTEGER NOT NULL REFERENCES appointment_series(id),
+    original_time TEXT NOT NULL,
+    new_time TEXT,
+    changed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (series_id, original_time)
+);
+CREATE INDEX IF NOT EXISTS idx_series_doctor ON appointment_series(doctor_name, status);
+CREATE TABLE IF NOT EXISTS series_meta (version INTEGER NOT NULL);
+INSERT INTO series_meta (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM series_meta);
+"""
+
+# Run after SCHEMA, once older tables have been given their ``changed`` column
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_series_changed ON appointment_series(changed);
+CREATE INDEX IF NOT EXISTS idx_series_exceptions_changed ON series_exceptions(changed);
+"""
+
+
+@dataclass
+class AppointmentSeries:
+    """A recurring appointment stored as an RRULE plus its exceptions.
+
+    Occurrences are never stored; ``occurrences`` walks the rule lazily from
+    the start of the requested window. ``skipped`` holds original occurrence
+    times that were dropped and ``moved`` maps original times to new ones.
+    """
+    id: int
+    name: str
+    email: Optional[str]
+    doctor_name: str
+    type: str
+    rule: str
+    dtstart: datetime.datetime
+    status: str = ACTIVE
+    skipped: Set[datetime.datetime] = field(default_factory=set)
+    moved: Dict[datetime.datetime, datetime.datetime] = field(default_factory=dict)
+    _rrule: Any = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self._rrule = rrulestr(self.rule, dtstart=self.dtstart, cache=True)
+
+    def occurrences(self, start: datetime.datetime, end: datetime.datetime) -> Iterator[datetime.datetime]:
+        """Yield occurrence times in ``[start, end)`` in order, with skips and moves applied"""
+        regular = (
+            time for time in itertools.takewhile(lambda time: time < end, self._rrule.xafter(start, inc=True))
+            if time not in self.skipped and time not in self.moved
+        )
+        moved = sorted(time for time in self.moved.values() if start <= time < end)
+        return heapq.merge(regular, moved)
+
+    def occupies(self, start: datetime.datetime, end: datetime.datetime) -> bool:
+        return next(self.occurrences(start, end), None) is not None
+
+    def apply_exception(self, original: datetime.datetime, new_time: Optional[datetime.datetime]):
+        """Skip ``original``, or move it to ``new_time``, replacing rather than mutating the exception sets"""
+        moved = dict(self.moved)
+        skipped = set(self.skipped)
+        if new_time is None:
+            moved.pop(original, None)
+            skipped.add(original)
+        else:
+            moved[original] = new_time
+            skipped.discard(original)
+        self.moved, self.skipped = moved, skipped
+
+    def original(self, time: datetime.datetime) -> datetime.datetime:
+        """The rule occurrence an occurrence at ``time`` stands for, which differs once it was moved"""
+        return next((original for original, new_time in self.moved.items() if new_time == time), time)
+
+    def is_occurrence(self, time: datetime.datetime) -> bool:
+        """Whether ``time`` is an original occurrence of the rule, moved or not"""
+        return self._rrule.after(time, inc=True) == time and time not in self.skipped
+
+    def to_appointment(self, time: datetime.datetime, schedule=None) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "type": self.type,
+            "time": time,
+            "email": self.email,
+            "doctor_name": self.doctor_name,
+            "doctor_specialty": schedule.specialty if schedule else None,
+            "location": schedule.location if schedule else None,
+            "status": "Recurring",
+            "series_id": self.id,
+        }
+
+
+class SeriesBook:
+    """Every active recurring series, grouped by doctor.
+
+    Conflict checks ask only the series of one doctor whether they occupy one
+    slot, which costs a short lazy walk per series instead of materializing
+    occurrences. With a ``path`` the series live in tables next to the
+    appointments, so several processes can share them. Every write bumps the
+    version in ``series_meta`` and stamps its rows with it, so ``refresh``
+    costs one lookup while the series are unchanged, however busy the
+    appointment tables are, and otherwise parses only the series and
+    exceptions changed since. ``add`` and ``move`` run their conflict check
+    and their write in one ``BEGIN IMMEDIATE`` transaction, the same lock
+    appointment writes take.
+    """
+
+    def __init__(self, schedules: Mapping[str, Any], path: Optional[str] = None):
+        self.schedules = schedules
+        self._lock = threading.RLock()
+        self._series: Dict[int, AppointmentSeries] = {}
+        self._by_doctor: Dict[str, List[AppointmentSeries]] = {}
+        self._next_id = 1
+        self._conn = None
+        self._reader = None
+        self._reader_lock = threading.Lock()
+        self._version = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            with self._conn:
+                self._conn.executescript(SCHEMA)
+                for table in ("appointment_series", "series_exceptions"):
+                    columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+                    if "changed" not in columns:
+                        self._conn.execute(f"ALTER TABLE {table} ADD COLUMN changed INTEGER NOT NULL DEFAULT 0")
+                self._conn.executescript(INDEXES)
+            # Refreshes read on their own connection, and the in-memory index changes under their own
+            # lock, so the store can ask for holds from inside its write transaction while this book
+            # waits for that transaction's lock
+            self._reader = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._reader.row_factory = sqlite3.Row
+            self.refresh()
+            logger.info(f"Loaded {len(self._series)} recurring appointment series")
+
+    def refresh(self):
+        """Apply the series and exceptions written, by any connection, since the last refresh"""
+        if self._reader is None:
+            return
+        with self._reader_lock:
+            version = self._reader.execute("SELECT version FROM series_meta").fetchone()[0]
+            if version == self._version:
+                return
+            if self._version is None:
+                self._load()
+            else:
+                for row in self._reader.execute(
+                        "SELECT * FROM appointment_series WHERE changed > ?", (self._version,)).fetchall():
+                    if row["status"] == ACTIVE and row["id"] not in self._series:
+                        series = self._series_from(row)
+                        self._load_exceptions({series.id: series}, "series_id = ?", (series.id,))
+                        self._index(series)
+                    elif row["status"] != ACTIVE and row["id"] in self._series:
+                        self._unindex(self._series[row["id"]])
+                self._load_exceptions(self._series, "changed > ?", (self._version,))
+            # Rows stamped after ``version`` was read are applied again next time, which is harmless
+            self._version = version
+
+    def _load(self):
+        # Built aside and swapped in, so lock-free readers never see a half-loaded book
+        series_by_id: Dict[int, AppointmentSeries] = {}
+        for row in self._reader.execute("SELECT * FROM appointment_series WHERE status = ?", (ACTIVE,)).fetchall():
+            series_by_id[row["id"]] = self._series_from(row)
+        self._load_exceptions(series_by_id, "1", ())
+        by_doctor: Dict[str, List[AppointmentSeries]] = {}
+        for series in series_by_id.values():
+            by_doctor.setdefault(series.doctor_name, []).append(series)
+        self._series, self._by_doctor = series_by_id, by_doctor
+        self._next_id = max(series_by_id, default=0) + 1
+
+    @staticmethod
+    def _series_from(row: sqlite3.Row) -> AppointmentSeries:
+        return AppointmentSeries(
+            id=row["id"],
+            name=row["name"],
+            email=row["email"],
+            doctor_name=row["doctor_name"],
+            type=row["type"],
+            rule=row["rule"],
+            dtstart=datetime.datetime.fromisoformat(row["dtstart"]),
+        )
+
+    def _load_exceptions(self, series_by_id: Mapping[int, AppointmentSeries], where: str, params: Tuple):
+        for row in self._reader.execute(f"SELECT * FROM series_exceptions WHERE {where}", params).fetchall():
+            series = series_by_id.get(row["series_id"])
+            if series is None:
+                continue
+            new_time = datetime.datetime.fromisoformat(row["new_time"]) if row["new_time"] else None
+            series.apply_exception(datetime.datetime.fromisoformat(row["original_time"]), new_time)
+
+    def _bump(self) -> int:
+        """Advance the series version inside the open write transaction and return it"""
+        self._conn.execute("UPDATE series_meta SET version = version + 1")
+        return self._conn.execute("SELECT version FROM series_meta").fetchone()[0]
+
+    @contextmanager
+    def _write_transaction(self):
+        """Take the database write lock, then bring the book up to date, so checks made inside see every commit"""
+        with self._lock:
+            if self._conn is None:
+                yield None
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.refresh()
+                yield self._conn
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def _index(self, series: AppointmentSeries):
+        # Lists are replaced rather than appended to, so lock-free readers keep a consistent snapshot
+        self._series[series.id] = series
+        self._by_doctor[series.doctor_name] = self._by_doctor.get(series.doctor_name, []) + [series]
+        self._next_id = max(self._next_id, series.id + 1)
+
+    def _unindex(self, series: AppointmentSeries):
+        self._series.pop(series.id, None)
+        self._by_doctor[series.doctor_name] = [
+            other for other in self._by_doctor.get(series.doctor_name, ()) if other.id != series.id
+        ]
+
+    def get(self, series_id: int) -> Optional[AppointmentSeries]:
+        return self._series.get(series_id)
+
+    def list(self) -> List[AppointmentSeries]:
+        with self._lock:
+            return sorted(self._series.values(), key=lambda series: series.dtstart)
+
+    def occupied(self, doctor_name: str, start: datetime.datetime, end: datetime.datetime,
+                 ignore: Optional[int] = None) -> bool:
+        """Whether any series of this doctor has an occurrence in ``[start, end)``"""
+        return any(
+            series.occupies(start, end)
+            for series in tuple(self._by_doctor.get(doctor_name, ()))
+            if series.id != ignore
+        )
+
+    def occurrences_between(self, start: datetime.datetime, end: datetime.datetime,
+                            doctor_name: Optional[str] = None) -> Iterator[Tuple[datetime.datetime, AppointmentSeries]]:
+        """Yield (time, series) for every occurrence in the window, earliest first"""
+        with self._lock:
+            series_list = list(self._by_doctor.get(doctor_name, ())) if doctor_name else list(self._series.values())
+        streams = [_tagged(series, start, end) for series in series_list]
+        for time, _, series in heapq.merge(*streams):
+            yield time, series
+
+    def add(self, name: str, email: Optional[str], doctor_name: str, dtstart: datetime.datetime, rule: str,
+            appointment_type: str = "Follow-up", check: Optional[Callable[[], None]] = None) -> AppointmentSeries:
+        """Store a new series; ``check`` runs inside the write transaction and raises to refuse it"""
+        with self._write_transaction() as conn:
+            if check is not None:
+                check()
+            series = AppointmentSeries(
+                id=self._next_id, name=name, email=email, doctor_name=doctor_name,
+                type=appointment_type, rule=rule, dtstart=dtstart
+            )
+            if conn is not None:
+                cursor = conn.execute(
+                    "INSERT INTO appointment_series (name, email, doctor_name, type, rule, dtstart, status, created_at, changed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (name, email, doctor_name, appointment_type, rule, dtstart.isoformat(), ACTIVE,
+                     datetime.datetime.now().isoformat(timespec="seconds"), self._bump())
+                )
+                series.id = cursor.lastrowid
+            with self._reader_lock:
+                self._index(series)
+        logger.info(f"Created recurring series {series.id} for {name} with {doctor_name}: {rule}")
+        return series
+
+    def _save_exception(self, series: AppointmentSeries, original: datetime.datetime,
+                        new_time: Optional[datetime.datetime]):
+        # Called from inside ``_write_transaction``, which commits it
+        if self._conn is None:
+            return
+        self._conn.execute(
+            "INSERT OR REPLACE INTO series_exceptions (series_id, original_time, new_time, changed) VALUES (?, ?, ?, ?)",
+            (series.id, original.isoformat(), new_time.isoformat() if new_time else None, self._bump())
+        )
+
+    def skip(self, series_id: int, original: datetime.datetime) -> bool:
+        with self._write_transaction():
+            series = self._series.get(series_id)
+            if series is None or not series.is_occurrence(original):
+                return False
+            with self._reader_lock:
+                series.apply_exception(original, None)
+            self._save_exception(series, original, None)
+        return True
+
+    def move(self, series_id: int, original: datetime.datetime, new_time: datetime.datetime,
+             check: Optional[Callable[[], bool]] = None) -> bool:
+        """Move one occurrence unless ``check``, run inside the write transaction, returns False"""
+        with self._write_transaction():
+            series = self._series.get(series_id)
+            if series is None or not series.is_occurrence(original) or (check is not None and not check()):
+                return False
+            with self._reader_lock:
+                series.apply_exception(original, new_time)
+            self._save_exception(series, original, new_time)
+        return True
+
+    def end(self, series_id: int) -> Optional[AppointmentSeries]:
+        with self._write_transaction() as conn:
+            series = self._series.get(series_id)
+            if series is None:
+                return None
+            series.status = ENDED
+            with self._reader_lock:
+                self._unindex(series)
+            if conn is not None:
+                conn.execute(
+                    "UPDATE appointment_series SET status = ?, changed = ? WHERE id = ?", (ENDED, self._bump(), series_id)
+                )
+        return series
+
+
+def _tagged(series: AppointmentSeries, start: datetime.datetime, end: datetime.datetime):
+    for time in series.occurrences(start, end):
+        yield time, series.id, series
+
+
+def build_rule(frequency: str, count: Optional[int] = None, until: Optional[datetime.datetime] = None) -> str:
+    """Turn a named frequency plus an optional COUNT or UNTIL into an RRULE body"""
+    rule = FREQUENCIES.get(frequency, frequency)
+    if count:
+        rule += f";COUNT={int(count)}"
+    elif until:
+        rule += f";UNTIL={until.strftime('%Y%m%dT%H%M%S')}"
+    return rule
+
+
+_book: Optional[SeriesBook] = None
+_book_lock = threading.Lock()
+
+
+def get_series_book() -> SeriesBook:
+    """Return the process-wide series book, stored alongside SQLite appointments when that backend is used"""
+    global _book
+    if _book is None:
+        with _book_lock:
+            if _book is None:
+                _book = SeriesBook(get_doctor_schedules(), getattr(get_appointment_store(), "path", None))
+    return _book
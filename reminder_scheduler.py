@@ -0,0 +1,268 @@
+import datetime
+import heapq
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+from logger import setup_logger
+from config import AppConfig
+from appointment_store import CANCELLED, get_appointment_store
+from schedule_model import get_doctor_schedules
+from notification_coalescer import REMINDER, notify
+
+logger = setup_logger(__name__)
+
+# Longest single sleep, so a wall-clock change is noticed within the hour
+MAX_SLEEP_SECONDS = 3600
+# How long a reminder whose send failed waits before it is tried again
+RETRY_SECONDS = 300
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reminders_sent (
+    appointment_id INTEGER NOT NULL,
+    interval_hours REAL NOT NULL,
+    appointment_time TEXT NOT NULL,
+    sent_at TEXT NOT NULL,
+    PRIMARY KEY (appointment_id, interval_hours, appointment_time)
+);
+"""
+
+ReminderKey = Tuple[int, float, datetime.datetime]
+
+
+class ReminderScheduler:
+    """Sends each appointment's reminders when they fall due.
+
+    Every booking pushes one (due time, appointment, interval) entry per
+    configured interval onto a heap, and a single thread sleeps until the top
+    entry is due, so a wake-up costs only the reminders that are due rather
+    than a scan of every appointment. Entries are checked against the store
+    when they fire: cancelled appointments are dropped, and a moved one is
+    skipped because its move scheduled fresh entries for the new time. A
+    reminder is sent at most once per (appointment, interval, appointment
+    time); with a ``path`` that record lives in a ``reminders_sent`` table,
+    where one ``INSERT OR IGNORE`` claims a reminder, so neither restarts nor
+    other processes sharing the database send it twice. A claim is given up
+    again if the send fails, and the reminder is retried.
+
+    Appointment times are wall-clock times on their doctor's clock, so the
+    heap is keyed on UTC instants through ``schedules``; times of doctors
+    without a schedule are taken as server-local.
+    """
+
+    def __init__(self, intervals_hours: Iterable[float], send: Callable[[Dict[str, Any]], bool],
+                 lookup: Callable[[int], Optional[Dict[str, Any]]], path: Optional[str] = None,
+                 schedules: Optional[Mapping[str, Any]] = None):
+        self.intervals = sorted({float(hours) for hours in intervals_hours}, reverse=True)
+        self.send = send
+        self.lookup = lookup
+        self.schedules = schedules or {}
+        self._heap: List[Tuple[datetime.datetime, int, float, datetime.datetime]] = []
+        self._pending: Set[ReminderKey] = set()
+        self._sent: Set[ReminderKey] = set()
+        self._ready = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with self._conn:
+                self._conn.executescript(SCHEMA)
+
+    def schedule(self, appointment: Dict[str, Any], now: Optional[datetime.datetime] = None) -> int:
+        """Queue the reminders of one appointment that are still ahead; returns how many were queued"""
+        return self.schedule_many([appointment], now)
+
+    def instant(self, appointment: Dict[str, Any]) -> datetime.datetime:
+        """The aware UTC moment an appointment starts"""
+        schedule = self.schedules.get(appointment.get("doctor_name"))
+        if schedule is not None:
+            return schedule.instant(appointment["time"])
+        return appointment["time"].astimezone(datetime.timezone.utc)
+
+    def schedule_many(self, appointments: Iterable[Dict[str, Any]], now: Optional[datetime.datetime] = None) -> int:
+        now = _utc(now)
+        queued = 0
+        with self._ready:
+            for appointment in appointments:
+                if not appointment or not appointment.get("email") or appointment.get("status") == CANCELLED:
+                    continue
+                time = appointment["time"]
+                start = self.instant(appointment)
+                for hours in self.intervals:
+                    due = start - datetime.timedelta(hours=hours)
+                    key = (appointment["id"], hours, time)
+                    if due <= now or key in self._pending or self._already_sent(key):
+                        continue
+                    heapq.heappush(self._heap, (due, appointment["id"], hours, time))
+                    self._pending.add(key)
+                    queued += 1
+            if queued:
+                self._ready.notify()
+        return queued
+
+    def _already_sent(self, key: ReminderKey) -> bool:
+        if key in self._sent:
+            return True
+        if self._conn is None:
+            return False
+        row = self._conn.execute(
+            "SELECT 1 FROM reminders_sent WHERE appointment_id = ? AND interval_hours = ? AND appointment_time = ?",
+            (key[0], key[1], key[2].isoformat())
+        ).fetchone()
+        return row is not None
+
+    def _claim(self, key: ReminderKey) -> bool:
+        """Record the reminder as sent unless it already is; True only for the one caller, in any process, that records it"""
+        if key in self._sent:
+            return False
+        self._sent.add(key)
+        if self._conn is None:
+            return True
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO reminders_sent (appointment_id, interval_hours, appointment_time, sent_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key[0], key[1], key[2].isoformat(), datetime.datetime.now().isoformat(timespec="seconds"))
+            )
+        return cursor.rowcount == 1
+
+    def _release(self, key: ReminderKey):
+        self._sent.discard(key)
+        if self._conn is None:
+            return
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM reminders_sent WHERE appointment_id = ? AND interval_hours = ? AND appointment_time = ?",
+                (key[0], key[1], key[2].isoformat())
+            )
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def next_due(self) -> Optional[datetime.datetime]:
+        with self._ready:
+            return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[datetime.datetime] = None) -> List[ReminderKey]:
+        """Remove and return every entry due at or before ``now``"""
+        now = _utc(now)
+        due = []
+        with self._ready:
+            while self._heap and self._heap[0][0] <= now:
+                _, appointment_id, hours, time = heapq.heappop(self._heap)
+                key = (appointment_id, hours, time)
+                self._pending.discard(key)
+                due.append(key)
+        return due
+
+    def fire(self, key: ReminderKey) -> bool:
+        """Send one due reminder if its appointment is still booked for that time"""
+        appointment_id, hours, time = key
+        appointment = self.lookup(appointment_id)
+        if not appointment or appointment["status"] == CANCELLED or appointment["time"] != time:
+            return False
+        with self._ready:
+            if not self._claim(key):
+                return False
+        try:
+            sent = self.send(appointment)
+        except Exception:
+            self._retry(key, appointment)
+            raise
+        if not sent:
+            self._retry(key, appointment)
+            return False
+        logger.info(f"Queued {hours:g}-hour reminder for appointment {appointment_id} with {appointment['doctor_name']}")
+        return True
+
+    def _retry(self, key: ReminderKey, appointment: Dict[str, Any]):
+        """Give up the claim on a reminder that was not sent and queue it again, unless the appointment starts first"""
+        appointment_id, hours, time = key
+        due = _utc(None) + datetime.timedelta(seconds=RETRY_SECONDS)
+        with self._ready:
+            self._release(key)
+            if due < self.instant(appointment) and key not in self._pending:
+                heapq.heappush(self._heap, (due, appointment_id, hours, time))
+                self._pending.add(key)
+                self._ready.notify()
+        logger.warning(f"Could not send the {hours:g}-hour reminder for appointment {appointment_id}; retrying in {RETRY_SECONDS}s")
+
+    def run_due(self, now: Optional[datetime.datetime] = None) -> int:
+        return sum(self.fire(key) for key in self.pop_due(now))
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while self._running:
+                    if self._heap:
+                        wait = (self._heap[0][0] - _utc(None)).total_seconds()
+                        if wait <= 0:
+                            break
+                        self._ready.wait(min(wait, MAX_SLEEP_SECONDS))
+                    else:
+                        self._ready.wait(MAX_SLEEP_SECONDS)
+                if not self._running:
+                    return
+            try:
+                self.run_due()
+            except Exception as e:
+                logger.error(f"Error sending reminders: {str(e)}")
+
+    def start(self, appointments: Iterable[Dict[str, Any]] = ()):
+        """Start the reminder thread, first scheduling ``appointments``; a no-op if it is already running"""
+        with self._ready:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self.schedule_many(appointments)
+        self._thread.start()
+        logger.info(f"Reminder scheduler started with {self.pending()} reminders pending")
+
+    def stop(self, timeout: float = 1.0):
+        with self._ready:
+            self._running = False
+            self._ready.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        logger.info("Reminder scheduler stopped")
+
+
+def _utc(now: Optional[datetime.datetime]) -> datetime.datetime:
+    """``now`` as an aware UTC time, naive values being server-local; the current time when None"""
+    if now is None:
+        return datetime.datetime.now(datetime.timezone.utc)
+    return now.astimezone(datetime.timezone.utc)
+
+
+def _send_reminder(appointment: Dict[str, Any]) -> bool:
+    if not notify(REMINDER, appointment):
+        return False
+    get_appointment_store().update(appointment["id"], reminder_sent=True)
+    return True
+
+
+_scheduler: Optional[ReminderScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_reminder_scheduler() -> ReminderScheduler:
+    """Return the process-wide reminder scheduler, driven by ``email.reminder_intervals``"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                store = get_appointment_store()
+                _scheduler = ReminderScheduler(
+                    AppConfig().reminder_intervals, _send_reminder, store.get, getattr(store, "path", None),
+                    get_doctor_schedules()
+                )
+    return _scheduler
+
+
+def start_reminder_scheduler() -> ReminderScheduler:
+    """Start the scheduler once per process, seeded with every upcoming appointment"""
+    scheduler = get_reminder_scheduler()
+    now = _utc(None)
+    scheduler.start(a for a in get_appointment_store().iter_appointments() if scheduler.instant(a) > now)
+    return scheduler
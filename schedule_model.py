@@ -0,0 +1,149 @@
+import datetime
+import threading
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+import pytz
+from logger import setup_logger
+from config import AppConfig
+
+logger = setup_logger(__name__)
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+DEFAULT_TIMEZONE = "America/New_York"
+
+
+@dataclass(frozen=True)
+class DoctorSchedule:
+    """A doctor's weekly schedule, compiled once from settings.yaml.
+
+    Days are a weekday bitmask (bit 0 is Monday) and hours are minute-of-day
+    bounds, so checking a time is a shift and two integer comparisons. The
+    timezone is resolved up front and display strings are rendered here so
+    no caller formats them again.
+
+    Appointment times everywhere are naive wall-clock times in the doctor's
+    timezone; ``wall_time`` brings an aware time onto that clock and ``now``
+    is the current time on it.
+    """
+    name: str
+    specialty: str
+    location: str
+    timezone: str
+    available_days: Tuple[str, ...]
+    start_minute: int
+    end_minute: int
+    tz: Any = field(repr=False, compare=False)
+    weekday_mask: int
+    days_display: str
+    hours_display: str
+    schedule_display: str
+
+    @property
+    def surname(self) -> str:
+        return self.name.split()[-1]
+
+    def wall_time(self, time: datetime.datetime) -> datetime.datetime:
+        """``time`` as naive wall-clock time in this doctor's timezone; naive times already are"""
+        if time.tzinfo is None:
+            return time
+        return time.astimezone(self.tz).replace(tzinfo=None)
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now(self.tz).replace(tzinfo=None)
+
+    def instant(self, time: datetime.datetime) -> datetime.datetime:
+        """The aware UTC moment at which this doctor's clock shows ``time``"""
+        if time.tzinfo is None:
+            time = self.tz.localize(time)
+        return time.astimezone(pytz.utc)
+
+    def works_on(self, weekday: int) -> bool:
+        return bool(self.weekday_mask >> weekday & 1)
+
+    def covers(self, time: datetime.datetime) -> bool:
+        minute = time.hour * 60 + time.minute
+        return self.works_on(time.weekday()) and self.start_minute <= minute < self.end_minute
+
+    def validate(self, time: datetime.datetime, now: Optional[datetime.datetime] = None) -> Optional[str]:
+        """Return why ``time`` cannot be booked, or None if it can.
+
+        Naive times are taken as wall-clock time in the doctor's timezone.
+        """
+        time = self.wall_time(time)
+        now = self.wall_time(now) if now else self.now()
+        if time < now:
+            return "Cannot book appointments in the past."
+        if not self.works_on(time.weekday()):
+            return f"{self.name} is not available on {WEEKDAYS[time.weekday()]}. Available days: {self.days_display}"
+        minute = time.hour * 60 + time.minute
+        if not self.start_minute <= minute < self.end_minute:
+            return f"{self.name} is only available from {self.hours_display}"
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "specialty": self.specialty,
+            "available_days": list(self.available_days),
+            "hours": self.hours_display,
+            "location": self.location,
+            "timezone": self.timezone,
+        }
+
+
+def _parse_minute(value: str) -> int:
+    parsed = datetime.datetime.strptime(str(value).strip(), "%H:%M")
+    return parsed.hour * 60 + parsed.minute
+
+
+def _format_minute(minute: int) -> str:
+    return datetime.time(minute // 60, minute % 60).strftime("%I:%M %p").lstrip("0")
+
+
+def compile_schedule(name: str, entry: Dict[str, Any]) -> DoctorSchedule:
+    days = tuple(entry["days"])
+    unknown = [day for day in days if day not in WEEKDAYS]
+    if unknown:
+        raise ValueError(f"Unknown weekday(s) for {name}: {', '.join(unknown)}")
+    start_minute = _parse_minute(entry["hours"]["start"])
+    end_minute = _parse_minute(entry["hours"]["end"])
+    if end_minute <= start_minute:
+        raise ValueError(f"Working hours for {name} end before they start")
+
+    timezone = entry.get("timezone", DEFAULT_TIMEZONE)
+    days_display = ", ".join(days)
+    hours_display = f"{_format_minute(start_minute)} - {_format_minute(end_minute)}"
+    return DoctorSchedule(
+        name=name,
+        specialty=entry["specialty"],
+        location=entry.get("location", "Main Office"),
+        timezone=timezone,
+        available_days=days,
+        start_minute=start_minute,
+        end_minute=end_minute,
+        tz=pytz.timezone(timezone),
+        weekday_mask=sum(1 << WEEKDAYS.index(day) for day in days),
+        days_display=days_display,
+        hours_display=hours_display,
+        schedule_display=f"{days_display} ({hours_display})",
+    )
+
+
+def load_doctor_schedules(doctor_schedules: Dict[str, Dict[str, Any]]) -> Mapping[str, DoctorSchedule]:
+    """Compile the ``doctor_schedules`` section of settings.yaml into a read-only mapping"""
+    return MappingProxyType({name: compile_schedule(name, entry) for name, entry in doctor_schedules.items()})
+
+
+_schedules: Optional[Mapping[str, DoctorSchedule]] = None
+_schedules_lock = threading.Lock()
+
+
+def get_doctor_schedules() -> Mapping[str, DoctorSchedule]:
+    """Return the process-wide compiled doctor schedules"""
+    global _schedules
+    if _schedules is None:
+        with _schedules_lock:
+            if _schedules is None:
+                _schedules = load_doctor_schedules(AppConfig().doctor_schedules)
+                logger.info(f"Loaded schedules for {len(_schedules)} doctors")
+    return _schedules
@@ -0,0 +1,183 @@
+import datetime
+import heapq
+from time import perf_counter
+from typing import Any, Callable, Iterable, Mapping, List, Optional, Tuple
+import numpy as np
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+MINUTES_PER_DAY = 24 * 60
+
+Exclude = Optional[Callable[[str, datetime.datetime], bool]]
+
+
+class SlotGrid:
+    """Every bookable slot of every doctor over a multi-week horizon.
+
+    The grid is a boolean ``(doctor, day, slot)`` array built in one vectorized
+    pass from each ``DoctorSchedule``'s weekday mask and hours; bookings are a
+    second mask of the same shape. Each doctor's free slot start times are
+    materialized lazily as a sorted ``datetime64[m]`` array, so "next K free
+    slots" is a ``searchsorted`` and a slice.
+
+    ``datetime64`` carries no timezone, so the grid holds each doctor's naive
+    wall-clock times, as stored appointments do. Aware query times, such as
+    "now", are moved onto each doctor's clock before they are compared.
+    """
+
+    def __init__(self, schedules: Mapping[str, Any], start: datetime.date, weeks: int, slot_minutes: int):
+        self.start = start
+        self.slot_minutes = slot_minutes
+        self.doctors = sorted(schedules)
+        self._doctor_ids = {name: i for i, name in enumerate(self.doctors)}
+        self._schedules = [schedules[name] for name in self.doctors]
+
+        start_day = np.datetime64(start, "D")
+        days = np.arange(start_day, start_day + 7 * weeks, dtype="datetime64[D]")
+        weekdays = (days.astype(np.int64) + 3) % 7
+        offsets = np.arange(0, MINUTES_PER_DAY, slot_minutes)
+
+        day_masks = np.zeros((len(self.doctors), 7), dtype=bool)
+        hour_masks = np.zeros((len(self.doctors), len(offsets)), dtype=bool)
+        for i, name in enumerate(self.doctors):
+            schedule = schedules[name]
+            day_masks[i] = [schedule.works_on(weekday) for weekday in range(7)]
+            hour_masks[i] = (offsets >= schedule.start_minute) & (offsets + slot_minutes <= schedule.end_minute)
+
+        self._start_minute = start_day.astype("datetime64[m]")
+        self._end_minute = (start_day + 7 * weeks).astype("datetime64[m]")
+        self._days = len(days)
+        self._times = (days.astype("datetime64[m]")[:, None] + offsets.astype("timedelta64[m]")[None, :]).ravel()
+        self._working = day_masks[:, weekdays][:, :, None] & hour_masks[:, None, :]
+        self._booked = np.zeros_like(self._working)
+        self._free_times: List[Optional[np.ndarray]] = [None] * len(self.doctors)
+
+    def _minute(self, doctor_id: int, time: datetime.datetime) -> np.datetime64:
+        return np.datetime64(self._schedules[doctor_id].wall_time(time), "m")
+
+    def _position(self, time: datetime.datetime) -> Optional[Tuple[int, int]]:
+        minutes = int((np.datetime64(time, "m") - self._start_minute).astype(np.int64))
+        day, minute = divmod(minutes, MINUTES_PER_DAY)
+        if not 0 <= day < self._days:
+            return None
+        return day, minute // self.slot_minutes
+
+    def set_booked(self, doctor_name: str, time: datetime.datetime, booked: bool = True):
+        doctor_id = self._doctor_ids.get(doctor_name)
+        position = self._position(time)
+        if doctor_id is None or position is None:
+            return
+        self._booked[doctor_id, position[0], position[1]] = booked
+        self._free_times[doctor_id] = None
+
+    def mark_booked(self, bookings: Iterable[Tuple[str, datetime.datetime]]):
+        """Apply many (doctor, time) bookings with one scatter into the booking mask"""
+        pairs = [(self._doctor_ids[name], time) for name, time in bookings if name in self._doctor_ids]
+        if not pairs:
+            return
+        doctor_ids = np.fromiter((doctor_id for doctor_id, _ in pairs), dtype=np.int64, count=len(pairs))
+        minutes = (np.array([time for _, time in pairs], dtype="datetime64[m]") - self._start_minute).astype(np.int64)
+        days, day_minutes = np.divmod(minutes, MINUTES_PER_DAY)
+        in_range = (days >= 0) & (days < self._days)
+        self._booked[doctor_ids[in_range], days[in_range], day_minutes[in_range] // self.slot_minutes] = True
+        self._free_times = [None] * len(self.doctors)
+
+    def free_times(self, doctor_name: str) -> np.ndarray:
+        doctor_id = self._doctor_ids[doctor_name]
+        if self._free_times[doctor_id] is None:
+            free = (self._working[doctor_id] & ~self._booked[doctor_id]).ravel()
+            self._free_times[doctor_id] = self._times[free]
+        return self._free_times[doctor_id]
+
+    def next_free(self, doctor_names: Iterable[str], after: datetime.datetime, limit: int = 5,
+                  before: Optional[datetime.datetime] = None, exclude: Exclude = None) -> List[Tuple[str, datetime.datetime]]:
+        """Return up to ``limit`` free (doctor, time) slots starting at or after ``after``, earliest first.
+
+        ``exclude(doctor, time)`` can veto slots the grid does not know about;
+        it is only consulted for slots that would otherwise be returned.
+        """
+        times, owners = [], []
+        for name in sorted(set(doctor_names)):
+            doctor_id = self._doctor_ids.get(name)
+            if doctor_id is None:
+                continue
+            after_minute = self._minute(doctor_id, after)
+            if after_minute < np.datetime64(self._schedules[doctor_id].wall_time(after)):
+                after_minute += np.timedelta64(1, "m")
+            before_minute = self._minute(doctor_id, before) if before else None
+            free = self.free_times(name)
+            first = np.searchsorted(free, after_minute, side="left")
+            if exclude is None:
+                candidates = free[first:first + limit]
+            else:
+                candidates = self._unexcluded(name, free, first, limit, before_minute, exclude)
+            if before_minute is not None:
+                candidates = candidates[candidates < before_minute]
+            times.append(candidates)
+            owners.extend([name] * len(candidates))
+        if not owners:
+            return []
+
+        merged = np.concatenate(times)
+        order = np.argsort(merged, kind="stable")[:limit]
+        return [(owners[i], merged[i].astype(datetime.datetime)) for i in order]
+
+    def _unexcluded(self, name: str, free: np.ndarray, first: int, limit: int,
+                    before_minute: Optional[np.datetime64], exclude: Exclude) -> np.ndarray:
+        kept = []
+        for position in range(first, len(free)):
+            if len(kept) >= limit or (before_minute is not None and free[position] >= before_minute):
+                break
+            if not exclude(name, free[position].astype(datetime.datetime)):
+                kept.append(free[position])
+        return np.array(kept, dtype="datetime64[m]")
+
+    def nearest_free(self, doctor_names: Iterable[str], target: datetime.datetime, limit: int = 3,
+                     not_before: Optional[datetime.datetime] = None, later_weight: float = 1.0,
+                     time_budget: Optional[float] = None, exclude: Exclude = None) -> List[Tuple[str, datetime.datetime]]:
+        """Best-first search for the ``limit`` free slots closest to ``target``.
+
+        Every doctor contributes two cursors into its sorted free-time array, one
+        walking forward and one walking backward from ``target``. A heap keyed by
+        weighted distance pops the closest candidate and advances only that
+        cursor, so the search touches ``limit`` + 2 * doctors entries at most.
+        Slots after ``target`` cost ``later_weight`` times their distance.
+        """
+        deadline = perf_counter() + time_budget if time_budget else None
+
+        heap = []
+        for name in sorted(set(doctor_names)):
+            doctor_id = self._doctor_ids.get(name)
+            if doctor_id is None:
+                continue
+            target_minute = self._minute(doctor_id, target)
+            if target_minute >= self._end_minute:
+                continue
+            floor_minute = self._minute(doctor_id, not_before) if not_before else None
+            free = self.free_times(name)
+            lowest = int(np.searchsorted(free, floor_minute, side="left")) if floor_minute is not None else 0
+            split = max(int(np.searchsorted(free, target_minute, side="left")), lowest)
+            for index, step in ((split, 1), (split - 1, -1)):
+                if lowest <= index < len(free):
+                    heapq.heappush(heap, (self._distance(free[index], target_minute, later_weight), name, index, step, lowest, target_minute))
+
+        results = []
+        while heap and len(results) < limit:
+            if deadline is not None and perf_counter() > deadline:
+                logger.warning(f"Nearest free slot search hit its time budget after {len(results)} results")
+                break
+            _, name, index, step, lowest, target_minute = heapq.heappop(heap)
+            free = self.free_times(name)
+            slot = free[index].astype(datetime.datetime)
+            if exclude is None or not exclude(name, slot):
+                results.append((name, slot))
+            index += step
+            if lowest <= index < len(free):
+                heapq.heappush(heap, (self._distance(free[index], target_minute, later_weight), name, index, step, lowest, target_minute))
+        return results
+
+    @staticmethod
+    def _distance(slot: np.datetime64, target: np.datetime64, later_weight: float) -> float:
+        minutes = int((slot - target).astype(np.int64))
+        return minutes * later_weight if minutes >= 0 else -minutes
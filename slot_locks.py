@@ -0,0 +1,34 @@
+import threading
+from contextlib import contextmanager
+from typing import Hashable, Iterable
+
+DEFAULT_STRIPES = 64
+
+
+class StripedLock:
+    """A fixed pool of locks shared out by hashing keys such as (doctor, day).
+
+    Writers for different doctors or days almost always land on different
+    stripes and proceed in parallel, while two writers for the same doctor-day
+    always share one. ``hold`` takes several stripes in index order, so callers
+    that need more than one key (a move across days, a batch import) cannot
+    deadlock each other.
+    """
+
+    def __init__(self, stripes: int = DEFAULT_STRIPES):
+        self._locks = [threading.Lock() for _ in range(max(stripes, 1))]
+
+    def _stripe(self, key: Hashable) -> int:
+        return hash(key) % len(self._locks)
+
+    @contextmanager
+    def hold(self, keys: Iterable[Hashable]):
+        stripes = sorted({self._stripe(key) for key in keys})
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
+
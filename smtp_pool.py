@@ -0,0 +1,174 @@
+import atexit
+import smtplib
+import socket
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_MAX_CONNECTIONS = 4
+DEFAULT_IDLE_TIMEOUT = 60
+DEFAULT_HEALTH_CHECK_AFTER = 10
+DEFAULT_TIMEOUT = 30
+
+# Errors that mean the connection itself is gone, so a fresh one is worth a retry
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+
+class SMTPConnectionPool:
+    """Authenticated SMTP connections kept open and reused across sends.
+
+    Opening a connection costs a TCP handshake, EHLO, STARTTLS and AUTH; a
+    pooled connection skips all of that. Idle connections older than
+    ``idle_timeout`` are closed instead of reused, ones idle longer than
+    ``health_check_after`` are probed with NOOP first, and a send that fails
+    on a dead connection is retried once on a fresh one. At most
+    ``max_connections`` are open at a time.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 use_tls: bool = True, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT, health_check_after: float = DEFAULT_HEALTH_CHECK_AFTER,
+                 timeout: float = DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.timeout = timeout
+        self._idle: List[Tuple[smtplib.SMTP, float]] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self.stats = {"opened": 0, "reused": 0, "health_checks": 0, "reconnects": 0}
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.use_tls:
+                server.starttls()
+                server.ehlo()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            self._discard(server)
+            raise
+        self._count("opened")
+        return server
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def _discard(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _is_alive(self, server: smtplib.SMTP) -> bool:
+        self._count("health_checks")
+        try:
+            return server.noop()[0] == 250
+        except OSError:
+            return False
+
+    def _checkout(self) -> smtplib.SMTP:
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                server, returned_at = self._idle.pop()
+            idle_for = now - returned_at
+            if idle_for > self.idle_timeout:
+                self._discard(server)
+                continue
+            if idle_for > self.health_check_after and not self._is_alive(server):
+                self._discard(server)
+                continue
+            self._count("reused")
+            return server
+        return self._connect()
+
+    def _checkin(self, server: smtplib.SMTP):
+        with self._lock:
+            self._idle.append((server, time.monotonic()))
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it goes back to the pool only if the body finished cleanly"""
+        self._slots.acquire()
+        try:
+            server = self._checkout()
+            try:
+                yield server
+            except BaseException:
+                self._discard(server)
+                raise
+            self._checkin(server)
+        finally:
+            self._slots.release()
+
+    def send(self, msg) -> None:
+        """Send one message, reconnecting once if the pooled connection turned out to be dead"""
+        try:
+            with self.connection() as server:
+                server.send_message(msg)
+        except CONNECTION_ERRORS as e:
+            logger.warning(f"SMTP connection lost ({e}); retrying on a fresh connection")
+            self._count("reconnects")
+            with self.connection() as server:
+                server.send_message(msg)
+
+    def send_many(self, messages: Iterable) -> int:
+        """Send messages over one pooled connection; returns how many were accepted"""
+        sent = 0
+        pending = deque(messages)
+        failed_at = None
+        while pending:
+            try:
+                with self.connection() as server:
+                    while pending:
+                        try:
+                            server.send_message(pending[0])
+                            sent += 1
+                        except smtplib.SMTPRecipientsRefused as e:
+                            logger.error(f"Recipient refused for {pending[0]['To']}: {e}")
+                        pending.popleft()
+            except CONNECTION_ERRORS as e:
+                if failed_at == len(pending):
+                    raise
+                failed_at = len(pending)
+                logger.warning(f"SMTP connection lost during batch ({e}); reconnecting")
+                self._count("reconnects")
+        return sent
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for server, _ in idle:
+            self._discard(server)
+
+
+_pools: Dict[tuple, SMTPConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(host: str, port: int, username: Optional[str], password: Optional[str], use_tls: bool = True,
+                  **settings) -> SMTPConnectionPool:
+    """Return the process-wide pool for one server and account, so every EmailService shares it"""
+    key = (host, port, username, use_tls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SMTPConnectionPool(host, port, username, password, use_tls, **settings)
+            atexit.register(pool.close)
+        return pool
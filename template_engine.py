@@ -0,0 +1,134 @@
+import html
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+from logger import setup_logger
+from config import AppConfig
+
+logger = setup_logger(__name__)
+
+# How often a template file is stat()ed for changes while it is being rendered
+DEFAULT_CHECK_INTERVAL = 1.0
+
+# A {% if %}/{% endif %} alone on its line takes the whole line with it, so blocks leave no blank lines
+TOKEN = re.compile(
+    r"^[ \t]*\{%\s*(?P<line_tag>if|endif)\s*(?P<line_arg>\w*)\s*%\}[ \t]*\r?\n"
+    r"|\{%\s*(?P<tag>\w+)\s*(?P<arg>\w*)\s*%\}"
+    r"|\{\{\s*(?P<var>\w+)\s*\}\}",
+    re.MULTILINE,
+)
+
+# A compiled template is a list of literal strings, placeholder names (one-element
+# tuples) and conditional blocks (name, body) whose body is itself a segment list
+Segment = Union[str, Tuple[str], Tuple[str, list]]
+
+
+def compile_template(source: str, name: str = "<string>") -> List[Segment]:
+    """Split a template into literal text and placeholder slots once, up front"""
+    root: List[Segment] = []
+    stack = [root]
+    position = 0
+    for match in TOKEN.finditer(source):
+        if match.start() > position:
+            stack[-1].append(source[position:match.start()])
+        position = match.end()
+        if match.group("var"):
+            stack[-1].append((match.group("var"),))
+            continue
+        tag = match.group("line_tag") or match.group("tag")
+        arg = match.group("line_arg") or match.group("arg")
+        if tag == "if" and arg:
+            block: List[Segment] = []
+            stack[-1].append((arg, block))
+            stack.append(block)
+        elif tag == "endif" and len(stack) > 1:
+            stack.pop()
+        else:
+            raise ValueError(f"Unexpected '{match.group(0).strip()}' in template {name}")
+    if len(stack) > 1:
+        raise ValueError(f"Unclosed {{% if %}} in template {name}")
+    if position < len(source):
+        root.append(source[position:])
+    return root
+
+
+class Markup(str):
+    """Text that is already HTML, such as a rendered fragment, and is inserted without escaping"""
+
+
+class Template:
+    def __init__(self, segments: List[Segment], escape: bool = True):
+        self.segments = segments
+        self.escape = escape
+
+    def render(self, context: Mapping[str, Any]) -> str:
+        parts: List[str] = []
+        self._emit(self.segments, context, parts)
+        return "".join(parts)
+
+    def _emit(self, segments: List[Segment], context: Mapping[str, Any], parts: List[str]):
+        append = parts.append
+        for segment in segments:
+            if segment.__class__ is str:
+                append(segment)
+            elif len(segment) == 1:
+                value = context.get(segment[0])
+                if value is not None:
+                    append(html.escape(str(value)) if self.escape and not isinstance(value, Markup) else str(value))
+            elif context.get(segment[0]):
+                self._emit(segment[1], context, parts)
+
+
+class TemplateEngine:
+    """Templates from one directory, compiled on first use and recompiled when their file changes.
+
+    Each file is parsed once into a segment list, so rendering is a walk that
+    appends literals and escaped values to one list and joins it. Files are
+    re-stat()ed at most every ``check_interval`` seconds, which keeps a mass
+    send from hitting the filesystem per message while still picking up
+    edits.
+    """
+
+    def __init__(self, directory: str, check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._templates: Dict[str, Tuple[Template, float, float]] = {}
+
+    def get(self, name: str) -> Template:
+        now = time.monotonic()
+        cached = self._templates.get(name)
+        if cached is not None and now - cached[2] < self.check_interval:
+            return cached[0]
+        with self._lock:
+            path = os.path.join(self.directory, name)
+            mtime = os.stat(path).st_mtime
+            cached = self._templates.get(name)
+            if cached is None or cached[1] != mtime:
+                with open(path, encoding="utf-8") as f:
+                    template = Template(compile_template(f.read(), name), escape=name.endswith(".html"))
+                if cached is not None:
+                    logger.info(f"Reloaded email template {name}")
+            else:
+                template = cached[0]
+            self._templates[name] = (template, mtime, now)
+            return template
+
+    def render(self, name: str, context: Mapping[str, Any]) -> str:
+        return self.get(name).render(context)
+
+
+_engine: Optional[TemplateEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_template_engine() -> TemplateEngine:
+    """Return the process-wide engine for ``email.templates_dir``"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = TemplateEngine(AppConfig().email_templates_dir)
+    return _engine
@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# settings.yaml is read from the working directory
+os.chdir(ROOT)
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ["APPOINTMENTS_BACKEND"] = "memory"
+os.environ["LLM_CACHE_PATH"] = ""
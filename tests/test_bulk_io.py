@@ -0,0 +1,80 @@
+import datetime
+import io
+import json
+
+import pytest
+
+from appointment_store import get_appointment_store
+from bulk_io import import_appointments, parse_row
+from schedule_model import get_doctor_schedules
+
+SCHEDULES = get_doctor_schedules()
+DOCTOR = "Dr. Smith"  # Monday, Wednesday and Friday, 09:00-17:00 America/New_York
+NOW = datetime.datetime(2026, 1, 5, 8, 0)
+MONDAY_10AM = datetime.datetime(2026, 1, 12, 10, 0)
+
+
+def row(**fields):
+    return dict({"name": "Ada Lovelace", "doctor_name": DOCTOR, "time": MONDAY_10AM.isoformat()}, **fields)
+
+
+def test_bad_json_is_a_row_error():
+    with pytest.raises(ValueError, match="invalid JSON"):
+        parse_row('{"name": "Ada",', SCHEDULES, NOW)
+
+
+def test_unknown_doctor():
+    with pytest.raises(ValueError, match="unknown doctor: Dr. Nobody"):
+        parse_row(row(doctor_name="Dr. Nobody"), SCHEDULES, NOW)
+
+
+def test_past_time_is_rejected_unless_allowed():
+    past = row(time="2026-01-02T10:00")
+    with pytest.raises(ValueError, match="in the past"):
+        parse_row(past, SCHEDULES, NOW)
+    assert parse_row(past, SCHEDULES, NOW, allow_past=True)["time"] == datetime.datetime(2026, 1, 2, 10, 0)
+
+
+def test_past_time_outside_hours_is_still_rejected():
+    with pytest.raises(ValueError, match="does not work"):
+        parse_row(row(time="2026-01-02T20:00"), SCHEDULES, NOW, allow_past=True)
+
+
+@pytest.mark.parametrize("value", [
+    "2026-01-12T10:00",
+    "2026-01-12T15:00Z",
+    "2026-01-12T15:00:00+00:00",
+    "2026-01-12T07:00:00-08:00",
+    datetime.datetime(2026, 1, 12, 15, 0, tzinfo=datetime.timezone.utc),
+    MONDAY_10AM,
+])
+def test_times_end_up_naive_on_the_doctors_clock(value):
+    time = parse_row(row(time=value), SCHEDULES, NOW)["time"]
+    assert time == MONDAY_10AM
+    assert time.tzinfo is None and type(time) is datetime.datetime
+
+
+def test_jsonl_text_parses_like_a_dict():
+    assert parse_row(json.dumps(row()), SCHEDULES, NOW) == parse_row(row(), SCHEDULES, NOW)
+
+
+def test_conflicting_rows_are_reported():
+    store = get_appointment_store()
+    store.clear()
+    schedule = SCHEDULES[DOCTOR]
+    day = schedule.now().date() + datetime.timedelta(days=7)
+    while not schedule.works_on(day.weekday()):
+        day += datetime.timedelta(days=1)
+    time = datetime.datetime.combine(day, datetime.time(10, 0)).isoformat()
+    source = io.StringIO(
+        "name,doctor_name,time\n"
+        f"Ada Lovelace,{DOCTOR},{time}\n"
+        f"Grace Hopper,{DOCTOR},{time}\n"
+    )
+
+    report = import_appointments(source, fmt="csv")
+
+    assert (report.total, report.imported, report.failed) == (2, 1, 1)
+    assert report.errors[0].line == 3
+    assert "already booked" in report.errors[0].message
+    store.clear()
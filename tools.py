@@ -5,77 +5,323 @@ from logger import setup_logger
 from config import AppConfig
 from typing import List, Dict, Any, Optional
 from email_service import EmailService
-import pytz
-import random
-from datetime import timedelta
+from availability import AvailabilityIndex
+from appointment_store import CANCELLED, get_appointment_store, slot_bounds
+from schedule_model import DoctorSchedule, get_doctor_schedules
+from slot_locks import StripedLock
+from waitlist import get_waitlist
+from recurrence import AppointmentSeries, get_series_book
+from reminder_scheduler import get_reminder_scheduler
+from notification_coalescer import CANCELLATION, RESCHEDULE, notify, notify_many
+import threading
 
 logger = setup_logger(__name__)
 config = AppConfig()
-DOCTOR_SCHEDULES = {
-    "Dr. Smith": {
-        "specialty": "General Practice",
-        "available_days": ["Monday", "Wednesday", "Friday"],
-        "hours": {"start": 9, "end": 17},
-        "location": "Main Building, Room 101",
-        "timezone": "America/New_York"
-    },
-    "Dr. Johnson": {
-        "specialty": "Cardiology", 
-        "available_days": ["Tuesday", "Thursday"],
-        "hours": {"start": 10, "end": 16},
-        "location": "Cardiac Wing, Room 205",
-        "timezone": "America/New_York"
-    },
-    "Dr. Williams": {
-        "specialty": "Dermatology",
-        "available_days": ["Monday", "Tuesday", "Thursday", "Friday"],
-        "hours": {"start": 8, "end": 15},
-        "location": "Dermatology Center, Room 301",
-        "timezone": "America/New_York"
-    },
-    "Dr. Brown": {
-        "specialty": "Orthopedics",
-        "available_days": ["Wednesday", "Thursday", "Friday"],
-        "hours": {"start": 9, "end": 18},
-        "location": "Sports Medicine Wing, Room 150",
-        "timezone": "America/New_York"
-    }
-}
-
-def validate_appointment_time(time: datetime.datetime, doctor_info: Dict[str, Any]) -> Optional[str]:
+DOCTOR_SCHEDULES = get_doctor_schedules()
+
+def validate_appointment_time(time: datetime.datetime, doctor_info: DoctorSchedule) -> Optional[str]:
     
     try:
-        
-        doctor_tz = pytz.timezone(doctor_info.get("timezone", "America/New_York"))
-        time_in_doctor_tz = time.astimezone(doctor_tz)
-        
-       
-        now = datetime.datetime.now(doctor_tz)
-        if time_in_doctor_tz < now:
-            return "Cannot book appointments in the past."
-        
-       
-        day_name = time_in_doctor_tz.strftime("%A")
-        if day_name not in doctor_info["available_days"]:
-            return f"Doctor is not available on {day_name}. Available days: {', '.join(doctor_info['available_days'])}"
-        
-       
-        hour = time_in_doctor_tz.hour
-        if not (doctor_info["hours"]["start"] <= hour < doctor_info["hours"]["end"]):
-            return f"Doctor is only available from {doctor_info['hours']['start']}:00 to {doctor_info['hours']['end']}:00"
-        
-        return None
+        return doctor_info.validate(time)
     except Exception as e:
         logger.error(f"Error validating appointment time: {e}")
         return "Error validating appointment time. Please try again."
 
 def initialize_session_state():
    
-    if 'appointments' not in st.session_state:
-        st.session_state.appointments = []
     if 'email_service' not in st.session_state:
         st.session_state.email_service = EmailService()
 
+_availability: Optional[AvailabilityIndex] = None
+_availability_version: Optional[int] = None
+_availability_lock = threading.RLock()
+_slot_locks = StripedLock(config.scheduling_settings.get('lock_stripes', 64))
+
+def get_availability_index() -> AvailabilityIndex:
+    """Return the process-wide availability index, rebuilt whenever another connection wrote to the store"""
+    global _availability, _availability_version
+    store = get_appointment_store()
+    with _availability_lock:
+        # Series are versioned apart from the store, and the index asks the book for them live
+        get_series_book().refresh()
+        version = store.data_version()
+        if _availability is None or version != _availability_version:
+            _availability = AvailabilityIndex.from_appointments(
+                DOCTOR_SCHEDULES,
+                store.list_active(),
+                slot_minutes=config.scheduling_settings.get('slot_minutes', 30),
+                horizon_weeks=config.scheduling_settings.get('horizon_weeks', 52),
+                exclude=_held_by_series
+            )
+            _availability_version = version
+        return _availability
+
+def _current_index() -> AvailabilityIndex:
+    """The index writers keep in step, without the staleness check readers pay for"""
+    return _availability or get_availability_index()
+
+def _mark_availability_current(before: int):
+    """Record a write made on top of store version ``before`` as reflected in the index.
+
+    Every write commits exactly one version, so if the store moved further
+    another connection committed too, and the index is rebuilt on the next
+    read instead of being taken as current.
+    """
+    global _availability_version
+    version = get_appointment_store().data_version()
+    _availability_version = version if before == _availability_version and version == before + 1 else None
+
+def _invalidate_availability():
+    global _availability_version
+    _availability_version = None
+
+def _doctor_now(doctor_name: str) -> datetime.datetime:
+    """The current wall-clock time in the doctor's timezone, the clock appointment times are kept on"""
+    schedule = DOCTOR_SCHEDULES.get(doctor_name)
+    return schedule.now() if schedule else datetime.datetime.now()
+
+def _held_by_series(doctor_name: str, time: datetime.datetime, ignore: Optional[int] = None) -> bool:
+    """Whether a recurring series of this doctor has an occurrence in the slot containing ``time``"""
+    start, end = slot_bounds(time, config.scheduling_settings.get('slot_minutes', 30))
+    return get_series_book().occupied(doctor_name, start, end, ignore)
+
+def _held_by_series_now(doctor_name: str, time: datetime.datetime) -> bool:
+    """``_held_by_series`` after picking up series written by other processes; passed to the store as ``held``"""
+    get_series_book().refresh()
+    return _held_by_series(doctor_name, time)
+
+def reserve_appointment(appointment: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Store a new appointment unless its doctor is already booked in that slot"""
+    return reserve_appointments([appointment])[0]
+
+def reserve_appointments(appointments: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """Store a batch of appointments in one transaction, skipping any whose slot is taken.
+
+    Returns one entry per input: the stored appointment, or None on a conflict
+    with an existing booking or an earlier row of the same batch. The store
+    checks each slot inside its write transaction, which is what rules out
+    double-booking across sessions and processes; recurring series are asked
+    inside that same transaction. The striped locks only order
+    writers for the same doctor-day in this process, so bookings for other
+    doctors or days never wait on each other here.
+    """
+    if not appointments:
+        return []
+    store = get_appointment_store()
+    index = _current_index()
+    keys = {(appointment.get("doctor_name"), appointment["time"].date()) for appointment in appointments}
+    with _slot_locks.hold(keys):
+        before = store.data_version()
+        results = store.add_if_free(appointments, index.slot_minutes, held=_held_by_series_now)
+        for appointment, stored in zip(appointments, results):
+            if stored:
+                index.add(stored)
+            elif not index.is_booked(appointment.get("doctor_name"), appointment["time"]):
+                _invalidate_availability()
+        _mark_availability_current(before)
+    get_reminder_scheduler().schedule_many(results)
+    return results
+
+def release_appointment(appointment_id: int) -> Optional[Dict[str, Any]]:
+    """Cancel an appointment and free its slot"""
+    store = get_appointment_store()
+    appointment = store.get(appointment_id)
+    if not appointment or appointment["status"] == CANCELLED:
+        return None
+    index = _current_index()
+    with _slot_locks.hold([(appointment["doctor_name"], appointment["time"].date())]):
+        before = store.data_version()
+        cancelled = store.cancel(appointment_id)
+        if cancelled:
+            index.remove(cancelled)
+            _mark_availability_current(before)
+    if cancelled:
+        notify(CANCELLATION, cancelled)
+        _offer_to_waitlist(cancelled["doctor_name"], cancelled["time"])
+    return cancelled
+
+def move_appointment(appointment: Dict[str, Any], new_time: datetime.datetime) -> Optional[Dict[str, Any]]:
+    """Move an appointment to a new time unless its doctor is already booked there"""
+    store = get_appointment_store()
+    index = _current_index()
+    doctor_name = appointment.get("doctor_name")
+    old_time = appointment["time"]
+    with _slot_locks.hold([(doctor_name, old_time.date()), (doctor_name, new_time.date())]):
+        before = store.data_version()
+        moved = store.move_if_free(appointment["id"], new_time, index.slot_minutes, held=_held_by_series_now)
+        if moved is not None:
+            index.remove(appointment)
+            index.add(moved)
+        _mark_availability_current(before)
+    if moved is None:
+        return None
+    get_reminder_scheduler().schedule(moved)
+    notify(RESCHEDULE, moved)
+    _offer_to_waitlist(doctor_name, old_time)
+    return moved
+
+def clear_doctor_days(doctor_name: str, start_date: datetime.date, end_date: datetime.date,
+                      reschedule: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+    """Cancel, or move to the doctor's next free slots, every booking they have from start_date to end_date.
+
+    Affected bookings come from the store's (doctor, time) index and all
+    changes commit in one transaction; a booking whose new slot was taken in
+    the meantime is cancelled instead. Recurring-series occurrences on those
+    days are skipped, or moved the same way, in the series book. Patients get
+    their notices as one batch. Freed slots are not offered to the waitlist
+    since the doctor is out.
+    """
+    store = get_appointment_store()
+    index = _current_index()
+    book = get_series_book()
+    book.refresh()
+    start = datetime.datetime.combine(start_date, datetime.time.min)
+    end = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min)
+    affected = store.list_for_doctor(doctor_name, start, end)
+    occurrences = list(book.occurrences_between(start, end, doctor_name))
+    if not affected and not occurrences:
+        return {"cancelled": [], "moved": []}
+    moves, series_targets = [], []
+    if reschedule:
+        targets = index.free_slots([doctor_name], start=max(end, _doctor_now(doctor_name)),
+                                   limit=len(affected) + len(occurrences), days=None)
+        moves = [(appointment["id"], time) for appointment, (_, time) in zip(affected, targets)]
+        series_targets = [time for _, time in targets[len(moves):]]
+    cancel_ids = [appointment["id"] for appointment in affected[len(moves):]]
+    keys = {(doctor_name, appointment["time"].date()) for appointment in affected}
+    keys.update((doctor_name, time.date()) for time, _ in occurrences)
+    keys.update((doctor_name, time.date()) for _, time in moves)
+    keys.update((doctor_name, time.date()) for time in series_targets)
+    schedule = DOCTOR_SCHEDULES.get(doctor_name)
+    skipped, rescheduled = [], []
+    with _slot_locks.hold(keys):
+        before = store.data_version()
+        cancelled, moved = store.cancel_and_move(cancel_ids, moves, index.slot_minutes, held=_held_by_series_now)
+        originals = {appointment["id"]: appointment for appointment in affected}
+        for appointment in cancelled + moved:
+            index.remove(originals[appointment["id"]])
+        for appointment in moved:
+            index.add(appointment)
+        _mark_availability_current(before)
+        for position, (time, series) in enumerate(occurrences):
+            original = series.original(time)
+            new_time = series_targets[position] if position < len(series_targets) else None
+            if new_time is not None and book.move(
+                    series.id, original, new_time, check=lambda: _series_slot_free(series, new_time, index.slot_minutes)):
+                rescheduled.append(series.to_appointment(new_time, schedule))
+            elif book.skip(series.id, original):
+                skipped.append(series.to_appointment(time, schedule))
+    get_reminder_scheduler().schedule_many(moved)
+    cancelled, moved = cancelled + skipped, moved + rescheduled
+    notify_many([(CANCELLATION, a) for a in cancelled] + [(RESCHEDULE, a) for a in moved])
+    logger.info(f"Cleared {doctor_name} from {start_date} to {end_date}: {len(cancelled)} cancelled, {len(moved)} moved")
+    return {"cancelled": cancelled, "moved": moved}
+
+def _offer_to_waitlist(doctor_name: str, time: datetime.datetime):
+    """Offer a freed slot to the best matching waitlisted patient"""
+    if time < _doctor_now(doctor_name) or _current_index().is_booked(doctor_name, time) or _held_by_series(doctor_name, time):
+        return
+    try:
+        get_waitlist().offer_slot(doctor_name, time)
+    except Exception as e:
+        logger.error(f"Error offering freed slot to the waitlist: {e}")
+
+def book_series(name: str, email: Optional[str], doctor_name: str, first_time: datetime.datetime, rule: str,
+                appointment_type: str = "Follow-up") -> AppointmentSeries:
+    """Create a recurring series after checking every occurrence inside the booking horizon.
+
+    Occurrences past the horizon are not checked here; single bookings made
+    later are checked against the series rule instead. Raises ValueError with
+    a message for the user when the series cannot be booked.
+    """
+    schedule = DOCTOR_SCHEDULES.get(doctor_name)
+    if schedule is None:
+        raise ValueError(f"Unknown doctor: {doctor_name}")
+    problem = schedule.validate(first_time)
+    if problem:
+        raise ValueError(problem)
+
+    index = _current_index()
+    horizon_end = schedule.now() + datetime.timedelta(weeks=index.horizon_weeks)
+    candidate = AppointmentSeries(0, name, email, doctor_name, appointment_type, rule, first_time)
+    occurrences = list(candidate.occurrences(first_time, horizon_end))
+    for time in occurrences:
+        if not schedule.covers(time):
+            raise ValueError(f"{doctor_name} is not available on {time.strftime('%A, %B %d, %Y at %I:%M %p')}")
+
+    def check():
+        # Runs inside the series write transaction, which holds the database write lock
+        booked = {
+            slot_bounds(appointment["time"], index.slot_minutes)[0]
+            for appointment in get_appointment_store().list_for_doctor(doctor_name, first_time, horizon_end)
+        }
+        for time in occurrences:
+            if slot_bounds(time, index.slot_minutes)[0] in booked or _held_by_series(doctor_name, time):
+                raise ValueError(f"{doctor_name} is already booked on {time.strftime('%A, %B %d, %Y at %I:%M %p')}")
+
+    with _slot_locks.hold({(doctor_name, time.date()) for time in occurrences}):
+        return get_series_book().add(name, email, doctor_name, first_time, rule, appointment_type, check=check)
+
+def move_series_occurrence(series_id: int, original: datetime.datetime, new_time: datetime.datetime) -> bool:
+    """Move one occurrence of a series unless its doctor is booked at the new time"""
+    book = get_series_book()
+    series = book.get(series_id)
+    if series is None:
+        return False
+    schedule = DOCTOR_SCHEDULES.get(series.doctor_name)
+    if schedule is not None and schedule.validate(new_time):
+        return False
+    index = get_availability_index()
+    with _slot_locks.hold([(series.doctor_name, original.date()), (series.doctor_name, new_time.date())]):
+        if not book.move(series_id, original, new_time,
+                         check=lambda: _series_slot_free(series, new_time, index.slot_minutes)):
+            return False
+    _offer_to_waitlist(series.doctor_name, original)
+    return True
+
+def _series_slot_free(series: AppointmentSeries, time: datetime.datetime, slot_minutes: int) -> bool:
+    """Whether an occurrence of ``series`` may move into the slot at ``time``.
+
+    Passed to ``SeriesBook.move`` as its check, so it runs inside the series
+    write transaction and reads the store and the other series as committed.
+    """
+    start, end = slot_bounds(time, slot_minutes)
+    return (
+        not get_appointment_store().list_for_doctor(series.doctor_name, start, end)
+        and not _held_by_series(series.doctor_name, time, ignore=series.id)
+    )
+
+def skip_series_occurrence(series_id: int, original: datetime.datetime) -> bool:
+    """Drop one occurrence of a series and offer its slot to the waitlist"""
+    book = get_series_book()
+    series = book.get(series_id)
+    if series is None or not book.skip(series_id, original):
+        return False
+    _offer_to_waitlist(series.doctor_name, original)
+    return True
+
+def end_series(series_id: int) -> Optional[AppointmentSeries]:
+    return get_series_book().end(series_id)
+
+def clear_appointments():
+    with _availability_lock:
+        get_appointment_store().clear()
+        get_availability_index()
+
+def find_free_slots(query: str = "", limit: int = 5) -> List[tuple]:
+    """Return the next free (doctor, time) slots, optionally filtered by doctor name or specialty"""
+    query = query.lower().strip()
+    doctor_names = [
+        name for name, info in DOCTOR_SCHEDULES.items()
+        if not query or query in name.lower() or query in info.specialty.lower()
+    ]
+    if not doctor_names:
+        doctor_names = list(DOCTOR_SCHEDULES)
+    return get_availability_index().free_slots(doctor_names, limit=limit)
+
+def format_slot(doctor_name: str, time: datetime.datetime) -> str:
+    return f"{time.strftime('%Y-%m-%d %I:%M %p')} with {doctor_name}"
+
 @tool
 def book_appointment(details: Dict[str, Any]) -> str:
     """
@@ -112,24 +358,13 @@ def get_next_available_appointment(query: str = "") -> str:
     Returns:
         str: List of available appointment slots.
     """
-    current_time = datetime.now()
-    available_slots = []
-    
-   
-    for i in range(5):
-        day = current_time + timedelta(days=i)
-        if day.weekday() < 5: 
-            slots = [
-                f"{day.strftime('%Y-%m-%d')} 09:00 AM",
-                f"{day.strftime('%Y-%m-%d')} 11:00 AM",
-                f"{day.strftime('%Y-%m-%d')} 02:00 PM",
-                f"{day.strftime('%Y-%m-%d')} 04:00 PM"
-            ]
-            available_slots.extend(slots)
-    
+    available_slots = find_free_slots(query)
+    if not available_slots:
+        return "No free appointment slots in the next two weeks."
+
     response = "Available appointment slots:\n\n"
-    for slot in available_slots[:5]:
-        response += f"📅 {slot}\n"
+    for doctor_name, slot in available_slots:
+        response += f"📅 {format_slot(doctor_name, slot)}\n"
     
     return response
 
@@ -150,6 +385,12 @@ def cancel_appointment(details: Dict[str, Any]) -> str:
         if field not in details:
             return f"Missing required field: {field}"
     
+    try:
+        cancelled = release_appointment(int(details["appointment_id"]))
+    except ValueError:
+        return f"Invalid appointment ID: {details['appointment_id']}"
+    if not cancelled:
+        return f"No appointment found with ID {details['appointment_id']}."
     
     return "Appointment cancelled successfully. A confirmation email will be sent shortly."
 
@@ -165,25 +406,10 @@ def get_doctor_availability(query: Dict[str, str]) -> str:
         str: Doctor's availability schedule including days and hours.
     """
     doctor_name = query.get("doctor_name", "")
-    current_time = datetime.now()
-    
+    schedule = DOCTOR_SCHEDULES.get(doctor_name)
     
-    schedules = {
-        "Dr. Smith": ["Monday", "Wednesday", "Friday"],
-        "Dr. Johnson": ["Tuesday", "Thursday"],
-        "Dr. Williams": ["Monday", "Tuesday", "Thursday", "Friday"],
-        "Dr. Brown": ["Wednesday", "Thursday", "Friday"]
-    }
-    
-    hours = {
-        "Dr. Smith": "9:00 AM - 5:00 PM",
-        "Dr. Johnson": "10:00 AM - 4:00 PM",
-        "Dr. Williams": "8:00 AM - 3:00 PM",
-        "Dr. Brown": "9:00 AM - 6:00 PM"
-    }
-    
-    if doctor_name in schedules:
-        return f"Available on: {', '.join(schedules[doctor_name])}\nHours: {hours[doctor_name]}"
+    if schedule:
+        return f"Available on: {schedule.days_display}\nHours: {schedule.hours_display}"
     else:
         return "Doctor not found in schedule"
 
@@ -198,16 +424,9 @@ def get_doctor_list(query: str = "") -> str:
     Returns:
         str: List of doctors and their specialties.
     """
-    doctors = {
-        "Dr. Smith": "General Practice",
-        "Dr. Johnson": "Cardiology",
-        "Dr. Williams": "Dermatology",
-        "Dr. Brown": "Orthopedics"
-    }
-    
     response = "Our Medical Team:\n\n"
-    for doctor, specialty in doctors.items():
-        response += f"👨‍⚕️ {doctor} - {specialty}\n"
+    for doctor, schedule in DOCTOR_SCHEDULES.items():
+        response += f"👨‍⚕️ {doctor} - {schedule.specialty}\n"
     
     return response
 
@@ -222,7 +441,19 @@ def get_appointment_details(appointment_id: str) -> str:
     Returns:
         str: Details of the specified appointment.
     """
-    return f"Appointment details for ID: {appointment_id}"
+    try:
+        appointment = get_appointment_store().get(int(appointment_id))
+    except ValueError:
+        appointment = None
+    if not appointment:
+        return f"No appointment found with ID {appointment_id}."
+    
+    return f"""Appointment details for ID: {appointment_id}
+Patient: {appointment['name']}
+Doctor: {appointment.get('doctor_name', 'Not assigned')}
+Time: {appointment['time'].strftime('%B %d, %Y at %I:%M %p')}
+Location: {appointment.get('location') or 'Main Office'}
+Status: {appointment['status']}"""
 
 @tool
 def reschedule_appointment(old_year: int, old_month: int, old_day: int, old_hour: int, old_minute: int,
@@ -253,46 +484,30 @@ def reschedule_appointment(old_year: int, old_month: int, old_day: int, old_hour
         old_time = datetime.datetime(old_year, old_month, old_day, old_hour, old_minute)
         new_time = datetime.datetime(new_year, new_month, new_day, new_hour, new_minute)
         
-        if 'appointments' not in st.session_state:
-            return "No appointments found to reschedule."
-        
-        
-        appointment_to_reschedule = None
-        for i, appointment in enumerate(st.session_state.appointments):
-            if appointment["time"] == old_time:
-                if not patient_name or appointment["name"].lower() == patient_name.lower():
-                    appointment_to_reschedule = (i, appointment)
-                    break
+        appointment_to_reschedule = get_availability_index().find(old_time, patient_name)
         
         if not appointment_to_reschedule:
             return f"I couldn't find an appointment for {patient_name} at {old_time.strftime('%B %d, %Y at %I:%M %p')}."
         
-        index, appointment = appointment_to_reschedule
-        doctor_name = appointment.get('doctor_name', 'Dr. Smith')
-        doctor_info = DOCTOR_SCHEDULES.get(doctor_name, DOCTOR_SCHEDULES['Dr. Smith'])
-        new_day_name = new_time.strftime("%A")
-        
-        if new_day_name not in doctor_info["available_days"]:
-            return f"{doctor_name} is not available on {new_day_name}. Available days: {', '.join(doctor_info['available_days'])}"
-        
-        if not (doctor_info["hours"]["start"] <= new_hour < doctor_info["hours"]["end"]):
-            return f"{doctor_name} is available from {doctor_info['hours']['start']}:00 to {doctor_info['hours']['end']}:00"
+        appointment = appointment_to_reschedule
+        doctor_name = appointment.get('doctor_name')
+        doctor_info = DOCTOR_SCHEDULES.get(doctor_name)
+        if doctor_info is None:
+            logger.warning(f"Cannot reschedule appointment {appointment.get('id')}: unknown doctor {doctor_name!r}")
+            return f"I can't reschedule this appointment because its doctor ({doctor_name or 'none recorded'}) is not on our schedule. Please contact the office to rebook it."
+        validation_error = doctor_info.validate(new_time)
+        if validation_error:
+            return validation_error
         
        
-        for other_appointment in st.session_state.appointments:
-            if (other_appointment["time"] == new_time and 
-                other_appointment.get("doctor_name") == doctor_name and
-                other_appointment != appointment):
-                return f"Sorry, {doctor_name} already has an appointment at {new_time.strftime('%B %d, %Y at %I:%M %p')}"
-        
-        
         old_time_str = appointment["time"].strftime('%B %d, %Y at %I:%M %p')
-        appointment["time"] = new_time
-        appointment["status"] = "rescheduled"
+        if not move_appointment(appointment, new_time):
+            return f"Sorry, {doctor_name} already has an appointment at {new_time.strftime('%B %d, %Y at %I:%M %p')}"
+        
         
         logger.info(f"Rescheduled appointment for {appointment['name']} from {old_time_str} to {new_time.strftime('%B %d, %Y at %I:%M %p')}")
         
-        return f"✅ Appointment rescheduled successfully!\n\n**Updated Details:**\n• Patient: {appointment['name']}\n• Doctor: {doctor_name}\n• Old Time: {old_time_str}\n• New Time: {new_time.strftime('%B %d, %Y at %I:%M %p')}\n• Location: {doctor_info['location']}\n• Type: {appointment['type']}\n\nYou will receive a new reminder for the updated time."
+        return f"✅ Appointment rescheduled successfully!\n\n**Updated Details:**\n• Patient: {appointment['name']}\n• Doctor: {doctor_name}\n• Old Time: {old_time_str}\n• New Time: {new_time.strftime('%B %d, %Y at %I:%M %p')}\n• Location: {doctor_info.location}\n• Type: {appointment['type']}\n\nYou will receive a new reminder for the updated time."
         
     except ValueError as e:
         logger.error(f"Invalid date/time for rescheduling: {e}")
@@ -2,56 +2,74 @@ import streamlit as st
 import datetime
 from logger import setup_logger
 from email_service import EmailService
+from appointment_store import get_appointment_store
+from notification_coalescer import BOOKING, notify
+from reminder_scheduler import start_reminder_scheduler
+from tools import DOCTOR_SCHEDULES, reserve_appointment, release_appointment, clear_appointments
 
 logger = setup_logger(__name__)
 
 def initialize_session_state():
-    if 'appointments' not in st.session_state:
-        st.session_state.appointments = []
-        logger.debug("Initialized empty appointments list in session state")
-    
     if 'email_service' not in st.session_state:
         st.session_state.email_service = EmailService()
         logger.debug("Initialized email service in session state")
+    start_reminder_scheduler()
 
 def process_appointments():
-    logger.debug(f"Appointments in session state: {st.session_state.appointments}")
-    for appointment in st.session_state.appointments:
+    appointments = get_appointment_store().list_active()
+    logger.debug(f"Appointments in store: {appointments}")
+    for appointment in appointments:
         logger.debug(f"Processing appointment: {appointment}")
         st.write(f"Debug: Processing appointment: {appointment}")
         st.write(
             f"{appointment['name']} - {appointment['type']} on {appointment['time'].strftime('%B %d, %Y at %I:%M %p')}")
 
-    if not st.session_state.appointments:
+    if not appointments:
         st.write("No appointments scheduled.")
-        logger.debug("No appointments found in session state")
+        logger.debug("No appointments found in store")
 
-def add_manual_appointment(person_name, appointment_type, appointment_date, appointment_time, email=None, doctor_name=None, location=None):
+def add_manual_appointment(person_name, appointment_type, appointment_date, appointment_time, email=None, doctor_name=None, location=None) -> bool:
+    schedule = DOCTOR_SCHEDULES.get(doctor_name)
     new_appointment = {
         "name": person_name,
         "type": appointment_type,
         "time": datetime.datetime.combine(appointment_date, appointment_time),
         "email": email,
         "doctor_name": doctor_name,
-        "location": location,
+        "doctor_specialty": schedule.specialty if schedule else None,
+        "location": location or (schedule.location if schedule else None),
         "reminder_sent": False
     }
-    st.session_state.appointments.append(new_appointment)
-    logger.debug(f"Manually added appointment: {new_appointment}")
+    stored = reserve_appointment(new_appointment)
+    if not stored:
+        logger.info(f"Rejected manual booking: {doctor_name} already booked at {new_appointment['time']}")
+        return False
+    logger.debug(f"Manually added appointment: {stored}")
     if email:
-        st.session_state.email_service.send_booking_confirmation(new_appointment)
+        notify(BOOKING, stored)
+    return True
+
+def get_last_booked_appointment():
+    """Return the appointment most recently booked through this session's chat, if any"""
+    appointment_id = st.session_state.get('last_appointment_id')
+    if appointment_id is None:
+        return None
+    return get_appointment_store().get(appointment_id)
 
-def cancel_appointment(appointment_index: int) -> bool:
+def cancel_appointment(appointment_id: int) -> bool:
     
     try:
-        if 'appointments' in st.session_state and 0 <= appointment_index < len(st.session_state.appointments):
-           
-            cancelled_appointment = st.session_state.appointments[appointment_index]
-            st.session_state.appointments.pop(appointment_index)
+        cancelled_appointment = release_appointment(appointment_id)
+        if cancelled_appointment:
             logger.info(f"Cancelled appointment for {cancelled_appointment['name']} with {cancelled_appointment['doctor_name']}")
             
             return True
     except Exception as e:
         logger.error(f"Error cancelling appointment: {e}")
     
-    return False
\ No newline at end of file
+    return False
+
+def clear_all_appointments():
+    """Delete every stored appointment, including other sessions' and other replicas'; offered only with DEBUG=true"""
+    clear_appointments()
+    logger.info("Cleared all appointments")
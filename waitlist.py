@@ -0,0 +1,301 @@
+import datetime
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from logger import setup_logger
+from availability import STANDARD_PRIORITY
+from appointment_store import get_appointment_store
+from schedule_model import get_doctor_schedules
+from email_service import email_service
+from notification_coalescer import get_notification_coalescer
+
+logger = setup_logger(__name__)
+
+WAITING = "waiting"
+OFFERED = "offered"
+WITHDRAWN = "withdrawn"
+EXPIRED = "expired"
+MAX_WINDOW_DAYS = 90
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS waitlist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT,
+    doctor_name TEXT,
+    specialty TEXT,
+    window_start TEXT NOT NULL,
+    window_end TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    offered_doctor TEXT,
+    offered_time TEXT,
+    created_at TEXT NOT NULL,
+    changed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_waitlist_status ON waitlist(status);
+CREATE TABLE IF NOT EXISTS waitlist_meta (version INTEGER NOT NULL);
+INSERT INTO waitlist_meta (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM waitlist_meta);
+"""
+
+# Run after SCHEMA, once an older table has been given its ``changed`` column
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_waitlist_changed ON waitlist(changed);
+"""
+
+
+@dataclass
+class WaitlistEntry:
+    id: int
+    name: str
+    email: Optional[str]
+    window_start: datetime.datetime
+    window_end: datetime.datetime
+    doctor_name: Optional[str] = None
+    specialty: Optional[str] = None
+    priority: int = STANDARD_PRIORITY
+    status: str = WAITING
+    created_at: datetime.datetime = field(default_factory=datetime.datetime.now)
+
+    def rank(self) -> Tuple[int, datetime.datetime, int]:
+        return -self.priority, self.created_at, self.id
+
+    def wants(self, time: datetime.datetime) -> bool:
+        return self.status == WAITING and self.window_start <= time < self.window_end
+
+
+class Waitlist:
+    """Patients waiting for a slot with a doctor, a specialty or anyone.
+
+    Each entry is filed under every day of its window in one bucket per doctor,
+    specialty or "any", so a freed slot only looks at the three buckets for its
+    own doctor and day rather than the whole list. Windows are capped at
+    ``MAX_WINDOW_DAYS``. With a ``path`` the list is kept in a ``waitlist``
+    table next to the appointments. Every write bumps the version in
+    ``waitlist_meta`` and stamps the rows it touched with it, so a refresh
+    costs one lookup when the waitlist is unchanged, however busy the
+    appointment tables are, and otherwise reads only the rows changed since.
+    An offer is only made once a conditional UPDATE has claimed the entry, so
+    two processes can never both offer a slot to the same patient.
+    """
+
+    def __init__(self, schedules: Mapping[str, Any], path: Optional[str] = None):
+        self.schedules = schedules
+        self.path = path
+        self._lock = threading.RLock()
+        self._entries: Dict[int, WaitlistEntry] = {}
+        self._buckets: Dict[Tuple[str, Optional[str], datetime.date], List[int]] = {}
+        self._next_id = 1
+        self._pruned_on: Optional[datetime.date] = None
+        self._conn = None
+        self._version = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            with self._conn:
+                self._conn.executescript(SCHEMA)
+                columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(waitlist)")}
+                if "changed" not in columns:
+                    self._conn.execute("ALTER TABLE waitlist ADD COLUMN changed INTEGER NOT NULL DEFAULT 0")
+                self._conn.executescript(INDEXES)
+            self.refresh()
+            logger.info(f"Loaded {len(self._entries)} waitlist entries")
+
+    def refresh(self):
+        """Apply the waitlist rows written, by any connection, since the last refresh"""
+        if self._conn is None:
+            return
+        with self._lock:
+            version = self._conn.execute("SELECT version FROM waitlist_meta").fetchone()[0]
+            if version == self._version:
+                return
+            if self._version is None:
+                self._load()
+            else:
+                rows = self._conn.execute("SELECT * FROM waitlist WHERE changed > ?", (self._version,)).fetchall()
+                for row in rows:
+                    entry = self._entries.get(row["id"])
+                    if row["status"] == WAITING and entry is None:
+                        self._index(self._entry(row))
+                    elif row["status"] != WAITING and entry is not None:
+                        entry.status = row["status"]
+                        self._unindex(entry)
+            # Rows stamped after ``version`` was read are seen again next time, which is harmless
+            self._version = version
+
+    def _load(self):
+        self._entries, self._buckets = {}, {}
+        for row in self._conn.execute("SELECT * FROM waitlist WHERE status = ?", (WAITING,)).fetchall():
+            self._index(self._entry(row))
+
+    @staticmethod
+    def _entry(row: sqlite3.Row) -> WaitlistEntry:
+        return WaitlistEntry(
+            id=row["id"],
+            name=row["name"],
+            email=row["email"],
+            window_start=datetime.datetime.fromisoformat(row["window_start"]),
+            window_end=datetime.datetime.fromisoformat(row["window_end"]),
+            doctor_name=row["doctor_name"],
+            specialty=row["specialty"],
+            priority=row["priority"],
+            created_at=datetime.datetime.fromisoformat(row["created_at"]),
+        )
+
+    def _bump(self) -> int:
+        """Advance the waitlist version inside the caller's transaction and return it"""
+        self._conn.execute("UPDATE waitlist_meta SET version = version + 1")
+        return self._conn.execute("SELECT version FROM waitlist_meta").fetchone()[0]
+
+    def _bucket_keys(self, entry: WaitlistEntry):
+        if entry.doctor_name:
+            kind, value = "doctor", entry.doctor_name
+        elif entry.specialty:
+            kind, value = "specialty", entry.specialty.lower()
+        else:
+            kind, value = "any", None
+        day = entry.window_start.date()
+        while datetime.datetime.combine(day, datetime.time()) < entry.window_end:
+            yield kind, value, day
+            day += datetime.timedelta(days=1)
+
+    def _index(self, entry: WaitlistEntry):
+        self._entries[entry.id] = entry
+        self._next_id = max(self._next_id, entry.id + 1)
+        for key in self._bucket_keys(entry):
+            self._buckets.setdefault(key, []).append(entry.id)
+
+    def _unindex(self, entry: WaitlistEntry):
+        self._entries.pop(entry.id, None)
+        for key in self._bucket_keys(entry):
+            bucket = self._buckets.get(key)
+            if bucket and entry.id in bucket:
+                bucket.remove(entry.id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def add(self, name: str, email: Optional[str], window_start: datetime.datetime, window_end: datetime.datetime,
+            doctor_name: Optional[str] = None, specialty: Optional[str] = None,
+            priority: int = STANDARD_PRIORITY) -> WaitlistEntry:
+        if doctor_name and doctor_name not in self.schedules:
+            raise ValueError(f"Unknown doctor: {doctor_name}")
+        if window_end <= window_start:
+            raise ValueError("The waitlist window must end after it starts")
+        window_end = min(window_end, window_start + datetime.timedelta(days=MAX_WINDOW_DAYS))
+
+        with self._lock:
+            entry = WaitlistEntry(
+                id=self._next_id, name=name, email=email, window_start=window_start, window_end=window_end,
+                doctor_name=doctor_name, specialty=specialty, priority=priority
+            )
+            if self._conn is not None:
+                with self._conn:
+                    cursor = self._conn.execute(
+                        "INSERT INTO waitlist (name, email, doctor_name, specialty, window_start, window_end, priority, status, created_at, changed) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (name, email, doctor_name, specialty, window_start.isoformat(), window_end.isoformat(),
+                         priority, WAITING, entry.created_at.isoformat(), self._bump())
+                    )
+                entry.id = cursor.lastrowid
+            self._index(entry)
+        logger.info(f"Added {name} to the waitlist for {doctor_name or specialty or 'any doctor'}")
+        return entry
+
+    def _set_status(self, entry: WaitlistEntry, status: str):
+        # Only a still-waiting row changes, so an offer made by another process is never overwritten
+        entry.status = status
+        self._unindex(entry)
+        if self._conn is not None:
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE waitlist SET status = ?, changed = ? WHERE id = ? AND status = ?",
+                    (status, self._bump(), entry.id, WAITING)
+                )
+
+    def _claim(self, entry: WaitlistEntry, doctor_name: str, time: datetime.datetime) -> bool:
+        """Mark an entry offered unless another process got to it first; either way it leaves the buckets"""
+        self._unindex(entry)
+        if self._conn is not None:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "UPDATE waitlist SET status = ?, offered_doctor = ?, offered_time = ?, changed = ? "
+                    "WHERE id = ? AND status = ?",
+                    (OFFERED, doctor_name, time.isoformat(), self._bump(), entry.id, WAITING)
+                )
+            if cursor.rowcount == 0:
+                return False
+        entry.status = OFFERED
+        return True
+
+    def withdraw(self, entry_id: int) -> bool:
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return False
+            self._set_status(entry, WITHDRAWN)
+            return True
+
+    def waiting(self) -> List[WaitlistEntry]:
+        with self._lock:
+            self.refresh()
+            return sorted(self._entries.values(), key=WaitlistEntry.rank)
+
+    def match(self, doctor_name: str, time: datetime.datetime) -> Optional[WaitlistEntry]:
+        """Return the highest-priority, longest-waiting entry that wants this slot"""
+        schedule = self.schedules.get(doctor_name)
+        specialty = schedule.specialty.lower() if schedule else None
+        day = time.date()
+        best = None
+        with self._lock:
+            for key in (("doctor", doctor_name, day), ("specialty", specialty, day), ("any", None, day)):
+                for entry_id in self._buckets.get(key, ()):
+                    entry = self._entries[entry_id]
+                    if entry.wants(time) and (best is None or entry.rank() < best.rank()):
+                        best = entry
+        return best
+
+    def offer_slot(self, doctor_name: str, time: datetime.datetime) -> Optional[WaitlistEntry]:
+        """Offer a freed slot to the best waiting patient, if any"""
+        with self._lock:
+            self.refresh()
+            if self._pruned_on != datetime.date.today():
+                self.prune()
+            while True:
+                entry = self.match(doctor_name, time)
+                if entry is None:
+                    return None
+                if self._claim(entry, doctor_name, time):
+                    break
+        logger.info(f"Offered {doctor_name} at {time} to waitlisted patient {entry.name}")
+        if entry.email:
+            schedule = self.schedules.get(doctor_name)
+            offer = email_service.compose_waitlist_offer(entry, doctor_name, time, schedule.location if schedule else None)
+            get_notification_coalescer().notify_message(entry.email, *offer)
+        return entry
+
+    def prune(self, before: Optional[datetime.date] = None):
+        """Drop buckets for days that have passed and entries whose window has closed"""
+        before = before or datetime.date.today()
+        with self._lock:
+            for key in [key for key in self._buckets if key[2] < before]:
+                del self._buckets[key]
+            cutoff = datetime.datetime.combine(before, datetime.time())
+            for entry in [entry for entry in self._entries.values() if entry.window_end <= cutoff]:
+                self._set_status(entry, EXPIRED)
+            self._pruned_on = before
+
+
+_waitlist: Optional[Waitlist] = None
+_waitlist_lock = threading.Lock()
+
+
+def get_waitlist() -> Waitlist:
+    """Return the process-wide waitlist, stored alongside SQLite appointments when that backend is used"""
+    global _waitlist
+    if _waitlist is None:
+        with _waitlist_lock:
+            if _waitlist is None:
+                store = get_appointment_store()
+                _waitlist = Waitlist(get_doctor_schedules(), getattr(store, "path", None))
+    return _waitlist